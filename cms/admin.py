@@ -8,42 +8,121 @@ from djcelery.models import (
     TaskState, WorkerState, PeriodicTask, IntervalSchedule, CrontabSchedule)
 
 from django.conf import settings
+from django.conf.urls import patterns, url
 from django.contrib import admin
 from django.contrib.admin import SimpleListFilter
-from django.contrib.admin.util import unquote
+from django.contrib.admin.util import (
+    display_for_field, flatten_fieldsets, unquote)
+from django.contrib.admin.views.main import ORDER_VAR
 from django.contrib.auth.decorators import login_required
-from django.contrib.admin import helpers
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
+from django.db.models import Count
 from django.http import Http404, HttpResponse
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from django.utils.html import escape
+from django.utils.text import capfirst
+
+from taggit.models import TaggedItem
 
 from cms.models import (
-    Post, Category, Localisation, ContentRepository, PublishingTarget)
+    Post, Category, Localisation, ContentRepository, PublishingTarget,
+    PendingChange, PushStatus, ADMIN_FILTER_CACHE_KEY, ADMIN_SOURCE_CACHE_KEY,
+    get_admin_filters_version)
 from cms.forms import PostForm, CategoryForm
-from cms import tasks
-
-from elasticgit import EG
+from cms.widgets import AutocompleteSelect, AutocompleteSelectMultiple
+from cms import indexing, metrics, search, utils
+from cms.workspaces import get_workspace
 
 
 if not settings.DISABLE_CAS:
     admin.site.login = login_required(admin.site.login)
 
 
-class CategoriesListFilter(SimpleListFilter):
+class CachedListFilter(SimpleListFilter):
+    """
+    A list filter whose options are deduplicated, scoped to the selected
+    localisation & cached until the content changes. Filters with more
+    than ``settings.ADMIN_FILTER_AUTOCOMPLETE_THRESHOLD`` options are
+    rendered as an autocomplete input instead of a list of links.
+    """
+    value_field = 'slug'
+    label_field = 'title'
+    autocomplete_template = 'cms/admin/autocomplete_filter.html'
+
+    def get_options(self, localisation_id):
+        """
+        Return a values list queryset of the ``(value, label)`` options,
+        ordered by label.
+        """
+        raise NotImplementedError('Subclasses should implement this.')
+
+    def get_localisation_id(self, request):
+        value = request.GET.get('localisation__id__exact') if request else None
+        return int(value) if value and value.isdigit() else None
+
+    def lookups(self, request, model_admin):
+        self.localisation_id = self.get_localisation_id(request)
+        threshold = getattr(
+            settings, 'ADMIN_FILTER_AUTOCOMPLETE_THRESHOLD', 100)
+        # NOTE: filters of different models can share a parameter name.
+        key = ADMIN_FILTER_CACHE_KEY % (
+            self.__class__.__name__, self.parameter_name, self.localisation_id,
+            get_admin_filters_version())
+        options = cache.get(key)
+        if options is None:
+            options = list(
+                self.get_options(self.localisation_id)[:threshold + 1])
+            cache.set(key, options, getattr(
+                settings, 'ADMIN_FILTER_CACHE_TIMEOUT', 300))
+
+        self.autocomplete = len(options) > threshold
+        if not self.autocomplete:
+            return options
+
+        self.template = self.autocomplete_template
+        opts = model_admin.model._meta
+        self.autocomplete_url = reverse(
+            'admin:%s_%s_filter_options' % (opts.app_label, opts.model_name),
+            args=[self.parameter_name])
+        # NOTE: only the selected option is listed, others are searched.
+        if self.value() is None:
+            return []
+        return self.get_options(self.localisation_id).filter(
+            **{self.value_field: self.value()})[:1]
+
+    def has_output(self):
+        return self.autocomplete or super(CachedListFilter, self).has_output()
+
+    def choices(self, cl):
+        self.query_string = cl.get_query_string({}, [self.parameter_name])
+        return super(CachedListFilter, self).choices(cl)
+
+    def search(self, term, limit=20):
+        """
+        Return the first ``limit`` options whose label contains ``term``.
+        """
+        return self.get_options(self.localisation_id).filter(
+            **{'%s__icontains' % (self.label_field,): term})[:limit]
+
+
+class CategoriesListFilter(CachedListFilter):
     title = "categories"
     parameter_name = "category_slug"
 
-    def lookups(self, request, model_admin):
+    def get_options(self, localisation_id):
         """
-        Returns a list of tuples. The first element in each
-        tuple is the coded value for the option that will
-        appear in the URL query. The second element is the
-        human-readable name for the option that will appear
-        in the right sidebar.
+        Returns the slugs & titles of the categories in the selected
+        localisation, or of all categories if none is selected.
         """
-        return Category.objects.values_list('slug', 'title')
+        categories = Category.objects.all()
+        if localisation_id is not None:
+            categories = categories.filter(localisation_id=localisation_id)
+        return categories.order_by('title', 'slug').values_list(
+            'slug', 'title').distinct()
 
     def queryset(self, request, queryset):
         """
@@ -53,33 +132,117 @@ class CategoriesListFilter(SimpleListFilter):
             return queryset.filter(primary_category__slug=self.value())
 
 
-class PostSourceListFilter(SimpleListFilter):
+class PostSourceListFilter(CachedListFilter):
     title = "sources"
     parameter_name = "source_slug"
 
-    def lookups(self, request, model_admin):
-        return Post.objects.filter(
-            post__isnull=False).values_list('slug', 'title')
+    def get_options(self, localisation_id):
+        if localisation_id is None:
+            posts = Post.objects.filter(post__isnull=False)
+        else:
+            posts = Post.objects.filter(post__localisation_id=localisation_id)
+        return posts.order_by('title', 'slug').values_list(
+            'slug', 'title').distinct()
 
     def queryset(self, request, queryset):
         if self.value():
             return queryset.filter(source__slug=self.value())
 
 
-class CategorySourceListFilter(SimpleListFilter):
+class CategorySourceListFilter(CachedListFilter):
     title = "sources"
     parameter_name = "source_slug"
 
-    def lookups(self, request, model_admin):
-        return Category.objects.filter(
-            category__isnull=False).distinct().values_list('slug', 'title')
+    def get_options(self, localisation_id):
+        if localisation_id is None:
+            categories = Category.objects.filter(category__isnull=False)
+        else:
+            categories = Category.objects.filter(
+                category__localisation_id=localisation_id)
+        return categories.order_by('title', 'slug').values_list(
+            'slug', 'title').distinct()
 
     def queryset(self, request, queryset):
         if self.value():
             return queryset.filter(source__slug=self.value())
 
 
+class AuthorTagsListFilter(CachedListFilter):
+    title = "author tags"
+    parameter_name = "author_tags__id__exact"
+    value_field = 'tag_id'
+    label_field = 'tag__name'
+
+    def get_options(self, localisation_id):
+        items = TaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Post))
+        if localisation_id is not None:
+            items = items.filter(object_id__in=Post.objects.filter(
+                localisation_id=localisation_id).values('pk'))
+        return items.order_by('tag__name', 'tag_id').values_list(
+            'tag_id', 'tag__name').distinct()
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(author_tags__id=self.value())
+
+
+class FilterOptionsMixin(object):
+    """
+    Serves the options of a model admin's autocompleted list filters.
+    """
+
+    def get_urls(self):
+        opts = self.model._meta
+        return patterns(
+            '',
+            url(r'^filters/(?P<parameter_name>[\w]+)/$',
+                self.admin_site.admin_view(self.filter_options_view),
+                name='%s_%s_filter_options' % (
+                    opts.app_label, opts.model_name)),
+        ) + super(FilterOptionsMixin, self).get_urls()
+
+    def filter_options_view(self, request, parameter_name):
+        for list_filter in self.list_filter:
+            if (isinstance(list_filter, type) and
+                    issubclass(list_filter, CachedListFilter) and
+                    list_filter.parameter_name == parameter_name):
+                break
+        else:
+            raise Http404('Unknown filter %r.' % (parameter_name,))
+
+        spec = list_filter(request, {}, self.model, self)
+        options = spec.search(request.GET.get('term', ''))
+        return HttpResponse(
+            json.dumps([
+                {'value': value, 'label': label}
+                for value, label in options]),
+            content_type='application/json')
+
+
 class TranslatableModelAdmin(admin.ModelAdmin):
+    """
+    Shows a translation's source beside it. The source is rendered read
+    only by a separate view the change form loads it from, it's cached
+    until the source is modified.
+    """
+    source_template = 'cms/admin/source_form.html'
+
+    def get_urls(self):
+        opts = self.model._meta
+        return patterns(
+            '',
+            url(r'^(?P<object_id>\d+)/source/$',
+                self.admin_site.admin_view(self.source_view),
+                name='%s_%s_source' % (opts.app_label, opts.model_name)),
+        ) + super(TranslatableModelAdmin, self).get_urls()
+
+    def get_source_url(self, obj):
+        opts = self.model._meta
+        return reverse(
+            '%s:%s_%s_source' % (
+                self.admin_site.name, opts.app_label, opts.model_name),
+            kwargs={'object_id': obj.pk})
 
     def add_view(self, request, form_url='', extra_context=None):
         object_id = request.GET.get('source', '')
@@ -87,13 +250,7 @@ class TranslatableModelAdmin(admin.ModelAdmin):
         obj = self.get_object(request, unquote(object_id))
 
         if obj is not None:
-            ModelForm = self.get_form(request, obj)
-            form = ModelForm(instance=obj)
-            extra_context['sourceform'] = helpers.AdminForm(
-                form, self.get_fieldsets(request, obj),
-                self.get_prepopulated_fields(request, obj),
-                self.get_readonly_fields(request, obj),
-                model_admin=self)
+            extra_context['source_url'] = self.get_source_url(obj)
         return super(TranslatableModelAdmin, self).add_view(
             request, form_url, extra_context)
 
@@ -109,19 +266,57 @@ class TranslatableModelAdmin(admin.ModelAdmin):
                 'Post object with primary key %(key)r does not exist.' %
                 {'key': escape(object_id)})
 
-        if obj.source:
-            ModelForm = self.get_form(request, obj.source)
-            form = ModelForm(instance=obj.source)
-            extra_context['sourceform'] = helpers.AdminForm(
-                form, self.get_fieldsets(request, obj.source),
-                self.get_prepopulated_fields(request, obj.source),
-                self.get_readonly_fields(request, obj.source),
-                model_admin=self)
+        if obj.source_id:
+            extra_context['source_url'] = self.get_source_url(obj.source)
         return super(TranslatableModelAdmin, self).change_view(
             request, object_id, form_url, extra_context)
 
-
-class PostAdmin(TranslatableModelAdmin):
+    def get_source_fieldsets(self, request, obj):
+        """
+        Return the object's fieldsets as ``(name, classes, fields)``
+        tuples, fields being ``(label, value)`` tuples.
+        """
+        fieldsets = []
+        for name, options in self.get_fieldsets(request, obj):
+            fields = []
+            for field_name in flatten_fieldsets([(name, options)]):
+                field = obj._meta.get_field(field_name)
+                if field in obj._meta.many_to_many:
+                    value = ', '.join(
+                        unicode(related)
+                        for related in getattr(obj, field.name).all())
+                elif field.rel:
+                    value = getattr(obj, field.name) or ''
+                else:
+                    value = display_for_field(
+                        getattr(obj, field.name), field)
+                fields.append((capfirst(field.verbose_name), value))
+            fieldsets.append(
+                (name, ' '.join(options.get('classes', ())), fields))
+        return fieldsets
+
+    def source_view(self, request, object_id):
+        obj = self.get_object(request, unquote(object_id))
+        if not self.has_change_permission(request, obj):
+            raise PermissionDenied
+        if obj is None:
+            raise Http404
+
+        opts = self.model._meta
+        key = ADMIN_SOURCE_CACHE_KEY % (
+            opts.model_name, obj.pk, obj.modified_at.isoformat())
+        content = cache.get(key)
+        if content is None:
+            content = render_to_string(self.source_template, {
+                'original': obj,
+                'fieldsets': self.get_source_fieldsets(request, obj),
+            })
+            cache.set(key, content, getattr(
+                settings, 'ADMIN_SOURCE_CACHE_TIMEOUT', 3600))
+        return HttpResponse(content)
+
+
+class PostAdmin(FilterOptionsMixin, TranslatableModelAdmin):
     form = PostForm
 
     list_display = (
@@ -133,7 +328,7 @@ class PostAdmin(TranslatableModelAdmin):
         'featured',
         'created_at',
         'localisation',
-        'author_tags',
+        AuthorTagsListFilter,
         CategoriesListFilter,
         PostSourceListFilter,
     )
@@ -177,10 +372,126 @@ class PostAdmin(TranslatableModelAdmin):
             '/media/js/jquery-ui.min.js',
         )
 
+    def get_queryset(self, request):
+        return super(PostAdmin, self).get_queryset(request).select_related(
+            'primary_category__localisation', 'localisation',
+            'source').annotate(derivative_count=Count('post', distinct=True))
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Search the pages index instead of scanning the posts' content in
+        the database, unless the index is stale.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        locale = None
+        localisation_id = request.GET.get('localisation__id__exact')
+        if localisation_id:
+            localisation = Localisation.objects.filter(
+                pk=localisation_id).first()
+            locale = localisation.get_code() if localisation else None
+
+        uuids = search.search_pages(search_term, locale=locale)
+        if uuids is None:
+            return super(PostAdmin, self).get_search_results(
+                request, queryset, search_term)
+
+        queryset = queryset.filter(uuid__in=uuids)
+        if uuids and ORDER_VAR not in request.GET:
+            # NOTE: keep Elasticsearch's relevance ordering unless a
+            #       column has been sorted on.
+            rank = 'CASE %s.uuid %s END' % (
+                Post._meta.db_table,
+                ' '.join(['WHEN %s THEN %s' % ('%s', i)
+                          for i in range(len(uuids))]))
+            queryset = queryset.extra(
+                select={'search_rank': rank}, select_params=uuids,
+                order_by=['search_rank'])
+        return queryset, False
+
     def _derivatives(self, post):
+        if hasattr(post, 'derivative_count'):
+            return post.derivative_count
         return post.post_set.count()
     _derivatives.short_description = 'Derivatives'
     _derivatives.allow_tags = True
+    _derivatives.admin_order_field = 'derivative_count'
+
+    autocomplete_fields = {
+        'primary_category': Category,
+        'related_posts': Post,
+    }
+
+    def get_urls(self):
+        opts = self.model._meta
+        return patterns(
+            '',
+            url(r'^autocomplete/(?P<field_name>[\w]+)/$',
+                self.admin_site.admin_view(self.autocomplete_view),
+                name='%s_%s_autocomplete' % (
+                    opts.app_label, opts.model_name)),
+        ) + super(PostAdmin, self).get_urls()
+
+    def get_autocomplete_url(self, field_name):
+        opts = self.model._meta
+        return reverse(
+            '%s:%s_%s_autocomplete' % (
+                self.admin_site.name, opts.app_label, opts.model_name),
+            kwargs={'field_name': field_name})
+
+    def formfield_for_foreignkey(self, db_field, request=None, **kwargs):
+        if db_field.name in self.autocomplete_fields:
+            kwargs['widget'] = AutocompleteSelect(
+                self.get_autocomplete_url(db_field.name))
+        return super(PostAdmin, self).formfield_for_foreignkey(
+            db_field, request, **kwargs)
+
+    def formfield_for_manytomany(self, db_field, request=None, **kwargs):
+        if db_field.name in self.autocomplete_fields:
+            kwargs['widget'] = AutocompleteSelectMultiple(
+                self.get_autocomplete_url(db_field.name))
+        return super(PostAdmin, self).formfield_for_manytomany(
+            db_field, request, **kwargs)
+
+    def autocomplete_view(self, request, field_name):
+        """
+        Serve a page of the objects matching the typed term, limited to
+        the post's localisation.
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        try:
+            model_class = self.autocomplete_fields[field_name]
+        except KeyError:
+            raise Http404('Unknown field %r.' % (field_name,))
+
+        queryset = model_class.objects.select_related('localisation')
+        localisation_id = request.GET.get('localisation')
+        if localisation_id and localisation_id.isdigit():
+            queryset = queryset.filter(localisation__pk=int(localisation_id))
+        term = request.GET.get('term', '').strip()
+        if term:
+            queryset = queryset.filter(title__icontains=term)
+
+        page_size = getattr(settings, 'ADMIN_AUTOCOMPLETE_PAGE_SIZE', 20)
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        offset = (page - 1) * page_size
+        # NOTE: fetch one more than needed to know if there's a next page
+        objects = list(
+            queryset.order_by('title', 'pk')[offset:offset + page_size + 1])
+        return HttpResponse(
+            json.dumps({
+                'results': [
+                    {'id': obj.pk, 'text': unicode(obj)}
+                    for obj in objects[:page_size]],
+                'more': len(objects) > page_size,
+            }),
+            content_type='application/json')
 
     def save_model(self, request, obj, form, change):
         if not obj.owner:
@@ -205,7 +516,7 @@ class PostInline(admin.StackedInline):
     readonly_fields = ('title', )
 
 
-class CategoryAdmin(TranslatableModelAdmin):
+class CategoryAdmin(FilterOptionsMixin, TranslatableModelAdmin):
     form = CategoryForm
 
     list_filter = ('localisation', CategorySourceListFilter)
@@ -226,10 +537,19 @@ class CategoryAdmin(TranslatableModelAdmin):
     )
     inlines = (PostInline, )
 
+    def get_queryset(self, request):
+        return super(CategoryAdmin, self).get_queryset(
+            request).select_related(
+            'localisation', 'source__localisation').annotate(
+            derivative_count=Count('category', distinct=True))
+
     def _derivatives(self, category):
+        if hasattr(category, 'derivative_count'):
+            return category.derivative_count
         return category.category_set.count()
     _derivatives.short_description = 'Derivatives'
     _derivatives.allow_tags = True
+    _derivatives.admin_order_field = 'derivative_count'
 
     def save_model(self, request, obj, form, change):
         obj.last_author = request.user
@@ -284,14 +604,18 @@ class PublishingTargetAdmin(admin.ModelAdmin):
 
 @admin.site.register_view('github/', 'Github Configuration')
 def my_view(request, *args, **kwargs):
-    workspace = EG.workspace(settings.GIT_REPO_PATH,
-                             index_prefix=settings.ELASTIC_GIT_INDEX_PREFIX,
-                             es={'urls': [settings.ELASTICSEARCH_HOST]})
+    workspace = get_workspace()
     commits = workspace.repo.iter_commits(max_count=10)
 
     context = {
         'github_url': settings.GIT_REPO_URL,
         'repo': workspace.repo,
+        'pending_changes': PendingChange.status(),
+        'index_lag': indexing.index_lag(workspace),
+        'index_ready_wait': metrics.get('index_ready_wait.last'),
+        'unchanged_saves': metrics.get('content_batch.unchanged', 0),
+        'push_status': PushStatus.objects.filter(
+            repo_path=workspace.working_dir).first(),
         'commits': [
             {
                 'message': c.message,
@@ -306,9 +630,9 @@ def my_view(request, *args, **kwargs):
 
 @admin.site.register_view('github/push/', 'Push to github')
 def push_to_github(request, *args, **kwargs):
-    tasks.push_to_git.delay(settings.GIT_REPO_PATH,
-                            settings.ELASTIC_GIT_INDEX_PREFIX,
-                            settings.ELASTICSEARCH_HOST)
+    utils.schedule_push(settings.GIT_REPO_PATH,
+                        settings.ELASTIC_GIT_INDEX_PREFIX,
+                        settings.ELASTICSEARCH_HOST)
     if request.is_ajax():
         return HttpResponse(
             json.dumps({'success': True}),
@@ -316,6 +640,16 @@ def push_to_github(request, *args, **kwargs):
     return redirect(reverse('admin:index'))
 
 
+@admin.site.register_view('github/requeue/', 'Retry failed changes')
+def requeue_failed_changes(request, *args, **kwargs):
+    requeued = PendingChange.requeue_failed()
+    if request.is_ajax():
+        return HttpResponse(
+            json.dumps({'success': True, 'requeued': requeued}),
+            mimetype='application/json')
+    return redirect(reverse('admin:index'))
+
+
 @admin.site.register_view('github/import/choose/', 'Import')
 def import_from_github(request, *args, **kwargs):
     return render(request, 'cms/admin/import.html', {})
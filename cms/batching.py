@@ -0,0 +1,369 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import get_model
+
+from git import Actor
+
+from unidecode import unidecode
+
+from cms import indexing, metrics
+from cms.serializers import SERIALIZERS
+from cms.workspaces import get_workspace
+
+
+log = logging.getLogger(__name__)
+
+SAVE = 'save'
+DELETE = 'delete'
+
+_state = threading.local()
+
+
+class ContentBatch(object):
+    """
+    A unit of work writing a set of pending content changes to the
+    content repository as a single commit, the committed objects are
+    then indexed in bulk by the background indexer.
+
+    Changes are coalesced per object, the last recorded operation wins.
+    Saves are serialized from the database when the batch is flushed so
+    that many-to-many & tag changes made after the ``post_save`` signal
+    are picked up as well. Saves that leave an object's content as it
+    is stored are skipped, they're counted by the
+    ``content_batch.unchanged`` metric.
+    """
+
+    def __init__(self):
+        self.changes = OrderedDict()
+
+    def __len__(self):
+        return len(self.changes)
+
+    def add(self, change):
+        """
+        :param cms.models.PendingChange change:
+        """
+        key = (change.model_name, change.object_pk)
+        self.changes.pop(key, None)
+        self.changes[key] = change
+
+    def discard(self):
+        self.changes.clear()
+
+    def load_saved(self):
+        saved = []
+        for change in self.changes.values():
+            if change.operation != SAVE:
+                continue
+            model_class = get_model(*change.model_name.split('.'))
+            try:
+                instance = model_class.objects.get(pk=change.object_pk)
+            except model_class.DoesNotExist:
+                continue
+            serializer = SERIALIZERS[change.model_name]
+            # NOTE: uuids are assigned up front so that objects created in
+            #       this batch can reference each other.
+            if serializer.has_uuid and not instance.uuid:
+                instance.uuid = uuid4().hex
+                model_class.objects.filter(
+                    pk=instance.pk).update(uuid=instance.uuid)
+            saved.append((serializer, instance))
+        return saved
+
+    def load_deleted(self):
+        return [
+            (SERIALIZERS[change.model_name], change)
+            for change in self.changes.values()
+            if change.operation == DELETE]
+
+    def flush(self, workspace=None, refresh=None):
+        """
+        Write all changes to the content repository as a single commit
+        and hand the committed objects over to the background indexer.
+
+        :param elasticgit.workspace.Workspace workspace:
+            The workspace to write to, defaults to the pooled workspace
+            for the configured content repository.
+        :param str refresh:
+            The index refresh policy, see :py:func:`cms.indexing.bulk_index`
+        :returns: the commit or ``None`` if there was nothing to write.
+        """
+        from cms.models import get_author_info
+
+        if not self.changes:
+            return None
+
+        workspace = workspace or get_workspace()
+        saved, deleted = self.load_saved(), self.load_deleted()
+        self.discard()
+
+        messages = []
+        authors = []
+        stored, removed = [], []
+        unchanged = 0
+
+        try:
+            for serializer, instance in saved:
+                original = serializer.lookup(
+                    workspace, serializer.get_key(instance))
+                data = serializer.to_data(instance)
+                if original is None:
+                    obj = serializer.eg_model_class(data)
+                    action = 'created'
+                else:
+                    obj = original.update(data)
+                    if serializer.is_unchanged(original, obj):
+                        unchanged += 1
+                        continue
+                    action = 'updated'
+                stored.append(obj)
+                self.write(workspace, obj)
+                messages.append('%s %s: %s' % (
+                    serializer.label, action, serializer.describe(instance)))
+                authors.append(
+                    get_author_info(serializer.get_author(instance)))
+
+            for serializer, change in deleted:
+                original = serializer.lookup(workspace, change.key)
+                if original is None:
+                    log.warning(
+                        '%s not found in the content repository: %s' % (
+                            serializer.label, change.key))
+                    continue
+                removed.append(original)
+                messages.append('%s deleted: %s' % (
+                    serializer.label, change.description))
+                # FIXME: We're attributing the delete to the person who last
+                #        updated the content, which is complete incorrect.
+                #
+                #        We need a better abstraction for this.
+                authors.append(get_author_info(change.author))
+
+            if unchanged:
+                metrics.incr('content_batch.unchanged', unchanged)
+            if not messages:
+                return None
+
+            commit = self.commit(workspace, stored, removed, messages, authors)
+        except Exception:
+            self.rollback(workspace, stored + removed)
+            raise
+
+        indexing.schedule(workspace, commit, stored, removed, refresh=refresh)
+        return commit
+
+    def rollback(self, workspace, objs):
+        """
+        Restore the files of the objects a failed flush was writing or
+        removing to their committed state, so that they aren't picked
+        up by the next commit.
+        """
+        repo = workspace.repo
+        paths = [workspace.sm.git_name(obj) for obj in objs]
+        if not paths or not repo.head.is_valid():
+            return
+        repo.git.reset('--quiet', 'HEAD', '--', *paths)
+        tree = repo.head.commit.tree
+        for path in paths:
+            try:
+                tree[path]
+            except KeyError:
+                file_path = os.path.join(workspace.working_dir, path)
+                if os.path.isfile(file_path):
+                    os.remove(file_path)
+            else:
+                repo.git.checkout('HEAD', '--', path)
+
+    def write(self, workspace, obj):
+        file_path = os.path.join(
+            workspace.working_dir, workspace.sm.git_name(obj))
+        dir_name = os.path.dirname(file_path)
+        if not os.path.isdir(dir_name):
+            os.makedirs(dir_name)
+        with open(file_path, 'w') as fp:
+            fp.write(workspace.sm.serializer.serialize(obj))
+
+    def commit(self, workspace, stored, removed, messages, authors):
+        index = workspace.repo.index
+        if stored:
+            index.add([
+                os.path.join(workspace.working_dir, workspace.sm.git_name(obj))
+                for obj in stored])
+        if removed:
+            index.remove([
+                os.path.join(workspace.working_dir, workspace.sm.git_name(obj))
+                for obj in removed], working_tree=True)
+
+        if len(messages) == 1:
+            [message] = messages
+        else:
+            message = '%s content changes\n\n%s' % (
+                len(messages), '\n'.join(messages))
+        if isinstance(message, unicode):
+            message = unidecode(message)
+
+        author = next((author for author in authors if author), None)
+        actor = Actor(*author) if author else None
+        return index.commit(message, author=actor, committer=actor)
+
+
+def publish_changes(changes):
+    """
+    Write the changes to the content repository as a single commit. If
+    that fails each change is written on its own, so that a bad change
+    can't hold up the others. Failed attempts are recorded on the
+    changes that still fail.
+
+    :param list changes: :py:class:`cms.models.PendingChange` instances.
+    :returns: the changes that were published.
+    """
+    if len(changes) > 1:
+        try:
+            with transaction.atomic():
+                flush_changes(changes)
+            return changes
+        except Exception:
+            log.warning(
+                'Unable to publish %s changes at once, publishing them '
+                'one at a time.' % (len(changes),), exc_info=True)
+
+    published = []
+    for change in changes:
+        try:
+            with transaction.atomic():
+                flush_changes([change])
+        except Exception as e:
+            log.exception('Unable to publish %s.' % (change,))
+            change.mark_failed('%s: %s' % (e.__class__.__name__, e))
+        else:
+            published.append(change)
+    return published
+
+
+def flush_changes(changes):
+    batch = ContentBatch()
+    for change in changes:
+        batch.add(change)
+    return batch.flush()
+
+
+def publish_pending_changes(batch_size=None):
+    """
+    Drain the pending changes outbox, writing each batch of changes as a
+    single commit. Changes that fail to publish are left in the outbox &
+    retried later, see :py:meth:`cms.models.PendingChange.mark_failed`.
+
+    :param int batch_size:
+        The maximum number of changes per commit, defaults to
+        ``settings.PUBLISH_BATCH_SIZE``.
+    :returns: the number of changes drained.
+    """
+    from cms.models import PendingChange
+
+    batch_size = batch_size or getattr(settings, 'PUBLISH_BATCH_SIZE', 500)
+    drained = 0
+    while True:
+        with transaction.atomic():
+            changes = list(
+                PendingChange.due().select_for_update().select_related(
+                    'author').order_by('pk')[:batch_size])
+            if not changes:
+                return drained
+
+            published = publish_changes(changes)
+            PendingChange.objects.filter(
+                pk__in=[change.pk for change in published]).delete()
+            drained += len(changes)
+
+
+def publish(countdown=None):
+    """
+    Schedule the outbox to be drained by a Celery worker.
+    """
+    from cms import tasks
+    tasks.publish_pending_changes.apply_async(countdown=countdown)
+
+
+def publish_after_commit():
+    """
+    Schedule the outbox to be drained once the changes recorded are
+    visible to the Celery workers. Django can't run code after a commit,
+    inside of a transaction the drain is delayed by
+    ``settings.PUBLISH_COMMIT_DELAY`` seconds instead. Changes committed
+    later than that are drained by the periodic
+    ``publish-pending-changes`` task.
+    """
+    if transaction.get_connection().in_atomic_block:
+        return publish(
+            countdown=getattr(settings, 'PUBLISH_COMMIT_DELAY', 5))
+    return publish()
+
+
+class BatchScope(object):
+
+    def __init__(self):
+        self.dirty = False
+
+
+def current_scope():
+    """
+    Return the innermost active batch scope for this thread, or ``None``.
+    """
+    scopes = getattr(_state, 'scopes', [])
+    return scopes[-1] if scopes else None
+
+
+def changed():
+    """
+    Called whenever a pending change has been recorded. Outside of a
+    batch scope the outbox is drained once the change is committed,
+    inside of one it is drained once the outermost scope ends.
+    """
+    scope = current_scope()
+    if scope is None:
+        return publish_after_commit()
+    scope.dirty = True
+
+
+def begin():
+    if not hasattr(_state, 'scopes'):
+        _state.scopes = []
+    scope = current_scope() or BatchScope()
+    _state.scopes.append(scope)
+    return scope
+
+
+def end(flush=True):
+    """
+    Close the innermost batch scope, scheduling the outbox to be drained
+    if it's the outermost one and changes were recorded in it.
+    """
+    scope = _state.scopes.pop()
+    if _state.scopes:
+        return
+    if flush and scope.dirty:
+        publish_after_commit()
+
+
+@contextmanager
+def content_batch():
+    """
+    Collect all content changes made inside the block, which runs in a
+    database transaction, and publish them as a single commit once the
+    transaction has committed. Nothing is published if it rolls back.
+    """
+    scope = begin()
+    try:
+        with transaction.atomic():
+            yield scope
+    except BaseException:
+        end(flush=False)
+        raise
+    end()
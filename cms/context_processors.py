@@ -1,23 +1,36 @@
 from django.conf import settings
-from elasticgit import EG
+from django.core.cache import cache
 
 from cms.models import ContentRepository
+from cms.workspaces import get_workspace
 
 
-def workspace_changes(request):
-    workspace = EG.workspace(settings.GIT_REPO_PATH,
-                             index_prefix=settings.ELASTIC_GIT_INDEX_PREFIX,
-                             es={'urls': [settings.ELASTICSEARCH_HOST]})
+def get_repo_changes(workspace):
+    """
+    Return the number of local commits that haven't been pushed to the
+    remote's master branch yet. The count is cached for the pair of
+    commits it was computed for, any commit or push moves one of them.
+    """
     repo = workspace.repo
-    index = repo.index
-    origin = repo.remote()
-    remote_master = origin.refs.master
+    head_sha = repo.head.commit.hexsha
+    remote_sha = repo.remote().refs.master.commit.hexsha
+    key = 'cms:repo-changes:%s:%s' % (head_sha, remote_sha)
+    changes = cache.get(key)
+    if changes is None:
+        changes = int(repo.git.rev_list(
+            '--count', '%s..%s' % (remote_sha, head_sha)))
+        cache.set(key, changes, getattr(
+            settings, 'REPO_STATUS_CACHE_TIMEOUT', 3600))
+    return changes
+
+
+def workspace_changes(request):
     return {
-        'repo_changes': len(index.diff(remote_master.commit)),
+        'repo_changes': get_repo_changes(get_workspace()),
     }
 
 
 def content_repositories(request):
     return {
-        'content_repositories': ContentRepository.objects.all(),
+        'content_repositories': ContentRepository.get_cached(),
     }
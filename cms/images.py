@@ -0,0 +1,158 @@
+import logging
+import threading
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+from urlparse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from PIL import ImageFile
+
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_session = None
+
+
+def get_session():
+    """
+    Return the process wide HTTP session used to talk to Thumbor servers.
+    Connections are pooled and failed requests are retried with an
+    exponential backoff.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            workers = getattr(settings, 'IMAGE_FETCH_WORKERS', 8)
+            retry = Retry(
+                total=getattr(settings, 'IMAGE_FETCH_RETRIES', 3),
+                backoff_factor=0.5,
+                status_forcelist=[500, 502, 503, 504])
+            adapter = HTTPAdapter(
+                pool_connections=workers, pool_maxsize=workers,
+                max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def fetch_image(host, uuid):
+    """
+    Download an image from a Thumbor server.
+
+    :param str host: The Thumbor server's url.
+    :param str uuid: The image's uuid.
+    :returns:
+        A ``(ContentFile, content type)`` tuple, or ``(None, None)``
+        if the image could not be downloaded.
+    """
+    url = urljoin(host, 'image/%s' % uuid)
+    try:
+        response = get_session().get(
+            url, timeout=getattr(settings, 'IMAGE_FETCH_TIMEOUT', 30))
+    except requests.RequestException:
+        log.warning('Unable to download %s.' % (url,), exc_info=True)
+        return None, None
+    if response.status_code == 200:
+        return (
+            ContentFile(response.content),
+            response.headers['Content-Type'])
+    return None, None
+
+
+def probe_image(host, uuid, chunk_size=1024):
+    """
+    Read the dimensions of an image on a Thumbor server from the start of
+    the image, the rest of it is never downloaded.
+
+    :param str host: The Thumbor server's url.
+    :param str uuid: The image's uuid.
+    :returns:
+        A ``((width, height), content type)`` tuple, or ``(None, None)``
+        if the dimensions could not be read.
+    """
+    url = urljoin(host, 'image/%s' % uuid)
+    try:
+        response = get_session().get(
+            url, stream=True,
+            timeout=getattr(settings, 'IMAGE_FETCH_TIMEOUT', 30))
+    except requests.RequestException:
+        log.warning('Unable to probe %s.' % (url,), exc_info=True)
+        return None, None
+    try:
+        if response.status_code != 200:
+            return None, None
+        parser = ImageFile.Parser()
+        for chunk in response.iter_content(chunk_size):
+            parser.feed(chunk)
+            if parser.image is not None:
+                return parser.image.size, response.headers['Content-Type']
+        return None, None
+    finally:
+        response.close()
+
+
+class ImageFetcher(object):
+    """
+    Downloads images from Thumbor servers concurrently, each image is
+    downloaded only once however often it is referenced.
+
+    :param int workers:
+        The number of concurrent downloads.
+    :param int per_host:
+        The maximum number of concurrent downloads from a single host.
+    """
+
+    def __init__(self, workers=None, per_host=None):
+        self.workers = workers or getattr(settings, 'IMAGE_FETCH_WORKERS', 8)
+        per_host = per_host or getattr(settings, 'IMAGE_FETCH_PER_HOST', 4)
+        self.host_limits = defaultdict(
+            lambda: threading.BoundedSemaphore(per_host))
+        self.lock = threading.Lock()
+
+    def get_host_limit(self, host):
+        with self.lock:
+            return self.host_limits[host]
+
+    def call(self, func, key):
+        host, uuid = key
+        with self.get_host_limit(host):
+            return key, func(host, uuid)
+
+    def map(self, func, keys):
+        """
+        Call ``func(host, uuid)`` for every key concurrently, returning
+        once all calls have finished.
+
+        :param list keys: ``(host, uuid)`` tuples.
+        :returns: A dict mapping each key to its result.
+        """
+        keys = set(keys)
+        if not keys:
+            return {}
+        pool = ThreadPool(min(self.workers, len(keys)))
+        try:
+            return dict(pool.map(lambda key: self.call(func, key), keys))
+        finally:
+            pool.close()
+            pool.join()
+
+    def fetch_all(self, keys):
+        """
+        Download all images, see :py:func:`fetch_image`.
+        """
+        return self.map(fetch_image, keys)
+
+    def probe_all(self, keys):
+        """
+        Read the dimensions of all images, see :py:func:`probe_image`.
+        """
+        return self.map(probe_image, keys)
@@ -0,0 +1,430 @@
+import logging
+import os.path
+import shutil
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from git import GitCommandError, Repo
+from elasticgit import EG
+
+from elasticsearch.exceptions import NotFoundError
+
+from cms import batching, indexing, models
+from cms.management.commands.import_from_git import Command
+from cms.sources import iterate
+from cms.utils import chunked
+from cms.workspaces import get_workspace
+
+from unicore.content.models import (
+    Category, Page, Localisation as EGLocalisation)
+
+
+log = logging.getLogger(__name__)
+
+# NOTE: clones are stored & indexed under this prefix and the repo name.
+CLONE_INDEX_PREFIX = 'import-repo-prefix-'
+
+
+class ImportLimitReached(Exception):
+    pass
+
+
+def clone_repo(url, name):
+    """
+    Return an up to date clone of the repository at ``url``. The clone
+    from a previous import is reused and fast-forwarded if there is one,
+    otherwise a fresh shallow clone of the default branch is made.
+    """
+    repo_path = os.path.join(settings.IMPORT_CLONE_REPO_PATH, name)
+    repo = update_clone(repo_path, url)
+    if repo is None:
+        if os.path.exists(repo_path):
+            shutil.rmtree(repo_path)
+        kwargs = {}
+        if getattr(settings, 'IMPORT_CLONE_SHALLOW', True):
+            kwargs.update({'depth': 1, 'single_branch': True})
+        repo = Repo.clone_from(url, repo_path, **kwargs)
+
+    # NOTE: the clone's mtime records when it was last used.
+    os.utime(repo_path, None)
+    evict_clones(keep=[repo_path])
+    return repo
+
+
+def update_clone(repo_path, url):
+    """
+    Fetch the latest commit of a cached clone's branch and move the
+    clone to it.
+
+    :returns:
+        The clone's ``Repo`` or ``None`` if there's no usable clone
+        of ``url`` at ``repo_path``.
+    """
+    if not EG.is_repo(repo_path):
+        return None
+    repo = Repo(repo_path)
+    try:
+        if repo.remote().url != url:
+            return None
+        args = ['origin', repo.active_branch.name]
+        if getattr(settings, 'IMPORT_CLONE_SHALLOW', True):
+            args.append('--depth=1')
+        repo.git.fetch(*args)
+        # NOTE: clones are read only so this is a fast-forward, unless
+        #       the upstream history was rewritten.
+        repo.head.reset('FETCH_HEAD', index=True, working_tree=True)
+    except (GitCommandError, ValueError):
+        log.warning('Unable to update clone %s.' % (repo_path,), exc_info=True)
+        return None
+    return repo
+
+
+def get_disk_usage(path):
+    usage = 0
+    for dir_path, dir_names, file_names in os.walk(path):
+        for file_name in file_names:
+            usage += os.lstat(os.path.join(dir_path, file_name)).st_size
+    return usage
+
+
+def evict_clones(keep=()):
+    """
+    Remove the least recently used clones & their search indices once
+    the clone cache holds more than ``settings.IMPORT_CLONE_CACHE_SIZE``
+    clones or ``settings.IMPORT_CLONE_CACHE_BYTES`` bytes.
+
+    :param list keep: Paths of clones that must be kept.
+    :returns: The paths of the evicted clones.
+    """
+    root = settings.IMPORT_CLONE_REPO_PATH
+    if not os.path.isdir(root):
+        return []
+
+    max_clones = getattr(settings, 'IMPORT_CLONE_CACHE_SIZE', 10)
+    max_bytes = getattr(settings, 'IMPORT_CLONE_CACHE_BYTES', None)
+    keep = [os.path.abspath(path) for path in keep]
+    paths = sorted(
+        (os.path.abspath(os.path.join(root, name))
+         for name in os.listdir(root)
+         if os.path.isdir(os.path.join(root, name))),
+        key=lambda path: (path in keep, os.path.getmtime(path)),
+        reverse=True)
+
+    kept, used, evicted = 0, 0, []
+    for path in paths:
+        usage = get_disk_usage(path)
+        if path in keep or (
+                kept < max_clones and
+                (max_bytes is None or used + usage <= max_bytes)):
+            kept += 1
+            used += usage
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        evicted.append(path)
+
+    destroy_orphaned_indices()
+    return evicted
+
+
+def get_clone_index_names():
+    """
+    Return the names of the search indices of the cached clones.
+    """
+    root = settings.IMPORT_CLONE_REPO_PATH
+    names = os.listdir(root) if os.path.isdir(root) else []
+    index_names = set()
+    for name in names:
+        if not EG.is_repo(os.path.join(root, name)):
+            continue
+        try:
+            index_names.add(indexing.index_name(get_clone_workspace(name)))
+        except TypeError:
+            # NOTE: a detached head, the clone is replaced when it's used.
+            continue
+    return index_names
+
+
+def destroy_orphaned_indices():
+    """
+    Delete the search indices of clones that are no longer cached.
+    """
+    index_names = get_clone_index_names()
+    es = get_workspace().im.es
+    try:
+        indices = es.indices.get_aliases(index='%s*' % (CLONE_INDEX_PREFIX,))
+    except NotFoundError:
+        return
+    for index, info in indices.items():
+        if not index_names.intersection(
+                [index] + list(info.get('aliases', {}))):
+            es.indices.delete(index=index)
+
+
+def get_clone_workspace(index_prefix):
+    repo_path = os.path.join(settings.IMPORT_CLONE_REPO_PATH, index_prefix)
+    return EG.workspace(
+        repo_path, index_prefix=index_prefix,
+        es={'urls': [settings.ELASTICSEARCH_HOST]})
+
+
+def import_locale_content(workspace, locale):
+    mngmnt_command = Command()
+
+    [l] = iterate(workspace, EGLocalisation, locale=locale)
+    language_code, _, country_code = l.locale.partition('_')
+    localisation, new = models.Localisation.objects.get_or_create(
+        language_code=language_code,
+        country_code=country_code,
+        defaults={
+            'logo_text': l.logo_text,
+            'logo_description': l.logo_description,
+        })
+
+    if new:
+        mngmnt_command.prefetch_images([l], 'image', 'logo_image')
+        mngmnt_command.set_image_field(l, localisation, 'image')
+        mngmnt_command.set_image_field(l, localisation, 'logo_image')
+        if localisation.image or localisation.logo_image:
+            localisation.save()
+
+    # NOTE: content is streamed from Git in batches so that locales of
+    #       any size are imported completely with bounded memory use.
+    categories = iterate(workspace, Category, language=locale)
+    for instance in prefetched(mngmnt_command, categories, 'image'):
+        category, new = get_or_build(
+            models.Category, instance.uuid, {
+                'slug': instance.slug,
+                'title': instance.title,
+                'subtitle': instance.subtitle,
+                'localisation': localisation,
+                'featured_in_navbar': instance.featured_in_navbar or False,
+                'position': instance.position or 0,
+            })
+        save_with_image(mngmnt_command, instance, category, new)
+
+    # NOTE: primary categories are looked up once rather than per page.
+    category_ids = dict(models.Category.objects.exclude(
+        uuid=None).values_list('uuid', 'pk'))
+
+    linked_pages = []
+    pages = iterate(workspace, Page, language=locale)
+    for instance in prefetched(mngmnt_command, pages, 'image'):
+        if instance.linked_pages:
+            linked_pages.append((instance.uuid, instance.linked_pages))
+
+        try:
+            post, new = get_or_build(
+                models.Post, instance.uuid, {
+                    'title': instance.title,
+                    'subtitle': instance.subtitle,
+                    'slug': instance.slug,
+                    'description': instance.description,
+                    'content': instance.content,
+                    'created_at': instance.created_at,
+                    'modified_at': instance.modified_at,
+                    'featured_in_category': (
+                        instance.featured_in_category or False),
+                    'featured': (
+                        instance.featured or False),
+                    'localisation': localisation,
+                    'primary_category_id': category_ids.get(
+                        instance.primary_category),
+                    'position': instance.position or 0
+                })
+            save_with_image(mngmnt_command, instance, post, new)
+            # add the tags
+            post.author_tags.add(*instance.author_tags)
+
+        except ValidationError:  # pragma: no cover
+            log.exception('Unable to import page %s (%s).' % (
+                instance.title, instance.uuid))
+
+    # second pass to add related fields
+    add_related_posts(linked_pages, mngmnt_command.batch_size)
+
+
+def get_or_build(model_class, uuid, defaults):
+    """
+    Like ``get_or_create`` but a new object is returned unsaved, so that
+    it can be completed before its row is written.
+
+    :returns: ``(object, new)``
+    """
+    obj = model_class.objects.filter(uuid=uuid).first()
+    if obj is not None:
+        return obj, False
+    return model_class(uuid=uuid, **defaults), True
+
+
+def save_with_image(mngmnt_command, instance, obj, new):
+    """
+    Set the object's image & save it, existing objects are only saved
+    if their image has changed.
+    """
+    image = obj.image.name
+    mngmnt_command.set_image_field(instance, obj, 'image')
+    if new or obj.image.name != image:
+        obj.save()
+
+
+def add_related_posts(linked_pages, batch_size):
+    """
+    Link the imported pages to their related pages, keeping any links
+    that already exist. The links are inserted in bulk so no signals are
+    sent, changes are recorded for the posts that gained links instead.
+
+    :param list linked_pages: ``(uuid, linked uuids)`` tuples.
+    """
+    uuids = set()
+    for uuid, linked_uuids in linked_pages:
+        uuids.add(uuid)
+        uuids.update(linked_uuids)
+    post_ids = dict(models.Post.objects.filter(
+        uuid__in=uuids).values_list('uuid', 'pk'))
+
+    field = models.Post._meta.get_field('related_posts')
+    through = field.rel.through
+    from_field = '%s_id' % (field.m2m_field_name(),)
+    to_field = '%s_id' % (field.m2m_reverse_field_name(),)
+    sort_field = getattr(field, 'sort_value_field_name', 'sort_value')
+
+    existing = defaultdict(set)
+    for from_id, to_id in through.objects.filter(**{
+            '%s__in' % (from_field,): post_ids.values()}).values_list(
+            from_field, to_field):
+        existing[from_id].add(to_id)
+
+    rows, linked = [], set()
+    for uuid, linked_uuids in linked_pages:
+        from_id = post_ids.get(uuid)
+        if from_id is None:
+            continue
+        related_ids = existing[from_id]
+        for linked_uuid in linked_uuids:
+            to_id = post_ids.get(linked_uuid)
+            if to_id is None or to_id in related_ids:
+                continue
+            rows.append(through(**{
+                from_field: from_id,
+                to_field: to_id,
+                sort_field: len(related_ids),
+            }))
+            related_ids.add(to_id)
+            linked.add(from_id)
+    through.objects.bulk_create(rows, batch_size=batch_size)
+
+    for post in models.Post.objects.filter(
+            pk__in=linked).select_related('last_author'):
+        models.PendingChange.record(batching.SAVE, post)
+
+
+def prefetched(command, instances, *field_names):
+    """
+    Yield the instances in batches, the images of each batch are
+    downloaded before any of its instances are yielded.
+    """
+    for chunk in chunked(instances, command.batch_size):
+        command.prefetch_images(chunk, *field_names)
+        for instance in chunk:
+            yield instance
+
+
+def start_job(job_id):
+    """
+    Mark a pending import job as running. Running jobs that haven't
+    made progress in ``settings.IMPORT_JOB_STALE_TIMEOUT`` seconds, for
+    example because their worker died, are marked as failed first.
+
+    :returns:
+        The job, or ``None`` if it's no longer pending, for example
+        because it was cancelled before it got to run.
+    :raises ImportLimitReached:
+        If ``settings.IMPORT_MAX_CONCURRENT_JOBS`` jobs are running.
+    """
+    limit = getattr(settings, 'IMPORT_MAX_CONCURRENT_JOBS', 2)
+    stale_at = timezone.now() - timedelta(seconds=getattr(
+        settings, 'IMPORT_JOB_STALE_TIMEOUT', 3600))
+    with transaction.atomic():
+        # NOTE: locking all active jobs serializes concurrent starts.
+        active = list(models.ImportJob.objects.select_for_update().filter(
+            status__in=models.ImportJob.ACTIVE_STATUSES))
+        job = next((
+            active_job for active_job in active
+            if active_job.pk == int(job_id)), None)
+        if job is None or job.status != models.ImportJob.PENDING:
+            return None
+        running = [
+            active_job for active_job in active
+            if active_job.status == models.ImportJob.RUNNING]
+        stale = [
+            active_job for active_job in running
+            if active_job.modified_at < stale_at]
+        if stale:
+            log.warning('Failing stale import jobs: %s' % (
+                ', '.join(str(stale_job.pk) for stale_job in stale),))
+            models.ImportJob.objects.filter(
+                pk__in=[stale_job.pk for stale_job in stale]).update(
+                status=models.ImportJob.FAILED,
+                error='The job stopped making progress.',
+                finished_at=timezone.now())
+        if len(running) - len(stale) >= limit:
+            raise ImportLimitReached()
+        job.status = models.ImportJob.RUNNING
+        job.started_at = timezone.now()
+        job.save()
+        return job
+
+
+def fail_pending_job(job_id, error):
+    """
+    Mark an import job that never got to run as failed.
+    """
+    models.ImportJob.objects.filter(
+        pk=job_id, status=models.ImportJob.PENDING).update(
+        status=models.ImportJob.FAILED, error=error,
+        finished_at=timezone.now())
+
+
+def run_job(job):
+    """
+    Run a started import job to completion, recording its outcome.
+    """
+    try:
+        if job.operation == models.ImportJob.CLONE:
+            run_clone_job(job)
+        else:
+            run_import_job(job)
+    except Exception, e:
+        job.finish(models.ImportJob.FAILED, error=unicode(e))
+        raise
+    job.finish(models.ImportJob.DONE)
+
+
+def run_clone_job(job):
+    clone_repo(job.repo_url, job.index_prefix)
+    workspace = get_clone_workspace(job.index_prefix)
+    # NOTE: content is read straight from the clone, it isn't indexed.
+    job.set_locales(l.locale for l in iterate(workspace, EGLocalisation))
+
+
+def run_import_job(job):
+    workspace = get_clone_workspace(job.index_prefix)
+    for locale in job.get_locales():
+        if job.is_cancelled():
+            return
+        # NOTE: each locale is imported in a single transaction, its
+        #       changes are published once it commits in commits of up
+        #       to settings.PUBLISH_BATCH_SIZE changes.
+        with batching.content_batch():
+            import_locale_content(workspace, locale)
+        job.advance()
+    # NOTE: the clone itself is kept in the clone cache for the next
+    #       import from the same repository.
+    branch = workspace.repo.active_branch.name
+    if workspace.im.index_exists(branch):
+        workspace.im.destroy_index(branch)
@@ -0,0 +1,489 @@
+import logging
+import os
+import time
+from datetime import datetime
+
+from django.conf import settings
+
+from elasticgit.utils import fqcn, load_class
+
+from elasticsearch.exceptions import (
+    ConnectionError, NotFoundError, TransportError)
+from elasticsearch.helpers import bulk
+
+from git import GitCommandError
+
+from cms import metrics
+from cms.workspaces import get_workspace
+
+
+log = logging.getLogger(__name__)
+
+REFRESH_NONE = 'none'
+REFRESH_INTERVAL = 'interval'
+REFRESH_WAIT_FOR = 'wait_for'
+REFRESH_POLICIES = (REFRESH_NONE, REFRESH_INTERVAL, REFRESH_WAIT_FOR)
+
+
+class IndexRebuildError(Exception):
+    pass
+
+
+class IndexNotReady(Exception):
+    pass
+
+
+def get_refresh_policy(refresh=None):
+    refresh = refresh or getattr(
+        settings, 'ELASTIC_GIT_REFRESH_POLICY', REFRESH_INTERVAL)
+    if refresh not in REFRESH_POLICIES:
+        raise ValueError('Unknown refresh policy: %r' % (refresh,))
+    return refresh
+
+
+def index_name(workspace):
+    return workspace.im.index_name(workspace.repo.active_branch.name)
+
+
+def wait_for_index(workspace, index=None, timeout=None,
+                   initial_delay=0.05, max_delay=2):
+    """
+    Wait for an index's primary shards to be allocated, checking the
+    cluster's health with an exponential backoff. The time spent waiting
+    is recorded as the ``index_ready_wait`` metric.
+
+    :param elasticgit.workspace.Workspace workspace:
+    :param str index:
+        The index to wait for, defaults to the workspace's index.
+    :param float timeout:
+        Seconds to wait before giving up, defaults to
+        ``settings.ELASTICSEARCH_READY_TIMEOUT``.
+    :raises IndexNotReady: if the index isn't ready in time.
+    """
+    es = workspace.im.es
+    index = index or index_name(workspace)
+    if timeout is None:
+        timeout = getattr(settings, 'ELASTICSEARCH_READY_TIMEOUT', 30)
+    started = time.time()
+    deadline = started + timeout
+    delay = initial_delay
+    while True:
+        try:
+            # NOTE: the cluster waits up to ``delay`` for the index itself.
+            health = es.cluster.health(
+                index=index, wait_for_status='yellow',
+                timeout='%dms' % (delay * 1000,))
+            if not health.get('timed_out'):
+                break
+        except (ConnectionError, TransportError):
+            log.warning('Unable to check the health of %s.' % (index,),
+                        exc_info=True)
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            metrics.timing('index_ready_wait', time.time() - started)
+            raise IndexNotReady(
+                '%s not ready after %s seconds.' % (index, timeout))
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+    metrics.timing('index_ready_wait', time.time() - started)
+
+
+def mapping_type_name(workspace, model_class):
+    return workspace.im.get_mapping_type(
+        model_class).get_mapping_type_name()
+
+
+def iter_actions(workspace, stored, removed):
+    """
+    Generate Elasticsearch bulk actions for the given objects. Stored
+    objects are read from Git when the action is generated so that the
+    latest committed version always wins, even if indexing tasks run
+    out of order.
+
+    :param list stored:
+        ``(model class path, uuid)`` pairs of the objects to index.
+    :param list removed:
+        ``(model class path, uuid)`` pairs of the objects to unindex.
+    """
+    name = index_name(workspace)
+    missing = []
+    for class_path, uuid in stored:
+        model_class = load_class(class_path)
+        try:
+            obj = workspace.sm.get(model_class, uuid)
+        except GitCommandError:
+            # NOTE: deleted since it was committed.
+            missing.append((class_path, uuid))
+            continue
+        yield {
+            '_op_type': 'index',
+            '_index': name,
+            '_type': mapping_type_name(workspace, model_class),
+            '_id': uuid,
+            '_source': dict(obj),
+        }
+
+    for class_path, uuid in list(removed) + missing:
+        yield {
+            '_op_type': 'delete',
+            '_index': name,
+            '_type': mapping_type_name(workspace, load_class(class_path)),
+            '_id': uuid,
+        }
+
+
+def bulk_index(workspace, stored=(), removed=(), commit_sha=None,
+               refresh=None):
+    """
+    Push a set of committed objects to Elasticsearch with the bulk API
+    and record the commit they were committed in as indexed.
+
+    :param elasticgit.workspace.Workspace workspace:
+    :param list stored:
+        ``(model class path, uuid)`` pairs of the objects to index.
+    :param list removed:
+        ``(model class path, uuid)`` pairs of the objects to unindex.
+    :param str commit_sha:
+        The commit the objects were written in.
+    :param str refresh:
+        One of ``none``, ``interval`` or ``wait_for``, defaults to
+        ``settings.ELASTIC_GIT_REFRESH_POLICY``. Only ``wait_for``
+        refreshes the index before returning, the others rely on the
+        index's refresh interval, see :py:func:`apply_refresh_policy`.
+    :returns: the number of successfully executed actions.
+    """
+    success, errors = bulk(
+        workspace.im.es, iter_actions(workspace, stored, removed),
+        raise_on_error=False)
+    for error in errors:
+        # NOTE: unindexing something that isn't in the index is fine.
+        if error.get('delete', {}).get('status') != 404:
+            log.error('Bulk indexing error: %r' % (error,))
+
+    if get_refresh_policy(refresh) == REFRESH_WAIT_FOR:
+        workspace.refresh_index()
+
+    if commit_sha is not None:
+        record_indexed_commit(workspace, commit_sha)
+    return success
+
+
+def record_indexed_commit(workspace, commit_sha, force=False):
+    """
+    Record ``commit_sha`` as the last commit indexed for the workspace's
+    index, unless a more recent commit has already been recorded.
+
+    :param bool force:
+        Record the commit even if it doesn't descend from the one
+        recorded, for when the index has been rebuilt from scratch.
+    """
+    from cms.models import SearchIndexStatus
+
+    status, _ = SearchIndexStatus.objects.get_or_create(
+        index_name=index_name(workspace))
+    if not force and status.last_indexed_commit and not is_ancestor(
+            workspace.repo, status.last_indexed_commit, commit_sha):
+        return status
+    status.last_indexed_commit = commit_sha
+    status.save()
+    return status
+
+
+def is_ancestor(repo, ancestor_sha, sha):
+    try:
+        repo.git.merge_base('--is-ancestor', ancestor_sha, sha)
+        return True
+    except GitCommandError:
+        return False
+
+
+def last_indexed_commit(workspace):
+    """
+    Return the last commit recorded as indexed for the workspace's index,
+    or ``None`` if nothing has been recorded.
+    """
+    from cms.models import SearchIndexStatus
+
+    return SearchIndexStatus.objects.filter(
+        index_name=index_name(workspace)).values_list(
+        'last_indexed_commit', flat=True).first()
+
+
+def changed_objects(workspace, since_sha, model_classes, until='HEAD'):
+    """
+    Diff the Git tree between two commits and return the objects that
+    were stored & removed in between.
+
+    :param str since_sha: The commit to diff from.
+    :param list model_classes: The model classes to look for.
+    :returns:
+        A dict mapping each model class to a ``(stored, removed)`` tuple
+        of lists of uuids.
+    """
+    sm = workspace.sm
+    dirs = dict(
+        (sm.git_path(model_class), model_class)
+        for model_class in model_classes)
+    changes = dict((model_class, ([], [])) for model_class in model_classes)
+    suffix = '.%s' % (sm.serializer.suffix,)
+
+    output = workspace.repo.git.diff(
+        '--name-status', '--no-renames', '-z', since_sha, until)
+    tokens = output.split('\0')
+    for status, path in zip(tokens[::2], tokens[1::2]):
+        dir_name, file_name = os.path.split(path)
+        model_class = dirs.get(dir_name)
+        if model_class is None or not file_name.endswith(suffix):
+            continue
+        stored, removed = changes[model_class]
+        uuid = file_name[:-len(suffix)]
+        (removed if status == 'D' else stored).append(uuid)
+    return changes
+
+
+def index_changes(workspace, since_sha, model_classes, until_sha,
+                  refresh=None):
+    """
+    Index the objects stored & unindex the objects removed between two
+    commits, see :py:func:`changed_objects`.
+
+    :returns: the changes indexed.
+    """
+    changes = changed_objects(workspace, since_sha, model_classes, until_sha)
+    stored, removed = [], []
+    for model_class in model_classes:
+        stored_uuids, removed_uuids = changes[model_class]
+        stored.extend((fqcn(model_class), uuid) for uuid in stored_uuids)
+        removed.extend((fqcn(model_class), uuid) for uuid in removed_uuids)
+    bulk_index(
+        workspace, stored, removed, commit_sha=until_sha, refresh=refresh)
+    return changes
+
+
+def index_lag(workspace):
+    """
+    Return the number of commits on the active branch that have not been
+    indexed yet, or ``None`` if it's unknown because nothing has been
+    recorded for the index or the recorded commit isn't in the repository
+    (anymore), after a fresh clone or a force push for example.
+    """
+    from cms.models import SearchIndexStatus
+
+    try:
+        status = SearchIndexStatus.objects.get(
+            index_name=index_name(workspace))
+    except SearchIndexStatus.DoesNotExist:
+        return None
+    if not status.last_indexed_commit:
+        return None
+    try:
+        return int(workspace.repo.git.rev_list(
+            '--count', '%s..HEAD' % (status.last_indexed_commit,)))
+    except GitCommandError:
+        return None
+
+
+def schedule(workspace, commit, stored, removed, refresh=None):
+    """
+    Hand a commit's objects over to the background indexer.
+
+    :param elasticgit.workspace.Workspace workspace:
+    :param git.Commit commit:
+    :param list stored:
+        :py:class:`elasticgit.models.Model` instances that were stored.
+    :param list removed:
+        :py:class:`elasticgit.models.Model` instances that were removed.
+    """
+    from cms import tasks
+
+    es_host, = workspace.es_settings['urls']
+    tasks.bulk_index.delay(
+        workspace.working_dir, workspace.index_prefix, es_host,
+        stored=[(fqcn(obj.__class__), obj.uuid) for obj in stored],
+        removed=[(fqcn(obj.__class__), obj.uuid) for obj in removed],
+        commit_sha=commit.hexsha,
+        refresh=refresh)
+
+
+def run_bulk_index(repo_path, index_prefix, es_host, **kwargs):
+    workspace = get_workspace(repo_path, index_prefix, es_host)
+    return bulk_index(workspace, **kwargs)
+
+
+def get_refresh_interval():
+    """
+    Return the refresh interval live indices are configured with, the
+    ``none`` policy disables periodic refreshes.
+    """
+    policy = get_refresh_policy()
+    if policy == REFRESH_NONE:
+        return '-1'
+    if policy == REFRESH_INTERVAL:
+        return settings.ELASTIC_GIT_REFRESH_INTERVAL
+    return '1s'
+
+
+def apply_refresh_policy(workspace):
+    """
+    Configure the workspace's live index with the refresh interval of
+    ``settings.ELASTIC_GIT_REFRESH_POLICY``.
+    """
+    workspace.im.es.indices.put_settings(
+        index=index_name(workspace),
+        body={'index': {'refresh_interval': get_refresh_interval()}})
+
+
+def get_aliased_indices(es, alias):
+    """
+    Return the names of the indices ``alias`` points at.
+    """
+    try:
+        return list(es.indices.get_alias(name=alias))
+    except NotFoundError:
+        return []
+
+
+def load_index(workspace, target_index, model_classes, chunk_size=500):
+    """
+    Bulk load every object committed to the workspace's active branch
+    into ``target_index``, streaming the objects straight from Git.
+
+    :returns: A dict mapping each model class to the number of objects
+        loaded.
+    """
+    from cms.sources import iterate
+
+    counts = dict((model_class, 0) for model_class in model_classes)
+
+    def iter_load_actions():
+        for model_class in model_classes:
+            type_name = mapping_type_name(workspace, model_class)
+            for obj in iterate(workspace, model_class):
+                counts[model_class] += 1
+                yield {
+                    '_op_type': 'index',
+                    '_index': target_index,
+                    '_type': type_name,
+                    '_id': obj.uuid,
+                    '_source': dict(obj),
+                }
+
+    bulk(workspace.im.es, iter_load_actions(), chunk_size=chunk_size)
+    return counts
+
+
+def verify_index(workspace, target_index, counts):
+    es = workspace.im.es
+    wait_for_index(workspace, target_index)
+    for model_class, expected in counts.items():
+        actual = es.count(
+            index=target_index,
+            doc_type=mapping_type_name(workspace, model_class))['count']
+        if actual != expected:
+            raise IndexRebuildError(
+                '%s has %s %s documents, expected %s.' % (
+                    target_index, actual, fqcn(model_class), expected))
+
+
+def swap_alias(es, alias, target_index):
+    """
+    Point ``alias`` at ``target_index`` in a single atomic update and drop
+    the indices it pointed at before.
+
+    NOTE: a live index that predates aliasing can't be swapped atomically,
+    it has to be deleted before the alias can take over its name. Search
+    is down in between, so this one-off migration isn't downtime free.
+    """
+    old_indices = get_aliased_indices(es, alias)
+    actions = [
+        {'remove': {'index': old_index, 'alias': alias}}
+        for old_index in old_indices]
+    actions.append({'add': {'index': target_index, 'alias': alias}})
+
+    if not old_indices and es.indices.exists(index=alias):
+        for attempt in range(2):
+            log.warning('Replacing unaliased index %s.' % (alias,))
+            es.indices.delete(index=alias)
+            try:
+                es.indices.update_aliases(body={'actions': actions})
+                break
+            except TransportError:
+                # NOTE: a write in the meantime auto-creates an index by
+                #       the alias's name, its documents are reindexed.
+                if attempt or not es.indices.exists(index=alias):
+                    raise
+    else:
+        es.indices.update_aliases(body={'actions': actions})
+
+    for old_index in old_indices:
+        es.indices.delete(index=old_index)
+
+
+def rebuild_index(workspace, model_mappings, chunk_size=500):
+    """
+    Rebuild the workspace's index from Git without taking search offline.
+    A new versioned index is bulk loaded with replicas & refreshes
+    disabled, verified, and then swapped in by pointing the index's
+    alias at it, see :py:func:`swap_alias` for the one exception. Objects
+    committed during the rebuild are indexed once the new index is live.
+
+    :param elasticgit.workspace.Workspace workspace:
+    :param list model_mappings:
+        ``(model class, mapping)`` pairs of the models to index.
+    :param int chunk_size:
+        The number of objects sent to Elasticsearch per bulk request.
+    :returns: A dict mapping each model class to the number of objects
+        indexed.
+    """
+    es = workspace.im.es
+    alias = index_name(workspace)
+    target_index = '%s-%s' % (
+        alias, datetime.utcnow().strftime('%Y%m%d%H%M%S%f'))
+    head_sha = workspace.repo.active_branch.commit.hexsha
+
+    replicas = 1
+    if es.indices.exists(index=alias):
+        for data in es.indices.get_settings(index=alias).values():
+            replicas = data['settings']['index']['number_of_replicas']
+
+    es.indices.create(index=target_index, body={'settings': {'index': {
+        'number_of_replicas': 0,
+        'refresh_interval': '-1',
+    }}})
+    try:
+        for model_class, mapping in model_mappings:
+            es.indices.put_mapping(
+                index=target_index,
+                doc_type=mapping_type_name(workspace, model_class),
+                body=mapping)
+        counts = load_index(
+            workspace, target_index,
+            [model_class for model_class, _ in model_mappings],
+            chunk_size=chunk_size)
+        es.indices.put_settings(index=target_index, body={'index': {
+            'number_of_replicas': replicas,
+            'refresh_interval': get_refresh_interval(),
+        }})
+        es.indices.refresh(index=target_index)
+        verify_index(workspace, target_index, counts)
+    except BaseException:
+        es.indices.delete(index=target_index)
+        raise
+
+    try:
+        swap_alias(es, alias, target_index)
+    except BaseException:
+        if es.indices.exists(index=alias):
+            # NOTE: the live index is still there, the new one is dropped.
+            es.indices.delete(index=target_index)
+            raise
+        log.exception('Unable to swap in %s for %s.' % (target_index, alias))
+        raise IndexRebuildError(
+            '%s has been deleted, the rebuilt index %s has been kept but '
+            'the alias could not be pointed at it.' % (alias, target_index))
+    record_indexed_commit(workspace, head_sha, force=True)
+
+    current_sha = workspace.repo.active_branch.commit.hexsha
+    if current_sha != head_sha:
+        index_changes(workspace, head_sha, list(counts), current_sha)
+    return counts
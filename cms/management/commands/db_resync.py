@@ -1,76 +1,169 @@
+from collections import defaultdict
+from optparse import make_option
+from uuid import uuid4
+
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
-from elasticgit import EG
 from elasticgit.utils import fqcn
 
-from elasticsearch.exceptions import NotFoundError
-
+from cms import indexing
 from cms import models as django_models
-from unicore.content import models as eg_models
+from cms.batching import ContentBatch
+from cms.serializers import get_serializer
+from cms.sources import blob_hashes, content_hash, iterate
+from cms.workspaces import get_workspace
+
+
+CREATED = 'Created'
+UPDATED = 'Updated'
+KEPT = 'Kept'
+DELETED = 'Deleted'
 
 
 class Command(BaseCommand):
 
     help = 'Resync an Elasticgit repository with a Django db.'
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--dry-run', action='store_true', dest='dry_run', default=False,
+            help='Report the differences without writing anything.'),
+    )
+
+    related_fields = {
+        django_models.Post: ('localisation', 'primary_category', 'source'),
+        django_models.Category: ('localisation', 'source'),
+    }
+
+    def handle(self, *args, **options):
+        self.dry_run = options.get('dry_run', False)
+        self.workspace = get_workspace(
+            settings.GIT_REPO_PATH, settings.ELASTIC_GIT_INDEX_PREFIX,
+            settings.ELASTICSEARCH_HOST)
+        self.batch = ContentBatch()
+        self.stored = []
+        self.removed = []
+        self.counts = defaultdict(int)
+
+        self.sync_model(django_models.Post)
+        self.sync_model(django_models.Category)
+        self.sync_localisation_model(django_models.Localisation)
+
+        if self.dry_run:
+            self.stdout.write(
+                'Dry run, nothing was written: %(Created)s to create, '
+                '%(Updated)s to update, %(Deleted)s to delete.\n' % (
+                    self.counts))
+            return
+        self.commit()
+
+    def report(self, action, eg_model_class, key):
+        self.counts[action] += 1
+        self.stdout.write(
+            '%s %s: %s.\n' % (action, fqcn(eg_model_class), key))
+
+    def store(self, obj):
+        if not self.dry_run:
+            self.batch.write(self.workspace, obj)
+            self.stored.append(obj)
+
+    def remove(self, obj):
+        if not self.dry_run:
+            self.removed.append(obj)
 
-    def handle(self, *args, **kwargs):
-        self.workspace = EG.workspace(
-            settings.GIT_REPO_PATH,
-            index_prefix=settings.ELASTIC_GIT_INDEX_PREFIX,
-            es={'urls': [settings.ELASTICSEARCH_HOST]})
-        self.index_manager = self.workspace.im
-        self.storage_manager = self.workspace.sm
-
-        model_pairs = [
-            (django_models.Post, eg_models.Page),
-            (django_models.Category, eg_models.Category)
-        ]
-        for django_model_class, eg_model_class in model_pairs:
-            self.sync_model(django_model_class, eg_model_class)
-
-        self.sync_localisation_model(
-            django_models.Localisation, eg_models.Localisation)
-
-    def sync_model(self, django_model_class, eg_model_class):
-        uuids = set([])
-        for model in django_model_class.objects.all():
-            uuids.add(model.uuid)
-            model.save()
-
-        for git_model in self.storage_manager.iterate(eg_model_class):
-            if git_model.uuid not in uuids:
-                self.storage_manager.delete(
-                    git_model, 'This has been deleted in the CMS')
-                try:
-                    self.index_manager.unindex(git_model)
-                except NotFoundError:
-                    pass
-                self.stdout.write(
-                    'Deleted %s: %s.\n' % (
-                        fqcn(eg_model_class), git_model.uuid,))
+    def sync_model(self, django_model_class):
+        """
+        Compare each row with the object stored for it in Git by the hash
+        of its serialized form, only objects that differ are read & written.
+        """
+        serializer = get_serializer(django_model_class)
+        eg_model_class = serializer.eg_model_class
+        sm = self.workspace.sm
+        hashes = blob_hashes(self.workspace, eg_model_class)
+
+        queryset = django_model_class.objects.select_related(
+            *self.related_fields[django_model_class])
+        for instance in queryset.iterator():
+            if not instance.uuid:
+                if self.dry_run:
+                    self.report(
+                        CREATED, eg_model_class, 'pk %s' % (instance.pk,))
+                    continue
+                instance.uuid = uuid4().hex
+                django_model_class.objects.filter(
+                    pk=instance.pk).update(uuid=instance.uuid)
+
+            data = serializer.to_data(instance)
+            obj = eg_model_class(data)
+            stored_hash = hashes.pop(instance.uuid, None)
+            if stored_hash is None:
+                action = CREATED
+            elif stored_hash == content_hash(sm.serializer.serialize(obj)):
+                action = KEPT
             else:
-                self.stdout.write(
-                    'Kept %s: %s.\n' % (fqcn(eg_model_class), git_model.uuid))
-
-    def sync_localisation_model(self, django_model_class, eg_model_class):
-        locales = set([])
-        for model in django_model_class.objects.all():
-            locales.add(model.get_code())
-            model.save()
-
-        for git_model in self.storage_manager.iterate(eg_model_class):
-            if git_model.locale not in locales:
-                self.storage_manager.delete(
-                    git_model, 'This has been deleted in the CMS')
-                try:
-                    self.index_manager.unindex(git_model)
-                except NotFoundError:
-                    pass
-                self.stdout.write(
-                    'Deleted %s: %s.\n' % (
-                        fqcn(eg_model_class), git_model.locale,))
+                # NOTE: the stored object can have fields the serializer
+                #       doesn't produce, those are kept as they are. Objects
+                #       written by another version of Elasticgit only
+                #       differ in their version information.
+                original = sm.get(eg_model_class, instance.uuid)
+                obj = original.update(data)
+                action = (
+                    KEPT if serializer.is_unchanged(original, obj)
+                    else UPDATED)
+
+            if action != KEPT:
+                self.store(obj)
+            self.report(action, eg_model_class, instance.uuid)
+
+        for uuid in hashes:
+            if not self.dry_run:
+                self.remove(sm.get(eg_model_class, uuid))
+            self.report(DELETED, eg_model_class, uuid)
+
+    def sync_localisation_model(self, django_model_class):
+        """
+        Localisations are stored by a uuid the database doesn't know
+        about, there are few enough of them to compare them all by locale.
+        """
+        serializer = get_serializer(django_model_class)
+        eg_model_class = serializer.eg_model_class
+        originals = dict(
+            (localisation.locale, localisation)
+            for localisation in iterate(self.workspace, eg_model_class))
+
+        for instance in django_model_class.objects.iterator():
+            locale = instance.get_code()
+            original = originals.pop(locale, None)
+            data = serializer.to_data(instance)
+            if original is None:
+                obj, action = eg_model_class(data), CREATED
             else:
-                self.stdout.write(
-                    'Kept %s: %s.\n' %
-                    (fqcn(eg_model_class), git_model.locale))
+                obj = original.update(data)
+                action = (
+                    KEPT if serializer.is_unchanged(original, obj)
+                    else UPDATED)
+
+            if action != KEPT:
+                self.store(obj)
+            self.report(action, eg_model_class, locale)
+
+        for locale, original in originals.items():
+            self.remove(original)
+            self.report(DELETED, eg_model_class, locale)
+
+    def commit(self):
+        """
+        Write all differences as a single commit and hand the written
+        objects over to the background indexer.
+        """
+        if not (self.stored or self.removed):
+            return None
+
+        message = (
+            'Resynced with the CMS: %s created, %s updated, %s deleted' % (
+                self.counts[CREATED], self.counts[UPDATED],
+                self.counts[DELETED]))
+        commit = self.batch.commit(
+            self.workspace, self.stored, self.removed, [message], [None])
+        indexing.schedule(self.workspace, commit, self.stored, self.removed)
+        return commit
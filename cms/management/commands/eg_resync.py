@@ -1,26 +1,67 @@
+from optparse import make_option
+
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
 from elasticgit.utils import fqcn
 
 from unicore.content.models import Page, Category, Localisation
-from cms import utils
+from cms import indexing, utils
+from cms.workspaces import get_workspace
 
 
 class Command(BaseCommand):
 
     help = 'Resync an Elasticgit repository with its search index.'
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--full', action='store_true', dest='full', default=False,
+            help=('Rebuild the search index from scratch, needed when the '
+                  'mappings have changed. The live index is swapped for the '
+                  'new one once it has been built.')),
+    )
+
+    model_classes = [Page, Category, Localisation]
+
+    def handle(self, *args, **options):
+        workspace = get_workspace(
+            settings.GIT_REPO_PATH, settings.ELASTIC_GIT_INDEX_PREFIX,
+            settings.ELASTICSEARCH_HOST)
+        since_sha = indexing.last_indexed_commit(workspace)
+        branch = workspace.repo.active_branch
+        if (options.get('full') or
+                since_sha is None or
+                not workspace.im.index_exists(branch.name) or
+                not indexing.is_ancestor(
+                    workspace.repo, since_sha, branch.commit.hexsha)):
+            return self.rebuild(workspace)
+        # NOTE: picks up changes to settings.ELASTIC_GIT_REFRESH_POLICY
+        indexing.apply_refresh_policy(workspace)
+        self.update(workspace, since_sha)
 
-    def handle(self, *args, **kwargs):
-        self.workspace = utils.setup_workspace(
-            settings.GIT_REPO_PATH,
-            index_prefix=settings.ELASTIC_GIT_INDEX_PREFIX)
+    def update(self, workspace, since_sha):
+        """
+        Reindex only the objects changed since the last indexed commit.
+        """
+        head_sha = workspace.repo.active_branch.commit.hexsha
+        changes = indexing.index_changes(
+            workspace, since_sha, self.model_classes, head_sha,
+            refresh=indexing.REFRESH_WAIT_FOR)
+        for model_class in self.model_classes:
+            updated, removed = changes[model_class]
+            self.report(model_class, updated, removed)
 
-        for model_class in [Page, Category, Localisation]:
-            self.sync_model(model_class)
+    def rebuild(self, workspace):
+        """
+        Build a new index next to the live one and swap it in once it's
+        complete, search keeps working throughout.
+        """
+        counts = indexing.rebuild_index(workspace, utils.CUSTOM_MAPPINGS)
+        for model_class in self.model_classes:
+            self.stdout.write('%s: %s indexed.\n' % (
+                fqcn(model_class), counts[model_class]))
 
-    def sync_model(self, model_class):
-        updated, removed = self.workspace.sync(model_class)
+    def report(self, model_class, updated, removed):
         self.stdout.write(
             '%s: %s updated, %s removed.\n' % (
                 fqcn(model_class), len(updated), len(removed)))
@@ -2,7 +2,7 @@ from django.core.management.base import BaseCommand
 from django.conf import settings
 
 from cms.models import Post, Category, Localisation
-from cms import tasks
+from cms.utils import schedule_push
 
 
 class Command(BaseCommand):
@@ -36,6 +36,7 @@ class Command(BaseCommand):
         for post in Post.objects.filter(localisation__country_code='GB'):
             post.save()
 
-        tasks.push_to_git.delay(
-            settings.GIT_REPO_PATH, settings.ELASTIC_GIT_INDEX_PREFIX)
+        schedule_push(
+            settings.GIT_REPO_PATH, settings.ELASTIC_GIT_INDEX_PREFIX,
+            settings.ELASTICSEARCH_HOST)
         self.stdout.write('done.')
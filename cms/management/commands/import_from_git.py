@@ -1,29 +1,59 @@
+from collections import OrderedDict
 from optparse import make_option
-from urlparse import urljoin
 import mimetypes
 
-import requests
-
-from django.core.files.base import ContentFile
-from django.core.files.images import ImageFile
+from django.contrib.contenttypes.models import ContentType
 from django.core.management.base import BaseCommand
 from django.core.exceptions import ValidationError
 from django.utils.six.moves import input
 from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.conf import settings
+from django.db import connection
+from django.template.defaultfilters import slugify
+from django.utils import timezone
+
+from taggit.models import Tag, TaggedItem
 
-from cms import tasks
+from cms.images import ImageFetcher, fetch_image, probe_image
 from cms.models import (
     Post, Category, Localisation, auto_save_post_to_git,
     auto_save_category_to_git, auto_delete_post_to_git,
     auto_delete_category_to_git, auto_save_localisation_to_git,
-    auto_delete_localisation_to_git, auto_save_related_posts_to_git)
+    auto_delete_localisation_to_git, auto_save_related_posts_to_git,
+    invalidate_admin_filters)
+from cms.sources import iterate
+from cms.utils import chunked, schedule_push
 
 from elasticgit import EG
 
 from unicore.content import models as eg_models
 
 
+def bulk_update_fk(model_class, field_name, pairs, batch_size=300):
+    """
+    Point the foreign key ``field_name`` of many rows at their targets
+    with one ``UPDATE .. CASE`` statement per batch.
+
+    :param list pairs:
+        ``(primary key, target primary key)`` tuples.
+    """
+    opts = model_class._meta
+    qn = connection.ops.quote_name
+    pk_column = qn(opts.pk.column)
+    cursor = connection.cursor()
+    for chunk in chunked(pairs, batch_size):
+        cursor.execute(
+            'UPDATE %s SET %s = CASE %s %s END WHERE %s IN (%s)' % (
+                qn(opts.db_table),
+                qn(opts.get_field(field_name).column),
+                pk_column,
+                ' '.join(['WHEN %s THEN %s'] * len(chunk)),
+                pk_column,
+                ', '.join(['%s'] * len(chunk))),
+            [value for pair in chunk for value in pair] +
+            [pk for pk, _ in chunk])
+
+
 class Command(BaseCommand):
     help = 'import all the current content from a github repository'
 
@@ -43,6 +73,9 @@ class Command(BaseCommand):
     )
 
     input_func = input
+    batch_size = 500
+    prefetched_images = {}
+    probed_images = {}
 
     def disconnect_signals(self):
         post_save.disconnect(auto_save_post_to_git, sender=Post)
@@ -77,13 +110,51 @@ class Command(BaseCommand):
             self.stdout.write(message)
 
     def get_thumbor_image_file(self, host, uuid):
-        url = urljoin(host, 'image/%s' % uuid)
-        response = requests.get(url)
-        if response.status_code == 200:
-            return (
-                ContentFile(response.content),
-                response.headers['Content-Type'])
-        return None, None
+        prefetched = self.prefetched_images.get((host, uuid))
+        if prefetched is not None:
+            file_obj, content_type = prefetched
+            if file_obj is not None:
+                file_obj.seek(0)
+            return file_obj, content_type
+        return fetch_image(host, uuid)
+
+    def get_thumbor_image_size(self, host, uuid):
+        if (host, uuid) in self.probed_images:
+            return self.probed_images[(host, uuid)]
+        return probe_image(host, uuid)
+
+    def prefetch_images(self, instances, *field_names):
+        """
+        Download the images referenced by the instances concurrently
+        so that ``set_image_field`` doesn't wait on each one in turn.
+        Only the dimensions are read of images on our own Thumbor server.
+        Previously prefetched images are dropped.
+        """
+        downloads, probes = [], []
+        for instance in instances:
+            for field_name in field_names:
+                uuid = getattr(instance, field_name)
+                host = getattr(instance, '%s_host' % field_name)
+                if None in (uuid, host):
+                    continue
+                if host == settings.THUMBOR_SERVER:
+                    probes.append((host, uuid))
+                else:
+                    downloads.append((host, uuid))
+        fetcher = ImageFetcher()
+        self.prefetched_images = fetcher.fetch_all(downloads)
+        self.probed_images = fetcher.probe_all(probes)
+
+    def get_image_file_name(self, field_name, content_type):
+        extension = mimetypes.guess_extension(content_type)
+        # NOTE: this is to handle Thumbor weirdness where it
+        # returns a file extension instead of mime type.
+        if extension is None:
+            if content_type.startswith('.'):
+                extension = content_type
+            else:
+                extension = ''
+        return '%s%s' % (field_name, extension)
 
     def set_image_field(self, eg_obj, db_obj, field_name):
         '''
@@ -91,6 +162,8 @@ class Command(BaseCommand):
         If the image is hosted by an unknown Thumbor server, a copy
         of the image, with a new uuid, will be stored instead.
 
+        db_obj is not saved, the image is stored with its next save.
+
         Returns True if a copy of the image is stored, False otherwise.
         '''
         uuid = getattr(eg_obj, field_name)
@@ -98,36 +171,32 @@ class Command(BaseCommand):
         if None in (uuid, host):
             return False
 
-        file_obj, content_type = self.get_thumbor_image_file(host, uuid)
-        if file_obj is None:
-            self.emit('WARNING: image %s could not be downloaded' % uuid)
-            return False
-
-        extension = mimetypes.guess_extension(content_type)
-        # NOTE: this is to handle Thumbor weirdness where it
-        # returns a file extension instead of mime type.
-        if extension is None:
-            if content_type.startswith('.'):
-                extension = content_type
-            else:
-                extension = ''
-
-        file_name = '%s%s' % (field_name, extension)
         if host == settings.THUMBOR_SERVER:
             # We can serve scaled images from this host;
-            # no need to re-upload image.
+            # no need to re-upload image, only its dimensions are needed.
+            size, content_type = self.get_thumbor_image_size(host, uuid)
+            if size is None:
+                self.emit('WARNING: image %s could not be downloaded' % uuid)
+                return False
+
             upload_to = db_obj._meta.get_field(field_name).upload_to
-            file_obj = ImageFile(file_obj)
+            file_name = self.get_image_file_name(field_name, content_type)
             getattr(db_obj, field_name).name = '/image/%(uuid)s/%(name)s' % {
                 'uuid': uuid,
                 'name': upload_to(None, file_name)
             }
-            setattr(db_obj, '%s_width' % field_name, file_obj.width)
-            setattr(db_obj, '%s_height' % field_name, file_obj.height)
-            db_obj.save()
+            width, height = size
+            setattr(db_obj, '%s_width' % field_name, width)
+            setattr(db_obj, '%s_height' % field_name, height)
+            return False
+
+        file_obj, content_type = self.get_thumbor_image_file(host, uuid)
+        if file_obj is None:
+            self.emit('WARNING: image %s could not be downloaded' % uuid)
             return False
 
-        getattr(db_obj, field_name).save(file_name, file_obj)
+        file_name = self.get_image_file_name(field_name, content_type)
+        getattr(db_obj, field_name).save(file_name, file_obj, save=False)
         return True
 
     def commit_image_field(self, workspace, eg_obj, db_obj, field_name):
@@ -163,124 +232,276 @@ class Command(BaseCommand):
             Category.objects.all().delete()
 
         self.emit('creating localisations..')
-        localisations = workspace.S(eg_models.Localisation).everything()
-        for l in localisations:
-            l = l.to_object()
+        self.import_localisations(workspace)
 
-            language_code, _, country_code = l.locale.partition('_')
-            localisation, new = Localisation.objects.get_or_create(
-                language_code=language_code,
-                country_code=country_code,
-                defaults={
-                    'logo_text': l.logo_text,
-                    'logo_description': l.logo_description,
-                })
+        self.emit('creating categories..')
+        category_ids = self.import_categories(workspace)
 
-            if not new:
-                continue
+        self.emit('creating pages..')
+        self.import_pages(workspace, category_ids)
 
-            if self.set_image_field(l, localisation, 'image'):
-                self.commit_image_field(workspace, l, localisation, 'image')
-            if self.set_image_field(l, localisation, 'logo_image'):
-                self.commit_image_field(
-                    workspace, l, localisation, 'logo_image')
+        self.emit('done.')
+        self.reconnect_signals()
+        # NOTE: bulk created rows don't send signals.
+        invalidate_admin_filters(Post)
 
-        self.emit('creating categories..')
-        categories = workspace.S(eg_models.Category).everything()
-
-        for instance in categories:
-            instance = instance.to_object()
-
-            localisation = Localisation._for(
-                instance.language) if instance.language else None
-            category = Category.objects.create(
-                slug=instance.slug,
-                title=instance.title,
-                subtitle=instance.subtitle,
-                localisation=localisation,
-                featured_in_navbar=instance.featured_in_navbar or False,
-                uuid=instance.uuid,
-                position=instance.position or 0,
-            )
-
-            if self.set_image_field(instance, category, 'image'):
-                self.commit_image_field(workspace, instance, category, 'image')
+        if self.push:
+            schedule_push(
+                repo_path=workspace.working_dir,
+                index_prefix=workspace.index_prefix,
+                es_host=workspace.es_settings['urls'][0])
 
-        # second pass to add related fields
-        for instance in categories:
-            if instance.source:
-                c = Category.objects.get(uuid=instance.uuid)
-                c.source = Category.objects.get(uuid=instance.source)
-                c.save()
+    def import_localisations(self, workspace):
+        localisation_ids = self.get_localisation_ids()
+        new = OrderedDict()
+        for l in iterate(workspace, eg_models.Localisation):
+            if l.locale not in localisation_ids:
+                new.setdefault(l.locale, l)
+
+        localisations = []
+        for locale, l in new.items():
+            language_code, _, country_code = locale.partition('_')
+            localisations.append((l, Localisation(
+                language_code=language_code,
+                country_code=country_code,
+                logo_text=l.logo_text,
+                logo_description=l.logo_description)))
+
+        self.set_image_fields(
+            workspace, localisations, 'image', 'logo_image')
+        Localisation.objects.bulk_create(
+            [db_obj for eg_obj, db_obj in localisations])
+
+    def import_categories(self, workspace):
+        category_ids = self.get_uuid_map(Category)
+        sources = []
+        for chunk in chunked(
+                iterate(workspace, eg_models.Category), self.batch_size):
+            localisation_ids = self.get_localisation_ids(
+                instance.language for instance in chunk)
+            new = [
+                (instance, Category(
+                    slug=instance.slug or slugify(instance.title),
+                    title=instance.title,
+                    subtitle=instance.subtitle,
+                    localisation_id=localisation_ids.get(instance.language),
+                    featured_in_navbar=instance.featured_in_navbar or False,
+                    uuid=instance.uuid,
+                    position=instance.position or 0))
+                for instance in self.new_objects(chunk, category_ids)]
 
-        # Manually refresh stuff because the command disables signals
-        workspace.refresh_index()
+            self.set_image_fields(workspace, new, 'image')
+            Category.objects.bulk_create([category for _, category in new])
+            category_ids.update(self.get_uuid_map(
+                Category, [instance.uuid for instance, _ in new]))
+            sources.extend(
+                (instance.uuid, instance.source)
+                for instance in chunk if instance.source)
 
-        self.emit('creating pages..')
-        pages = workspace.S(eg_models.Page).everything()
-
-        for instance in pages:
-            instance = instance.to_object()
-
-            primary_category = None
-            if instance.primary_category:
-                primary_category = Category.objects.get(
-                    uuid=instance.primary_category)
-            try:
-                localisation = Localisation._for(
-                    instance.language) if instance.language else None
-                post = Post.objects.create(
+        # second pass to add related fields
+        self.update_sources(Category, sources, category_ids)
+        return category_ids
+
+    def import_pages(self, workspace, category_ids):
+        post_ids = self.get_uuid_map(Post)
+        created_at_field = Post._meta.get_field('created_at')
+        sources, linked_pages = [], []
+        for chunk in chunked(
+                iterate(workspace, eg_models.Page), self.batch_size):
+            localisation_ids = self.get_localisation_ids(
+                instance.language for instance in chunk)
+
+            new = []
+            for instance in self.new_objects(chunk, post_ids):
+                try:
+                    created_at = created_at_field.to_python(
+                        instance.created_at)
+                except ValidationError, e:  # pragma: no cover
+                    self.stderr.write('An error occured with: %s(%s)' % (
+                        instance.title, instance.uuid))
+                    self.stderr.write(e)
+                    continue
+
+                new.append((instance, Post(
                     title=instance.title,
                     subtitle=instance.subtitle,
-                    slug=instance.slug,
+                    slug=instance.slug or slugify(instance.title),
                     description=instance.description,
                     content=instance.content,
-                    created_at=instance.created_at,
-                    modified_at=instance.modified_at,
+                    created_at=created_at or timezone.now(),
                     featured_in_category=(
                         instance.featured_in_category or False),
-                    featured=(
-                        instance.featured or False),
-                    localisation=localisation,
-                    primary_category=primary_category,
+                    featured=instance.featured or False,
+                    localisation_id=localisation_ids.get(instance.language),
+                    primary_category_id=category_ids.get(
+                        instance.primary_category),
                     uuid=instance.uuid,
-                    position=instance.position or 0
-                )
-                # add the tags
-                post.author_tags.add(*instance.author_tags)
-
-                if self.set_image_field(instance, post, 'image'):
-                    self.commit_image_field(workspace, instance, post, 'image')
-
-            except ValidationError, e:  # pragma: no cover
-                self.stderr.write('An error occured with: %s(%s)' % (
-                    instance.title, instance.uuid))
-                self.stderr.write(e)
-
-        # Manually refresh stuff because the command disables signals
-        workspace.refresh_index()
+                    position=instance.position or 0)))
+
+            self.set_image_fields(workspace, new, 'image')
+            Post.objects.bulk_create([post for _, post in new])
+            post_ids.update(self.get_uuid_map(
+                Post, [instance.uuid for instance, _ in new]))
+            self.add_author_tags([
+                (instance.uuid, instance.author_tags)
+                for instance, _ in new], post_ids)
+
+            sources.extend(
+                (instance.uuid, instance.source)
+                for instance in chunk if instance.source)
+            linked_pages.extend(
+                (instance.uuid, instance.linked_pages)
+                for instance, _ in new if instance.linked_pages)
 
         # second pass to add related fields
-        for instance in pages:
-            instance = instance.to_object()
-
-            if instance.source:
-                p = Post.objects.get(uuid=instance.uuid)
-                p.source = Post.objects.get(uuid=instance.source)
-                p.save()
-
-            if instance.linked_pages:
-                p = Post.objects.get(uuid=instance.uuid)
-                p.related_posts.add(*list(
-                    Post.objects.filter(uuid__in=instance.linked_pages)))
-        self.emit('done.')
-        self.reconnect_signals()
-
-        if self.push:
-            tasks.push_to_git.delay(
-                repo_path=workspace.working_dir,
-                index_prefix=workspace.index_prefix,
-                es_host=workspace.es_settings['urls'][0])
+        self.update_sources(Post, sources, post_ids)
+        self.add_related_posts(linked_pages, post_ids)
+
+    def new_objects(self, instances, uuid_map):
+        """
+        Return the instances that don't have a database row yet,
+        each uuid only once.
+        """
+        new = OrderedDict()
+        for instance in instances:
+            if instance.uuid not in uuid_map:
+                new.setdefault(instance.uuid, instance)
+        return new.values()
+
+    def get_uuid_map(self, model_class, uuids=None):
+        """
+        Return a uuid to primary key map of the rows with the given
+        uuids, or of all rows if no uuids are given.
+        """
+        queryset = model_class.objects.exclude(uuid=None)
+        if uuids is None:
+            return dict(queryset.values_list('uuid', 'pk'))
+
+        uuid_map = {}
+        for chunk in chunked(uuids, self.batch_size):
+            uuid_map.update(
+                queryset.filter(uuid__in=chunk).values_list('uuid', 'pk'))
+        return uuid_map
+
+    def get_localisation_ids(self, locales=()):
+        """
+        Return a locale to primary key map of all localisations, the
+        given locales are created in bulk if they don't exist yet.
+        """
+        localisation_ids = dict(
+            (u'%s_%s' % (language_code, country_code), pk)
+            for language_code, country_code, pk in
+            Localisation.objects.values_list(
+                'language_code', 'country_code', 'pk'))
+        missing = set(filter(None, locales)) - set(localisation_ids)
+        if not missing:
+            return localisation_ids
+
+        Localisation.objects.bulk_create([
+            Localisation(language_code=language_code,
+                         country_code=country_code)
+            for language_code, _, country_code in (
+                locale.partition('_') for locale in sorted(missing))])
+        return self.get_localisation_ids()
+
+    def set_image_fields(self, workspace, objs, *field_names):
+        """
+        Set the image fields of database objects that have not been saved
+        yet, so the images are written along with the objects' rows.
+
+        :param list objs: ``(Elasticgit object, database object)`` tuples.
+        """
+        for chunk in chunked(objs, self.batch_size):
+            self.prefetch_images(
+                [eg_obj for eg_obj, _ in chunk], *field_names)
+            for eg_obj, db_obj in chunk:
+                for field_name in field_names:
+                    if self.set_image_field(eg_obj, db_obj, field_name):
+                        self.commit_image_field(
+                            workspace, eg_obj, db_obj, field_name)
+        self.prefetched_images = {}
+        self.probed_images = {}
+
+    def update_sources(self, model_class, sources, uuid_map):
+        """
+        :param list sources: ``(uuid, source uuid)`` tuples.
+        """
+        bulk_update_fk(model_class, 'source', [
+            (uuid_map[uuid], uuid_map[source])
+            for uuid, source in sources
+            if uuid in uuid_map and source in uuid_map])
+
+    def add_author_tags(self, author_tags, post_ids):
+        """
+        :param list author_tags: ``(uuid, tag names)`` tuples.
+        """
+        tag_names = [
+            (uuid, OrderedDict.fromkeys(names or []).keys())
+            for uuid, names in author_tags]
+        tag_ids = self.get_tag_ids(
+            set(name for _, names in tag_names for name in names))
+        content_type = ContentType.objects.get_for_model(Post)
+        TaggedItem.objects.bulk_create([
+            TaggedItem(
+                tag_id=tag_ids[name],
+                content_type=content_type,
+                object_id=post_ids[uuid])
+            for uuid, names in tag_names
+            for name in names], batch_size=self.batch_size)
+
+    def get_tag_ids(self, names):
+        """
+        Return a name to primary key map for the given tag names, creating
+        the tags that don't exist yet in bulk.
+        """
+        def load(names):
+            tag_ids = {}
+            for chunk in chunked(sorted(names), self.batch_size):
+                tag_ids.update(Tag.objects.filter(
+                    name__in=chunk).values_list('name', 'pk'))
+            return tag_ids
+
+        tag_ids = load(names)
+        missing = set(names) - set(tag_ids)
+        if not missing:
+            return tag_ids
+
+        # NOTE: slugs are made unique the same way taggit does on save
+        slugs = set(Tag.objects.values_list('slug', flat=True))
+        tags = []
+        for name in sorted(missing):
+            tag = Tag(name=name)
+            tag.slug, i = tag.slugify(name), 1
+            while tag.slug in slugs:
+                tag.slug, i = tag.slugify(name, i), i + 1
+            slugs.add(tag.slug)
+            tags.append(tag)
+        Tag.objects.bulk_create(tags, batch_size=self.batch_size)
+        tag_ids.update(load(missing))
+        return tag_ids
+
+    def add_related_posts(self, linked_pages, post_ids):
+        """
+        :param list linked_pages: ``(uuid, linked uuids)`` tuples.
+        """
+        field = Post._meta.get_field('related_posts')
+        through = field.rel.through
+        from_field = '%s_id' % (field.m2m_field_name(),)
+        to_field = '%s_id' % (field.m2m_reverse_field_name(),)
+        sort_field = getattr(field, 'sort_value_field_name', 'sort_value')
+
+        rows = []
+        for uuid, linked_uuids in linked_pages:
+            linked_ids = OrderedDict.fromkeys(
+                post_ids[linked_uuid] for linked_uuid in linked_uuids
+                if linked_uuid in post_ids)
+            for position, linked_id in enumerate(linked_ids):
+                rows.append(through(**{
+                    from_field: post_ids[uuid],
+                    to_field: linked_id,
+                    sort_field: position,
+                }))
+        through.objects.bulk_create(rows, batch_size=self.batch_size)
 
     def get_input_data(self, message, default=None):
         raw_value = self.input_func(message)
@@ -94,3 +94,76 @@ class TestDBResync(BaseCmsTestCase):
             self.assertEqual(
                 output.strip(),
                 'Deleted unicore.content.models.Page: %s.' % (page.uuid,))
+
+    def test_resync_writes_only_differences(self):
+
+        with self.settings(GIT_REPO_PATH=self.workspace.working_dir,
+                           ELASTIC_GIT_INDEX_PREFIX=self.mk_index_prefix()):
+            Post.objects.create(title='foo')
+            Post.objects.create(title='bar')
+            post1, post2 = Post.objects.order_by('pk')
+            # NOTE: change the database behind the signal handlers' back
+            Post.objects.filter(pk=post2.pk).update(title='baz')
+
+            head = self.workspace.repo.head.commit
+            self.command.handle()
+            output = self.command.stdout.getvalue()
+
+            self.assertTrue(
+                'Kept unicore.content.models.Page: %s.' % (post1.uuid,)
+                in output)
+            self.assertTrue(
+                'Updated unicore.content.models.Page: %s.' % (post2.uuid,)
+                in output)
+            commit = self.workspace.repo.head.commit
+            self.assertEqual(commit.parents, (head,))
+            self.assertEqual(
+                self.workspace.sm.get(eg_models.Page, post2.uuid).title,
+                'baz')
+
+            # NOTE: nothing differs the second time around
+            self.command.stdout = StringIO()
+            self.command.handle()
+            self.assertEqual(self.workspace.repo.head.commit, commit)
+            self.assertFalse('Updated' in self.command.stdout.getvalue())
+
+    def test_resync_keeps_stored_fields(self):
+
+        with self.settings(GIT_REPO_PATH=self.workspace.working_dir,
+                           ELASTIC_GIT_INDEX_PREFIX=self.mk_index_prefix()):
+            post = Post.objects.create(title='foo')
+            post = Post.objects.get(pk=post.pk)
+            page = self.workspace.sm.get(eg_models.Page, post.uuid)
+            self.workspace.sm.store(
+                page.update({'published': False}), 'Unpublished.')
+
+            self.command.handle()
+            self.assertEqual(
+                self.command.stdout.getvalue().strip(),
+                'Kept unicore.content.models.Page: %s.' % (post.uuid,))
+
+            Post.objects.filter(pk=post.pk).update(title='bar')
+            self.command.stdout = StringIO()
+            self.command.handle()
+            self.assertTrue(
+                'Updated unicore.content.models.Page: %s.' % (post.uuid,)
+                in self.command.stdout.getvalue())
+            page = self.workspace.sm.get(eg_models.Page, post.uuid)
+            self.assertEqual(page.title, 'bar')
+            self.assertFalse(page.published)
+
+    def test_resync_dry_run(self):
+        [page] = self.create_pages(self.workspace, count=1)
+
+        with self.settings(GIT_REPO_PATH=self.workspace.working_dir,
+                           ELASTIC_GIT_INDEX_PREFIX=self.mk_index_prefix()):
+            head = self.workspace.repo.head.commit
+            self.command.handle(dry_run=True)
+            output = self.command.stdout.getvalue()
+
+        self.assertEqual(self.workspace.repo.head.commit, head)
+        self.assertEqual(output.strip(), '\n'.join([
+            'Deleted unicore.content.models.Page: %s.' % (page.uuid,),
+            'Dry run, nothing was written: 0 to create, 0 to update, '
+            '1 to delete.',
+        ]))
@@ -1,7 +1,15 @@
 from StringIO import StringIO
 
+import mock
+
+from elasticsearch.exceptions import TransportError
+
+from cms import indexing, utils
 from cms.tests.base import BaseCmsTestCase
 from cms.management.commands import eg_resync
+from cms.workspaces import get_workspace
+
+from unicore.content.models import Category, Page
 
 
 class TestEGResync(BaseCmsTestCase):
@@ -21,8 +29,154 @@ class TestEGResync(BaseCmsTestCase):
             self.command.handle()
             self.assertEquals(
                 self.command.stdout.getvalue(),
-                ('unicore.content.models.Page: 2 updated, 0 removed.\n'
-                 'unicore.content.models.Category: 2 updated, 0 removed.\n'
-                 'unicore.content.models.Localisation: '
-                 '1 updated, 0 removed.\n')
+                ('unicore.content.models.Page: 2 indexed.\n'
+                 'unicore.content.models.Category: 2 indexed.\n'
+                 'unicore.content.models.Localisation: 1 indexed.\n')
             )
+
+    def test_resync_incremental(self):
+        with self.settings(GIT_REPO_PATH=self.workspace.working_dir,
+                           ELASTIC_GIT_INDEX_PREFIX=self.mk_index_prefix()):
+            page1, page2 = self.create_pages(self.workspace, count=2)
+            self.command.handle()
+
+            self.workspace.delete(page1, 'Deleting page1.')
+            self.create_categories(self.workspace, count=1)
+
+            self.command.stdout = StringIO()
+            with mock.patch('cms.indexing.rebuild_index') as mock_rebuild:
+                self.command.handle()
+            self.assertFalse(mock_rebuild.called)
+            self.assertEquals(
+                self.command.stdout.getvalue(),
+                ('unicore.content.models.Page: 0 updated, 1 removed.\n'
+                 'unicore.content.models.Category: 1 updated, 0 removed.\n'
+                 'unicore.content.models.Localisation: '
+                 '0 updated, 0 removed.\n'))
+
+            workspace = get_workspace()
+            self.assertEqual(
+                indexing.last_indexed_commit(workspace),
+                self.workspace.repo.head.commit.hexsha)
+            self.assertEqual(
+                workspace.S(Page).filter(uuid=page2.uuid).count(), 1)
+            self.assertEqual(
+                workspace.S(Page).filter(uuid=page1.uuid).count(), 0)
+            self.assertEqual(workspace.S(Category).count(), 1)
+
+    def test_resync_full(self):
+        with self.settings(GIT_REPO_PATH=self.workspace.working_dir,
+                           ELASTIC_GIT_INDEX_PREFIX=self.mk_index_prefix()):
+            self.create_pages(self.workspace, count=2)
+            self.command.handle()
+
+            workspace = get_workspace()
+            es = workspace.im.es
+            alias = indexing.index_name(workspace)
+            [old_index] = indexing.get_aliased_indices(es, alias)
+
+            self.command.stdout = StringIO()
+            self.command.handle(full=True)
+            self.assertEquals(
+                self.command.stdout.getvalue(),
+                ('unicore.content.models.Page: 2 indexed.\n'
+                 'unicore.content.models.Category: 0 indexed.\n'
+                 'unicore.content.models.Localisation: 0 indexed.\n'))
+
+            [new_index] = indexing.get_aliased_indices(es, alias)
+            self.assertNotEqual(new_index, old_index)
+            self.assertFalse(es.indices.exists(index=old_index))
+            self.assertEqual(workspace.S(Page).count(), 2)
+
+    def test_rebuild_replaces_unaliased_index(self):
+        workspace = self.workspace
+        self.create_pages(workspace, count=2)
+        es = workspace.im.es
+        alias = indexing.index_name(workspace)
+        self.assertEqual(indexing.get_aliased_indices(es, alias), [])
+
+        counts = indexing.rebuild_index(workspace, utils.CUSTOM_MAPPINGS)
+        self.assertEqual(counts[Page], 2)
+        [index] = indexing.get_aliased_indices(es, alias)
+        self.assertTrue(index.startswith('%s-' % (alias,)))
+        self.assertEqual(workspace.S(Page).count(), 2)
+        self.assertEqual(
+            indexing.last_indexed_commit(workspace),
+            workspace.repo.head.commit.hexsha)
+
+    def test_rebuild_failure_keeps_live_index(self):
+        workspace = self.workspace
+        self.create_pages(workspace, count=2)
+        es = workspace.im.es
+        alias = indexing.index_name(workspace)
+
+        with mock.patch('cms.indexing.verify_index') as mock_verify:
+            mock_verify.side_effect = indexing.IndexRebuildError('broken')
+            self.assertRaises(
+                indexing.IndexRebuildError,
+                indexing.rebuild_index, workspace, utils.CUSTOM_MAPPINGS)
+
+        self.assertEqual(indexing.get_aliased_indices(es, alias), [])
+        self.assertEqual(es.indices.get_settings(
+            index='%s-*' % (alias,)), {})
+        self.assertEqual(workspace.S(Page).count(), 2)
+
+    def test_rebuild_replaces_index_created_during_swap(self):
+        workspace = self.workspace
+        self.create_pages(workspace, count=2)
+        es = workspace.im.es
+        alias = indexing.index_name(workspace)
+        update_aliases = es.indices.update_aliases
+
+        def auto_create_index(body):
+            # NOTE: as a bulk_index task writing to the alias would
+            mock_update.side_effect = update_aliases
+            es.indices.create(index=alias)
+            raise TransportError(400, 'InvalidAliasNameException')
+
+        with mock.patch.object(
+                es.indices, 'update_aliases',
+                side_effect=auto_create_index) as mock_update:
+            counts = indexing.rebuild_index(workspace, utils.CUSTOM_MAPPINGS)
+        self.assertEqual(counts[Page], 2)
+        self.assertEqual(mock_update.call_count, 2)
+        [index] = indexing.get_aliased_indices(es, alias)
+        self.assertTrue(index.startswith('%s-' % (alias,)))
+        self.assertEqual(workspace.S(Page).count(), 2)
+
+    def test_rebuild_swap_failure_keeps_live_index(self):
+        workspace = self.workspace
+        self.create_pages(workspace, count=2)
+        es = workspace.im.es
+        alias = indexing.index_name(workspace)
+        indexing.rebuild_index(workspace, utils.CUSTOM_MAPPINGS)
+        [live_index] = indexing.get_aliased_indices(es, alias)
+
+        with mock.patch.object(
+                es.indices, 'update_aliases',
+                side_effect=TransportError(500, 'failed')):
+            self.assertRaises(
+                TransportError,
+                indexing.rebuild_index, workspace, utils.CUSTOM_MAPPINGS)
+        self.assertEqual(
+            indexing.get_aliased_indices(es, alias), [live_index])
+        self.assertEqual(
+            list(es.indices.get_settings(index='%s-*' % (alias,))),
+            [live_index])
+
+    def test_rebuild_swap_failure_keeps_rebuilt_index(self):
+        workspace = self.workspace
+        self.create_pages(workspace, count=2)
+        es = workspace.im.es
+        alias = indexing.index_name(workspace)
+
+        with mock.patch.object(
+                es.indices, 'update_aliases',
+                side_effect=TransportError(500, 'failed')):
+            self.assertRaises(
+                indexing.IndexRebuildError,
+                indexing.rebuild_index, workspace, utils.CUSTOM_MAPPINGS)
+        # NOTE: the unaliased index is gone, the rebuilt one is kept
+        self.assertFalse(es.indices.exists(index=alias))
+        self.assertEqual(
+            len(es.indices.get_settings(index='%s-*' % (alias,))), 1)
@@ -9,6 +9,8 @@ from django.conf import settings
 import mock
 import responses
 
+from taggit.models import Tag
+
 from cms.models import Post, Category, Localisation
 from cms.tests.base import BaseCmsTestCase
 from cms.management.commands import import_from_git
@@ -49,11 +51,12 @@ class TestImportFromGit(BaseCmsTestCase):
         responses.add_callback(
             responses.POST, '%s/image' % host, callback=callback)
 
-    @mock.patch('cms.tasks.push_to_git.delay')
+    @mock.patch('cms.management.commands.import_from_git.schedule_push')
+    @mock.patch.object(import_from_git.Command, 'prefetch_images')
     @mock.patch.object(import_from_git.Command, 'set_image_field')
     @mock.patch.object(import_from_git.Command, 'commit_image_field')
     def test_command(self, mock_set_image_field, mock_commit_image_field,
-                     mock_push_to_git):
+                     mock_prefetch_images, mock_push_to_git):
         mock_set_image_field.return_value = True
         with self.settings(GIT_REPO_PATH=self.workspace.working_dir,
                            ELASTIC_GIT_INDEX_PREFIX=self.mk_index_prefix()):
@@ -105,12 +108,15 @@ class TestImportFromGit(BaseCmsTestCase):
             self.assertEquals(c.position, 4)
 
             p = Post.objects.get(uuid=page0.uuid)
-            self.assertEquals(p.related_posts.count(), 3)
+            self.assertEquals(
+                [related.uuid for related in p.related_posts.all()],
+                [page.uuid for page in pages[:3]])
             self.assertEquals(p.primary_category.uuid, cat1.uuid)
             self.assertEquals(p.source.uuid, pages[4].uuid)
             self.assertEquals(
                 set(p.author_tags.names()),
                 set(['foo', 'bar', 'baz']))
+            self.assertEquals(Tag.objects.count(), 3)
 
             self.assertEquals(Localisation.objects.all().count(), 3)
             self.assertEquals(mock_set_image_field.call_count, 16)
@@ -203,6 +209,28 @@ class TestImportFromGit(BaseCmsTestCase):
         self.assertIs(file_obj, None)
         self.assertIs(file_obj, None)
 
+    @responses.activate
+    def test_prefetch_images(self):
+        host = 'http://localhost:8888'
+        key = uuid.uuid4().hex
+        command = import_from_git.Command()
+        self.mock_get_image_response(host=host, body='image')
+
+        eg_objs = [
+            eg_models.Page({'image': key, 'image_host': host}),
+            eg_models.Page({'image': key, 'image_host': host}),
+            eg_models.Page({'image': None, 'image_host': None}),
+        ]
+        command.prefetch_images(eg_objs, 'image')
+        self.assertEqual(len(responses.calls), 1)
+
+        for i in range(2):
+            file_obj, content_type = command.get_thumbor_image_file(
+                host=host, uuid=key)
+            self.assertEqual(file_obj.read(), 'image')
+            self.assertEqual(content_type, 'image/png')
+        self.assertEqual(len(responses.calls), 1)
+
     @responses.activate
     def test_set_image_field(self):
         command = import_from_git.Command()
@@ -235,8 +263,9 @@ class TestImportFromGit(BaseCmsTestCase):
         # image exists and is on same server
         with self.settings(THUMBOR_SERVER=host):
             self.assertFalse(command.set_image_field(eg_obj, db_obj, 'image'))
-        db_obj = Localisation.objects.get(
-            language_code='fre', country_code='FR')
+        # the object isn't saved, the image is stored with its next save
+        self.assertEqual(
+            Localisation.objects.get(pk=db_obj.pk).image_width, 5)
         self.assertEqual(command.stdout.getvalue(), '')
         self.assertTrue(
             re.match(r'/image/\w{32}/locales/image.bmp', db_obj.image.name))
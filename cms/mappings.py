@@ -23,7 +23,20 @@ PageMapping = {
         'slug': {
             'type': 'string',
             'index': 'not_analyzed',
-        }
+        },
+        # NOTE: searched by the post admin, see cms.search
+        'title': {
+            'type': 'string',
+            'analyzer': 'standard',
+        },
+        'description': {
+            'type': 'string',
+            'analyzer': 'standard',
+        },
+        'content': {
+            'type': 'string',
+            'analyzer': 'standard',
+        },
     }
 }
 
@@ -0,0 +1,40 @@
+import logging
+
+from django.core.cache import cache
+
+
+log = logging.getLogger(__name__)
+
+# NOTE: metrics are recorded by the web & Celery worker processes alike
+#       and read by the admin, they rely on the default cache being
+#       shared by all of them.
+KEY = 'cms:metrics:%s'
+
+
+def incr(name, delta=1):
+    """
+    Increment the counter ``name`` by ``delta``.
+    """
+    key = KEY % (name,)
+    if not cache.add(key, delta, None):
+        try:
+            cache.incr(key, delta)
+        except ValueError:  # pragma: no cover
+            # NOTE: evicted in between, start counting again.
+            cache.set(key, delta, None)
+    log.debug('%s +%s' % (name, delta))
+
+
+def timing(name, seconds):
+    """
+    Record a duration for ``name``, the last one recorded is kept along
+    with the number of durations and their total in milliseconds.
+    """
+    cache.set(KEY % ('%s.last' % (name,),), seconds, None)
+    incr('%s.count' % (name,))
+    incr('%s.total_ms' % (name,), int(seconds * 1000))
+    log.debug('%s took %.3fs' % (name, seconds))
+
+
+def get(name, default=None):
+    return cache.get(KEY % (name,), default)
@@ -3,6 +3,8 @@ from django.views.defaults import permission_denied
 from django_cas_ng.middleware import CASMiddleware
 from django_cas_ng.views import login as cas_login, logout as cas_logout
 
+from cms import batching
+
 
 class UnicoreCASMiddleware(CASMiddleware):
 
@@ -29,3 +31,27 @@ class Custom403Middleware(object):
         if isinstance(response, HttpResponseForbidden):
             return permission_denied(request)
         return response
+
+
+class ContentBatchMiddleware(object):
+    """
+    Collects the content changes recorded while handling a request in a
+    single batch scope. Once the response is ready, and the view's
+    transaction has been committed, the outbox is drained by a Celery
+    worker which writes the changes as a single commit. Nothing is
+    scheduled if the view raised an exception, changes that were
+    committed anyway are drained by the periodic task.
+    """
+    def process_request(self, request):
+        request._content_batch = batching.begin()
+
+    def process_exception(self, request, exception):
+        if getattr(request, '_content_batch', None) is not None:
+            request._content_batch = None
+            batching.end(flush=False)
+
+    def process_response(self, request, response):
+        if getattr(request, '_content_batch', None) is not None:
+            request._content_batch = None
+            batching.end()
+        return response
@@ -1,10 +1,13 @@
+import json
 import os
-from datetime import datetime
+from datetime import timedelta
+from uuid import uuid4
 
 from django.contrib.auth.models import User
 from django.conf import settings
-from django.db import models
-from django.db.models import F
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F, Min, Q
 from django.db.models.signals import (
     post_save, post_delete, m2m_changed)
 from django.dispatch import receiver
@@ -16,19 +19,22 @@ from django.core.exceptions import ValidationError
 from django_thumborstorage.storages import ThumborStorage
 
 from taggit.managers import TaggableManager
+from taggit.models import TaggedItem
 
 from sortedm2m.fields import SortedManyToManyField
 
-from elasticgit import EG
-
-from git import GitCommandError
-
-from unicore.content import models as eg_models
-from cms import constants
+from cms import batching, constants
+from cms.serializers import get_label, get_serializer
+from cms.workspaces import get_workspace
 
 CONTENT_REPO_LICENSE_PATH = os.path.join(
     settings.PROJECT_ROOT, '..', 'licenses')
 
+CONTENT_REPOSITORIES_CACHE_KEY = 'cms:content-repositories'
+ADMIN_FILTERS_VERSION_KEY = 'cms:admin-filters-version'
+ADMIN_FILTER_CACHE_KEY = 'cms:admin-filter:%s:%s:%s:%s'
+ADMIN_SOURCE_CACHE_KEY = 'cms:admin-source:%s:%s:%s'
+
 CUSTOM_REPO_LICENSE_TYPE = '_custom'
 CONTENT_REPO_LICENSES = (
     (CUSTOM_REPO_LICENSE_TYPE, 'Custom license'),
@@ -53,6 +59,13 @@ CONTENT_REPO_LICENSES = (
 
 DEFAULT_REPO_LICENSE = 'CC-BY-NC-ND-4.0'
 
+# Posts are ordered with sparse positions so that a new post can be put
+# first without renumbering the others, see Post.move_to_front. Scopes
+# start at POST_POSITION_BASE, leaving room for as many new posts in
+# front before they need to be rebalanced.
+POST_POSITION_GAP = 1000
+POST_POSITION_BASE = 1000 * POST_POSITION_GAP
+
 
 def get_author_info(user):
     if not user:
@@ -91,6 +104,23 @@ class ContentRepository(models.Model):
     def get_default_url(cls):
         return settings.GIT_REPO_URL
 
+    @classmethod
+    def get_cached(cls):
+        """
+        Return all content repositories along with their publishing
+        targets, cached until any of them change.
+        """
+        repositories = cache.get(CONTENT_REPOSITORIES_CACHE_KEY)
+        if repositories is None:
+            repositories = list(cls.objects.prefetch_related('targets'))
+            # NOTE: the list is invalidated before the change is committed,
+            #       another process may cache the old list in between so
+            #       it's only kept for a short while.
+            cache.set(
+                CONTENT_REPOSITORIES_CACHE_KEY, repositories,
+                getattr(settings, 'CONTENT_REPOSITORIES_CACHE_TIMEOUT', 60))
+        return repositories
+
     name = models.CharField(
         _('The name of the content repository'),
         max_length=255, blank=True, null=True,
@@ -283,6 +313,10 @@ class Category(models.Model):
         blank=True, null=True)
     image_height = models.IntegerField(blank=True, null=True)
     image_width = models.IntegerField(blank=True, null=True)
+    modified_at = models.DateTimeField(
+        _('Modified Date & Time'),
+        editable=False,
+        auto_now=True)
 
     def image_uuid(self):
         if self.image:
@@ -435,6 +469,65 @@ class Post(models.Model):
 
         super(Post, self).save(*args, **kwargs)
 
+    def get_ordering_scope(self):
+        """
+        Posts are only ever listed per localisation & primary category,
+        positions are only meaningful within that scope.
+        """
+        return Post.objects.filter(
+            localisation=self.localisation_id,
+            primary_category=self.primary_category_id)
+
+    def move_to_front(self):
+        """
+        Give this post a position before every other post in its scope.
+        This costs a single aggregate query, when the scope is running out
+        of room in front a rebalance is scheduled and the post is put half
+        way to the front, ties are ordered newest first.
+        """
+        from cms import tasks
+
+        first = self.get_ordering_scope().exclude(pk=self.pk).aggregate(
+            first=Min('position'))['first']
+        if first is None:
+            position = POST_POSITION_BASE
+        elif first > POST_POSITION_GAP:
+            position = first - POST_POSITION_GAP
+        else:
+            position = first // 2
+
+        Post.objects.filter(pk=self.pk).update(position=position)
+        self.position = position
+
+        if position < POST_POSITION_GAP:
+            # NOTE: delayed like publishing so the worker sees this post.
+            countdown = None
+            if transaction.get_connection().in_atomic_block:
+                countdown = getattr(settings, 'PUBLISH_COMMIT_DELAY', 5)
+            tasks.rebalance_post_positions.apply_async(
+                args=(self.localisation_id, self.primary_category_id),
+                countdown=countdown)
+
+    @classmethod
+    def rebalance_positions(cls, localisation_id, primary_category_id):
+        """
+        Spread the positions of the posts in a scope POST_POSITION_GAP
+        apart from POST_POSITION_BASE, keeping their current order, and
+        publish the posts whose position changed in a single commit.
+        """
+        posts = cls.objects.filter(
+            localisation=localisation_id,
+            primary_category=primary_category_id).order_by(
+            *cls._meta.ordering).select_related('last_author')
+        with batching.content_batch():
+            for index, post in enumerate(posts.iterator()):
+                position = POST_POSITION_BASE + index * POST_POSITION_GAP
+                if post.position == position:
+                    continue
+                cls.objects.filter(pk=post.pk).update(position=position)
+                post.position = position
+                PendingChange.record(batching.SAVE, post)
+
     def __unicode__(self):  # pragma: no cover
         if self.subtitle:
             return '%s - %s' % (self.title, self.subtitle)
@@ -442,11 +535,317 @@ class Post(models.Model):
             return self.title
 
 
+class PendingChange(models.Model):
+    """
+    A content change that has been saved in the database but not yet
+    written to the content repository. Rows are written in the same
+    transaction as the change itself and drained by
+    ``cms.tasks.publish_pending_changes``. Changes that can't be written
+    are marked as failed and left in the outbox.
+    """
+
+    OPERATIONS = (
+        (batching.SAVE, 'Save'),
+        (batching.DELETE, 'Delete'),
+    )
+
+    model_name = models.CharField(max_length=100)
+    object_pk = models.PositiveIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATIONS)
+    key = models.CharField(
+        _('uuid or locale of the stored object'),
+        max_length=255, blank=True, null=True)
+    description = models.CharField(max_length=255, blank=True, null=True)
+    author = models.ForeignKey(
+        User, blank=True, null=True, on_delete=models.SET_NULL,
+        related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    failed_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    error = models.TextField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    retry_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    class Meta:
+        ordering = ('pk',)
+
+    @classmethod
+    def record(cls, operation, instance):
+        serializer = get_serializer(instance)
+        change = cls.objects.create(
+            model_name=get_label(instance),
+            object_pk=instance.pk,
+            operation=operation,
+            key=serializer.get_key(instance),
+            description=serializer.describe(instance)[:255],
+            author=serializer.get_author(instance))
+        batching.changed()
+        return change
+
+    @classmethod
+    def status(cls):
+        """
+        Return the queue depth, the age in seconds of the oldest
+        change waiting to be published & the number of failed changes.
+        """
+        pending = cls.objects.filter(failed_at__isnull=True)
+        aggregate = pending.aggregate(oldest=Min('created_at'))
+        oldest = aggregate['oldest']
+        return {
+            'depth': pending.count(),
+            'lag': (
+                (timezone.now() - oldest).total_seconds()
+                if oldest else 0),
+            'failed': cls.objects.filter(failed_at__isnull=False).count(),
+        }
+
+    @classmethod
+    def due(cls):
+        """
+        Return the changes that are waiting to be published & aren't
+        backing off after a failed attempt.
+        """
+        return cls.objects.filter(failed_at__isnull=True).filter(
+            Q(retry_at__isnull=True) | Q(retry_at__lte=timezone.now()))
+
+    def mark_failed(self, error):
+        """
+        Record a failed attempt to publish the change. It's retried with
+        an exponential backoff starting at ``settings.PUBLISH_RETRY_DELAY``
+        seconds, after ``settings.PUBLISH_MAX_ATTEMPTS`` attempts it's
+        marked as failed & left for an administrator.
+        """
+        now = timezone.now()
+        self.attempts += 1
+        self.error = error
+        if self.attempts >= getattr(settings, 'PUBLISH_MAX_ATTEMPTS', 5):
+            self.failed_at = now
+        else:
+            self.retry_at = now + timedelta(seconds=getattr(
+                settings, 'PUBLISH_RETRY_DELAY', 30) * 2 ** (
+                self.attempts - 1))
+        PendingChange.objects.filter(pk=self.pk).update(
+            attempts=self.attempts, retry_at=self.retry_at,
+            failed_at=self.failed_at, error=self.error)
+
+    @classmethod
+    def requeue_failed(cls):
+        """
+        Give the changes that have failed to publish another round of
+        attempts.
+
+        :returns: the number of changes requeued.
+        """
+        requeued = cls.objects.filter(failed_at__isnull=False).update(
+            failed_at=None, retry_at=None, attempts=0)
+        if requeued:
+            batching.publish_after_commit()
+        return requeued
+
+    def __unicode__(self):  # pragma: no cover
+        return u'%s %s: %s' % (
+            self.operation, self.model_name, self.description)
+
+
+class SearchIndexStatus(models.Model):
+    """
+    Tracks the last commit whose objects have been pushed to an
+    Elasticsearch index, so that index lag can be measured.
+    """
+
+    index_name = models.CharField(max_length=255, unique=True)
+    last_indexed_commit = models.CharField(
+        max_length=40, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'search index statuses'
+
+    def __unicode__(self):  # pragma: no cover
+        return u'%s @ %s' % (self.index_name, self.last_indexed_commit)
+
+
+class PushStatus(models.Model):
+    """
+    Records the outcome of the last push of a content repository to
+    its remote.
+    """
+
+    PUSHED = 'pushed'
+    UP_TO_DATE = 'up_to_date'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PUSHED, 'Pushed'),
+        (UP_TO_DATE, 'Already up to date'),
+        (FAILED, 'Failed'),
+    )
+
+    repo_path = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    commit = models.CharField(max_length=40, blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'push statuses'
+
+    def __unicode__(self):  # pragma: no cover
+        return u'%s: %s' % (self.repo_path, self.status)
+
+    @classmethod
+    def record(cls, repo_path, status, commit=None, error=None):
+        push_status, _ = cls.objects.get_or_create(
+            repo_path=repo_path, defaults={'status': status})
+        push_status.status = status
+        push_status.commit = commit
+        push_status.error = error
+        push_status.save()
+        return push_status
+
+
+class ImportJob(models.Model):
+    """
+    A GitHub import running in the background. A clone job fetches a
+    repository & lists the locales available in it, an import job then
+    imports the chosen locales from the clone.
+    """
+
+    CLONE = 'clone'
+    IMPORT = 'import'
+    OPERATIONS = (
+        (CLONE, 'Clone'),
+        (IMPORT, 'Import'),
+    )
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    )
+    ACTIVE_STATUSES = (PENDING, RUNNING)
+
+    operation = models.CharField(max_length=10, choices=OPERATIONS)
+    status = models.CharField(
+        max_length=10, choices=STATUSES, default=PENDING, db_index=True)
+    repo_url = models.CharField(max_length=255, blank=True, null=True)
+    index_prefix = models.CharField(max_length=255)
+    locales = models.TextField(
+        _('the locales to import or found, as JSON'), blank=True, null=True)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    owner = models.ForeignKey(
+        User, blank=True, null=True, on_delete=models.SET_NULL,
+        related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('-pk',)
+
+    def get_locales(self):
+        return json.loads(self.locales) if self.locales else []
+
+    def set_locales(self, locales):
+        self.locales = json.dumps(list(locales))
+
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def is_cancelled(self):
+        """
+        Check whether the job has been cancelled since it was loaded.
+        """
+        return ImportJob.objects.filter(
+            pk=self.pk, status=self.CANCELLED).exists()
+
+    def cancel(self):
+        """
+        Cancel the job if it hasn't finished yet, a running job stops at
+        the next locale.
+        """
+        cancelled = ImportJob.objects.filter(
+            pk=self.pk, status__in=self.ACTIVE_STATUSES).update(
+            status=self.CANCELLED, finished_at=timezone.now())
+        if cancelled:
+            self.status = self.CANCELLED
+        return bool(cancelled)
+
+    def advance(self):
+        ImportJob.objects.filter(pk=self.pk).update(
+            progress=F('progress') + 1, modified_at=timezone.now())
+        self.progress += 1
+
+    def finish(self, status, error=None):
+        """
+        Record the outcome of the job, unless it has been cancelled.
+        """
+        now = timezone.now()
+        ImportJob.objects.filter(
+            pk=self.pk, status=self.RUNNING).update(
+            status=status, error=error, locales=self.locales,
+            finished_at=now, modified_at=now)
+
+    def to_dict(self):
+        return {
+            'id': self.pk,
+            'operation': self.operation,
+            'status': self.status,
+            'index_prefix': self.index_prefix,
+            'locales': self.get_locales(),
+            'progress': self.progress,
+            'total': self.total,
+            'error': self.error,
+        }
+
+    def __unicode__(self):  # pragma: no cover
+        return u'%s %s (%s)' % (
+            self.get_operation_display(), self.index_prefix, self.status)
+
+
+@receiver(post_save, sender=ContentRepository)
+@receiver(post_delete, sender=ContentRepository)
+@receiver(post_save, sender=PublishingTarget)
+@receiver(post_delete, sender=PublishingTarget)
+@receiver(m2m_changed, sender=ContentRepository.targets.through)
+def invalidate_content_repositories(sender, **kwargs):
+    cache.delete(CONTENT_REPOSITORIES_CACHE_KEY)
+
+
+def get_admin_filters_version():
+    """
+    Return the version of the cached admin list filter options, which
+    changes whenever posts, categories or their tags change.
+    """
+    version = cache.get(ADMIN_FILTERS_VERSION_KEY)
+    if version is None:
+        version = uuid4().hex
+        cache.add(ADMIN_FILTERS_VERSION_KEY, version, None)
+        version = cache.get(ADMIN_FILTERS_VERSION_KEY, version)
+    return version
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def invalidate_admin_filters(sender, **kwargs):
+    cache.set(ADMIN_FILTERS_VERSION_KEY, uuid4().hex, None)
+
+
 @receiver(post_save, sender=ContentRepository)
 def auto_save_content_repository_to_git(sender, instance, created, **kwargs):
-    workspace = EG.workspace(settings.GIT_REPO_PATH,
-                             index_prefix=settings.ELASTIC_GIT_INDEX_PREFIX,
-                             es={'urls': [settings.ELASTICSEARCH_HOST]})
+    workspace = get_workspace()
     # FIXME: We don't have access to the author information here and so
     #        we cannot set it.
     workspace.sm.store_data(
@@ -462,189 +861,34 @@ def auto_save_related_posts_to_git(sender, instance, action, **kwargs):
 
 @receiver(post_save, sender=Post)
 def auto_save_post_to_git(sender, instance, created, **kwargs):
-    # When saving to git, we update the uuid of the instance to ensure
-    # we can find it again.
-    # We need to always retrieve the latest version of the instance to
-    # make sure we always have the uuid if it has been set.
-    if not instance.uuid:
-        instance = Post.objects.get(pk=instance.pk)
-
-    data = {
-        "title": instance.title,
-        "subtitle": instance.subtitle,
-        "slug": instance.slug,
-        "description": instance.description,
-        "content": instance.content,
-        "created_at": instance.created_at.isoformat()
-        if isinstance(instance.created_at, datetime) else instance.created_at,
-        "modified_at": instance.modified_at.isoformat()
-        if isinstance(instance.created_at, datetime) else instance.created_at,
-        # TODO: We should migrate this to localisation everywhere
-        "language": (
-            instance.localisation.get_code()
-            if instance.localisation else None),
-        "featured_in_category": instance.featured_in_category,
-        "featured": instance.featured,
-        "position": instance.position,
-        "linked_pages": [related_post.uuid
-                         for related_post in instance.related_posts.all()],
-        "primary_category": (
-            instance.primary_category.uuid
-            if instance.primary_category
-            else None),
-        "source": (
-            instance.source.uuid
-            if instance.source
-            else None),
-        "image": instance.image_uuid(),
-        "image_host": settings.THUMBOR_SERVER,
-        "author_tags": [tag.name for tag in instance.author_tags.all()],
-    }
-
-    if instance.uuid:
-        data.update({'uuid': instance.uuid})
-
-    # NOTE: If newly created always give it the highest ordering position
-    if created:
-        Post.objects.exclude(pk=instance.pk).update(position=F('position') + 1)
-
-    try:
-        workspace = EG.workspace(
-            settings.GIT_REPO_PATH,
-            index_prefix=settings.ELASTIC_GIT_INDEX_PREFIX,
-            es={'urls': [settings.ELASTICSEARCH_HOST]})
-        [page] = workspace.S(eg_models.Page).filter(uuid=instance.uuid)
-        original = page.get_object()
-        updated = original.update(data)
-        workspace.save(updated, 'Page updated: %s' % instance.title,
-                       author=get_author_info(instance.last_author))
-        workspace.refresh_index()
-    except ValueError:
-        page = eg_models.Page(data)
-        workspace.save(page, 'Page created: %s' % instance.title,
-                       author=get_author_info(instance.last_author))
-        workspace.refresh_index()
-        # Always update the UUID as we've just generated a new one.
-        Post.objects.filter(pk=instance.pk).update(uuid=page.uuid)
+    # NOTE: If newly created without a position always give it the
+    #       highest ordering position
+    if created and not instance.position:
+        instance.move_to_front()
+
+    PendingChange.record(batching.SAVE, instance)
 
 
 @receiver(post_delete, sender=Post)
 def auto_delete_post_to_git(sender, instance, **kwargs):
-    workspace = EG.workspace(settings.GIT_REPO_PATH,
-                             index_prefix=settings.ELASTIC_GIT_INDEX_PREFIX,
-                             es={'urls': [settings.ELASTICSEARCH_HOST]})
-    [page] = workspace.S(eg_models.Page).filter(uuid=instance.uuid)
-    # FIXME: We're attributing the delete to the person who last updated
-    #        the content, which is complete incorrect.
-    #
-    #        We need a better abstraction for this.
-    workspace.delete(
-        page.get_object(), 'Page deleted: %s' % (instance.title,),
-        author=get_author_info(instance.last_author))
-    workspace.refresh_index()
+    PendingChange.record(batching.DELETE, instance)
 
 
 @receiver(post_save, sender=Category)
 def auto_save_category_to_git(sender, instance, created, **kwargs):
-
-    data = {
-        "title": instance.title,
-        "subtitle": instance.subtitle,
-        "slug": instance.slug,
-        "position": instance.position,
-        "language": (
-            instance.localisation.get_code()
-            if instance.localisation else None),
-        "featured_in_navbar": instance.featured_in_navbar,
-        "source": (
-            instance.source.uuid
-            if instance.source else None),
-        "image": instance.image_uuid(),
-        "image_host": settings.THUMBOR_SERVER,
-    }
-
-    if instance.uuid:
-        data.update({'uuid': instance.uuid})
-
-    workspace = EG.workspace(settings.GIT_REPO_PATH,
-                             index_prefix=settings.ELASTIC_GIT_INDEX_PREFIX,
-                             es={'urls': [settings.ELASTICSEARCH_HOST]})
-    try:
-        # FIXME: This can fail if we ever store a value with None
-        #        as the uuid.
-        [category] = workspace.S(eg_models.Category).filter(uuid=instance.uuid)
-        original = category.get_object()
-        updated = original.update(data)
-        workspace.save(updated, 'Category updated: %s' % instance.title,
-                       author=get_author_info(instance.last_author))
-        workspace.refresh_index()
-    except (GitCommandError, ValueError):
-        category = eg_models.Category(data)
-        workspace.save(category, 'Category created: %s' % instance.title,
-                       author=get_author_info(instance.last_author))
-        workspace.refresh_index()
-        Category.objects.filter(pk=instance.pk).update(uuid=category.uuid)
+    PendingChange.record(batching.SAVE, instance)
 
 
 @receiver(post_delete, sender=Category)
 def auto_delete_category_to_git(sender, instance, **kwargs):
-    workspace = EG.workspace(settings.GIT_REPO_PATH,
-                             index_prefix=settings.ELASTIC_GIT_INDEX_PREFIX,
-                             es={'urls': [settings.ELASTICSEARCH_HOST]})
-    [category] = workspace.S(eg_models.Category).filter(uuid=instance.uuid)
-    original = category.get_object()
-    # FIXME: We're attributing the delete to the person who last updated
-    #        the content, which is complete incorrect.
-    #
-    #        We need a better abstraction for this.
-    workspace.delete(original, 'Category deleted: %s' % instance.title,
-                     author=get_author_info(instance.last_author))
-    workspace.refresh_index()
+    PendingChange.record(batching.DELETE, instance)
 
 
 @receiver(post_save, sender=Localisation)
 def auto_save_localisation_to_git(sender, instance, created, **kwargs):
-
-    data = {
-        "locale": instance.get_code(),
-        "image": instance.image_uuid(),
-        "image_host": settings.THUMBOR_SERVER,
-        "logo_image": instance.logo_image_uuid(),
-        "logo_image_host": settings.THUMBOR_SERVER,
-        "logo_text": instance.logo_text,
-        "logo_description": instance.logo_description
-    }
-
-    workspace = EG.workspace(settings.GIT_REPO_PATH,
-                             index_prefix=settings.ELASTIC_GIT_INDEX_PREFIX,
-                             es={'urls': [settings.ELASTICSEARCH_HOST]})
-    try:
-        [localisation] = workspace.S(
-            eg_models.Localisation).filter(locale=instance.get_code())
-        original = localisation.get_object()
-        updated = original.update(data)
-        # FIXME: We don't have access to the author information here and so
-        #        we cannot set it.
-        workspace.save(updated, 'Localisation updated: %s' % unicode(instance))
-        workspace.refresh_index()
-    except (GitCommandError, ValueError):
-        localisation = eg_models.Localisation(data)
-        # FIXME: We don't have access to the author information here and so
-        #        we cannot set it.
-        workspace.save(
-            localisation, 'Localisation created: %s' % unicode(instance))
-        workspace.refresh_index()
+    PendingChange.record(batching.SAVE, instance)
 
 
 @receiver(post_delete, sender=Localisation)
 def auto_delete_localisation_to_git(sender, instance, **kwargs):
-    workspace = EG.workspace(settings.GIT_REPO_PATH,
-                             index_prefix=settings.ELASTIC_GIT_INDEX_PREFIX,
-                             es={'urls': [settings.ELASTICSEARCH_HOST]})
-    [localisation] = workspace.S(
-        eg_models.Localisation).filter(locale=instance.get_code())
-    original = localisation.get_object()
-    # FIXME: We don't have access to the author information here and so
-    #        we cannot set it.
-    workspace.delete(original, 'Localisation deleted: %s' % unicode(instance))
-    workspace.refresh_index()
+    PendingChange.record(batching.DELETE, instance)
@@ -0,0 +1,67 @@
+import logging
+
+from django.conf import settings
+
+from elasticsearch.exceptions import TransportError
+
+from unicore.content.models import Page
+
+from cms import indexing
+from cms.models import PendingChange
+from cms.workspaces import get_workspace
+
+
+log = logging.getLogger(__name__)
+
+SEARCH_FIELDS = ('title^3', 'description^2', 'content')
+
+
+def index_is_fresh(workspace):
+    """
+    Whether the index is close enough to Git to be searched instead of
+    the database, see ``settings.ADMIN_SEARCH_MAX_INDEX_LAG``. Changes
+    that haven't been published to Git yet aren't in the index either.
+    """
+    if PendingChange.objects.filter(failed_at__isnull=True).exists():
+        return False
+    lag = indexing.index_lag(workspace)
+    return lag is not None and lag <= getattr(
+        settings, 'ADMIN_SEARCH_MAX_INDEX_LAG', 0)
+
+
+def search_pages(term, locale=None, limit=None):
+    """
+    Search the pages index for a term, the title, description & content
+    are searched and the results are ordered by relevance.
+
+    :param str term: The search term.
+    :param str locale: Only search pages in this locale.
+    :param int limit:
+        The maximum number of results, defaults to
+        ``settings.ADMIN_SEARCH_MAX_RESULTS``.
+    :returns:
+        The matching pages' uuids, most relevant first, or ``None`` if the
+        index is stale or can't be searched.
+    """
+    limit = limit or getattr(settings, 'ADMIN_SEARCH_MAX_RESULTS', 500)
+    try:
+        workspace = get_workspace()
+        if not index_is_fresh(workspace):
+            return None
+        s = workspace.S(Page).query_raw({
+            'multi_match': {
+                'query': term,
+                'fields': list(SEARCH_FIELDS),
+            }
+        })
+        if locale:
+            s = s.filter(language=locale)
+        uuids = []
+        for result in s.values_dict('uuid')[:limit]:
+            uuid = result['uuid']
+            # NOTE: Elasticsearch 1.x returns stored fields as lists.
+            uuids.append(uuid[0] if isinstance(uuid, list) else uuid)
+        return uuids
+    except TransportError:
+        log.warning('Unable to search for %r.' % (term,), exc_info=True)
+        return None
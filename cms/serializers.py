@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from django.conf import settings
+
+from elasticgit.storage import StorageException
+
+from git import GitCommandError
+
+from unicore.content import models as eg_models
+
+
+def isoformat(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class ContentSerializer(object):
+    """
+    Maps a Django model instance onto the Elasticgit model that is stored
+    for it in the content repository.
+    """
+
+    eg_model_class = None
+    has_uuid = True
+    # NOTE: fields that change on every save, whether or not the content
+    #       itself has changed.
+    volatile_fields = ()
+
+    @property
+    def label(self):
+        return self.eg_model_class.__name__
+
+    def to_data(self, instance):
+        raise NotImplementedError('Subclasses should implement this.')
+
+    def describe(self, instance):
+        return instance.title
+
+    def get_author(self, instance):
+        return instance.last_author
+
+    def get_key(self, instance):
+        """
+        Return the value the stored object can be found again with.
+        """
+        return instance.uuid
+
+    def content_hash(self, obj):
+        """
+        Return a hash of the object's content. It doesn't depend on the
+        order of the fields, on the version of Elasticgit the object was
+        written by or on the serializer's volatile fields.
+        """
+        data = dict(obj)
+        for field_name in ('_version',) + self.volatile_fields:
+            data.pop(field_name, None)
+        return hashlib.sha1(
+            json.dumps(data, sort_keys=True, separators=(',', ':'))
+        ).hexdigest()
+
+    def is_unchanged(self, original, obj):
+        """
+        Return whether ``obj`` has the same content as the stored
+        ``original``, in which case there's nothing to write.
+        """
+        return self.content_hash(obj) == self.content_hash(original)
+
+    def lookup(self, workspace, key):
+        """
+        Return the object currently stored for the key or ``None``
+        if it has not been stored yet. The object is read straight from
+        its known path in the Git repository, no search is needed.
+        """
+        if not key:
+            return None
+        sm = workspace.sm
+        repo_path = sm.git_path(
+            self.eg_model_class, '%s.%s' % (key, sm.serializer.suffix))
+        if not os.path.isfile(os.path.join(workspace.working_dir, repo_path)):
+            return None
+        try:
+            return sm.get(self.eg_model_class, key)
+        except (GitCommandError, StorageException):
+            return None
+
+
+class PostSerializer(ContentSerializer):
+
+    eg_model_class = eg_models.Page
+    volatile_fields = ('modified_at',)
+
+    def to_data(self, instance):
+        data = {
+            "title": instance.title,
+            "subtitle": instance.subtitle,
+            "slug": instance.slug,
+            "description": instance.description,
+            "content": instance.content,
+            "created_at": isoformat(instance.created_at),
+            "modified_at": isoformat(instance.modified_at),
+            # TODO: We should migrate this to localisation everywhere
+            "language": (
+                instance.localisation.get_code()
+                if instance.localisation else None),
+            "featured_in_category": instance.featured_in_category,
+            "featured": instance.featured,
+            "position": instance.position,
+            "linked_pages": [related_post.uuid
+                             for related_post in instance.related_posts.all()],
+            "primary_category": (
+                instance.primary_category.uuid
+                if instance.primary_category
+                else None),
+            "source": (
+                instance.source.uuid
+                if instance.source
+                else None),
+            "image": instance.image_uuid(),
+            "image_host": settings.THUMBOR_SERVER,
+            "author_tags": [tag.name for tag in instance.author_tags.all()],
+        }
+        if instance.uuid:
+            data.update({'uuid': instance.uuid})
+        return data
+
+
+class CategorySerializer(ContentSerializer):
+
+    eg_model_class = eg_models.Category
+
+    def to_data(self, instance):
+        data = {
+            "title": instance.title,
+            "subtitle": instance.subtitle,
+            "slug": instance.slug,
+            "position": instance.position,
+            "language": (
+                instance.localisation.get_code()
+                if instance.localisation else None),
+            "featured_in_navbar": instance.featured_in_navbar,
+            "source": (
+                instance.source.uuid
+                if instance.source else None),
+            "image": instance.image_uuid(),
+            "image_host": settings.THUMBOR_SERVER,
+        }
+        if instance.uuid:
+            data.update({'uuid': instance.uuid})
+        return data
+
+
+class LocalisationSerializer(ContentSerializer):
+
+    eg_model_class = eg_models.Localisation
+    has_uuid = False
+
+    def to_data(self, instance):
+        return {
+            "locale": instance.get_code(),
+            "image": instance.image_uuid(),
+            "image_host": settings.THUMBOR_SERVER,
+            "logo_image": instance.logo_image_uuid(),
+            "logo_image_host": settings.THUMBOR_SERVER,
+            "logo_text": instance.logo_text,
+            "logo_description": instance.logo_description
+        }
+
+    def describe(self, instance):
+        return unicode(instance)
+
+    def get_author(self, instance):
+        # FIXME: We don't have access to the author information here and so
+        #        we cannot set it.
+        return None
+
+    def get_key(self, instance):
+        return instance.get_code()
+
+    def lookup(self, workspace, key):
+        # NOTE: Localisations are stored by uuid but we only know the
+        #       locale, there are few enough of them to scan them all.
+        for localisation in workspace.sm.iterate(self.eg_model_class):
+            if localisation.locale == key:
+                return localisation
+        return None
+
+
+SERIALIZERS = {
+    'cms.post': PostSerializer(),
+    'cms.category': CategorySerializer(),
+    'cms.localisation': LocalisationSerializer(),
+}
+
+
+def get_label(instance_or_class):
+    opts = instance_or_class._meta
+    return '%s.%s' % (opts.app_label, opts.model_name)
+
+
+def get_serializer(instance_or_class):
+    return SERIALIZERS[get_label(instance_or_class)]
@@ -0,0 +1,66 @@
+import hashlib
+import os
+
+
+def iter_blobs(workspace, model_class):
+    """
+    Yield the Git blobs the ``model_class`` objects committed to the
+    workspace's active branch are stored in.
+    """
+    repo = workspace.repo
+    if not repo.head.is_valid():
+        return
+
+    sm = workspace.sm
+    try:
+        tree = repo.active_branch.commit.tree[sm.git_path(model_class)]
+    except KeyError:
+        return
+
+    suffix = '.%s' % (sm.serializer.suffix,)
+    for blob in tree.blobs:
+        if blob.name.endswith(suffix):
+            yield blob
+
+
+def blob_hashes(workspace, model_class):
+    """
+    Return the hashes of the ``model_class`` objects committed to the
+    workspace's active branch, without reading the objects themselves.
+
+    :returns: A dict mapping each object's uuid to its blob's hash.
+    """
+    return dict(
+        (os.path.splitext(blob.name)[0], blob.hexsha)
+        for blob in iter_blobs(workspace, model_class))
+
+
+def content_hash(data):
+    """
+    Return the hash Git gives a blob with the given content.
+    """
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    return hashlib.sha1('blob %d\0%s' % (len(data), data)).hexdigest()
+
+
+def iterate(workspace, model_class, **filters):
+    """
+    Yield the ``model_class`` objects committed to the workspace's active
+    branch. Objects are read one at a time straight from Git's object
+    database as the tree is walked, Elasticsearch isn't needed at all.
+
+    :param elasticgit.workspace.Workspace workspace:
+    :param class model_class:
+        The :py:class:`elasticgit.models.Model` subclass to read.
+    :param dict filters:
+        Only yield objects whose fields have the given values.
+    :returns: generator
+    """
+    sm = workspace.sm
+    for blob in iter_blobs(workspace, model_class):
+        obj = sm.serializer.deserialize(
+            model_class, blob.data_stream.read())
+        if all(getattr(obj, key) == value
+               for key, value in filters.items()):
+            yield obj
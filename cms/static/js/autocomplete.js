@@ -0,0 +1,99 @@
+(function($) {
+    function source(input) {
+        // results are paginated, the pages loaded so far for the
+        // current term are kept so more can be appended to them.
+        var state = {term: null, page: 1, items: []};
+        input.data('autocomplete-state', state);
+        return function(request, response) {
+            if (request.term !== state.term) {
+                state.term = request.term;
+                state.page = 1;
+                state.items = [];
+            }
+            var data = {term: request.term, page: state.page};
+            var localisation = $('#id_localisation').val();
+            if (localisation) {
+                data.localisation = localisation;
+            }
+            $.getJSON(input.data('url'), data, function(data) {
+                state.items = state.items.concat($.map(data.results, function(item) {
+                    return {label: item.text, value: item.id};
+                }));
+                var items = state.items.slice();
+                if (data.more) {
+                    items.push({label: 'More results\u2026', value: '', more: true});
+                }
+                response(items);
+            });
+        };
+    }
+
+    function loadMore(input) {
+        var state = input.data('autocomplete-state');
+        state.page += 1;
+        input.val(state.term);
+        input.autocomplete('search', state.term);
+    }
+
+    function focus(event, ui) {
+        return !ui.item.more;
+    }
+
+    $(document).ready(function() {
+        $('.cms-autocomplete-select').each(function() {
+            var container = $(this);
+            var hidden = container.find('input[type=hidden]');
+            var input = container.find('input.cms-autocomplete');
+            input.autocomplete({
+                minLength: 2,
+                source: source(input),
+                focus: focus,
+                select: function(event, ui) {
+                    if (ui.item.more) {
+                        loadMore(input);
+                        return false;
+                    }
+                    hidden.val(ui.item.value);
+                    input.val(ui.item.label);
+                    return false;
+                }
+            });
+            container.find('.cms-autocomplete-clear').click(function(event) {
+                event.preventDefault();
+                hidden.val('');
+                input.val('');
+            });
+        });
+
+        $('.cms-autocomplete-select-multiple').each(function() {
+            var container = $(this);
+            var list = container.find('ul.cms-autocomplete-selected');
+            var input = container.find('input.cms-autocomplete');
+            list.sortable();
+            list.on('click', '.cms-autocomplete-remove', function(event) {
+                event.preventDefault();
+                $(this).closest('li').remove();
+            });
+            input.autocomplete({
+                minLength: 2,
+                source: source(input),
+                focus: focus,
+                select: function(event, ui) {
+                    if (ui.item.more) {
+                        loadMore(input);
+                        return false;
+                    }
+                    if (!list.find('input[value="' + ui.item.value + '"]').length) {
+                        var item = $('<li/>').text(ui.item.label + ' ');
+                        item.prepend($('<input type="hidden"/>').attr(
+                            'name', container.data('name')).val(ui.item.value));
+                        item.append($('<a href="#" class="cms-autocomplete-remove"/>').html('&times;'));
+                        list.append(item);
+                    }
+                    input.val('');
+                    return false;
+                }
+            });
+        });
+    });
+})(grp.jQuery);
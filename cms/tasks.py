@@ -1,7 +1,53 @@
 from celery import task
-from cms import utils
+from celery.signals import worker_process_init
+
+from django.conf import settings
+
+from cms import batching, indexing, utils
+from cms.workspaces import pool
+
+
+@worker_process_init.connect
+def warm_workspace_pool(**kwargs):
+    pool.warm()
 
 
 @task(serializer='json')
 def push_to_git(repo_path, index_prefix, es_host):
     utils.push_to_git(repo_path, index_prefix, es_host)
+
+
+@task(serializer='json', ignore_result=True)
+def publish_pending_changes(batch_size=None):
+    return batching.publish_pending_changes(batch_size=batch_size)
+
+
+@task(serializer='json', ignore_result=True)
+def bulk_index(repo_path, index_prefix, es_host, stored=(), removed=(),
+               commit_sha=None, refresh=None):
+    return indexing.run_bulk_index(
+        repo_path, index_prefix, es_host, stored=stored, removed=removed,
+        commit_sha=commit_sha, refresh=refresh)
+
+
+@task(serializer='json', ignore_result=True)
+def rebalance_post_positions(localisation_id, primary_category_id):
+    from cms.models import Post
+    Post.rebalance_positions(localisation_id, primary_category_id)
+
+
+@task(serializer='json', bind=True, ignore_result=True,
+      max_retries=getattr(settings, 'IMPORT_JOB_MAX_RETRIES', 360))
+def run_import_job(self, job_id):
+    from cms import importing
+    try:
+        job = importing.start_job(job_id)
+    except importing.ImportLimitReached:
+        if self.request.retries >= self.max_retries:
+            importing.fail_pending_job(
+                job_id, 'Gave up waiting for other imports to finish.')
+            return
+        raise self.retry(countdown=getattr(
+            settings, 'IMPORT_JOB_RETRY_DELAY', 10))
+    if job is not None:
+        importing.run_job(job)
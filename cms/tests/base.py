@@ -6,7 +6,7 @@ from django.conf import settings
 from slugify import slugify
 
 from unicore.content.models import Page, Category, Localisation
-from cms import utils
+from cms import indexing, utils
 
 
 class BaseCmsTestCase(TestCase):
@@ -41,8 +41,7 @@ class BaseCmsTestCase(TestCase):
             self.addCleanup(workspace.destroy)
 
         workspace.setup(author_name, author_email)
-        while not workspace.index_ready():
-            pass
+        indexing.wait_for_index(workspace)
 
         return workspace
 
@@ -5,14 +5,20 @@ from django.conf import settings
 from django.test.client import RequestFactory
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.core.cache import cache
+from django.db import connection
+from django.http import Http404, QueryDict
+from django.test.utils import CaptureQueriesContext
 
+from cms import metrics
 from cms.tests.base import BaseCmsTestCase
 from cms.admin import (
     PostAdmin, CategoryAdmin, ContentRepositoryAdmin, PublishingTargetAdmin,
-    CategoriesListFilter,
+    CategoriesListFilter, AuthorTagsListFilter,
     PostSourceListFilter, CategorySourceListFilter,
     push_to_github, my_view)
-from cms.models import Post, Category, ContentRepository, PublishingTarget
+from cms.models import (
+    Post, Category, ContentRepository, PublishingTarget, Localisation)
 
 from unicore.content import models as eg_models
 
@@ -70,6 +76,98 @@ class TestCategoriesListFilter(BaseAdminTestCase):
         ], list(filter.lookups(None, PostAdmin)))
 
 
+class TestCachedListFilters(BaseAdminTestCase):
+
+    def setUp(self):
+        super(TestCachedListFilters, self).setUp()
+        cache.clear()
+        with self.active_workspace(self.workspace):
+            self.english = Localisation._for('eng_GB')
+            Category.objects.filter(pk=self.category3.pk).update(
+                localisation=self.english)
+            self.post4 = Post.objects.create(
+                title='post 4', source=self.post1, localisation=self.english)
+            self.post4.author_tags.add('health', 'nutrition')
+            self.post2.author_tags.add('health')
+
+    def mk_request(self, **params):
+        return RequestFactory().get('/', params)
+
+    def test_lookups_scoped_to_localisation(self):
+        request = self.mk_request(localisation__id__exact=self.english.pk)
+        filter = CategoriesListFilter(request, {}, Post, PostAdmin)
+        self.assertEqual(
+            [('category-3', 'category 3')], filter.lookup_choices)
+
+    def test_lookups_distinct(self):
+        filter = PostSourceListFilter(self.mk_request(), {}, Post, PostAdmin)
+        self.assertEqual([('post-1', 'post 1')], filter.lookup_choices)
+
+        request = self.mk_request(localisation__id__exact=self.english.pk)
+        filter = PostSourceListFilter(request, {}, Post, PostAdmin)
+        self.assertEqual([('post-1', 'post 1')], filter.lookup_choices)
+
+    def test_source_filters_cached_separately(self):
+        filter = PostSourceListFilter(self.mk_request(), {}, Post, PostAdmin)
+        self.assertEqual([('post-1', 'post 1')], filter.lookup_choices)
+        filter = CategorySourceListFilter(
+            self.mk_request(), {}, Category, CategoryAdmin)
+        self.assertEqual(
+            [('category-1', 'category 1')], filter.lookup_choices)
+
+    def test_author_tags(self):
+        filter = AuthorTagsListFilter(self.mk_request(), {}, Post, PostAdmin)
+        self.assertEqual(
+            ['health', 'nutrition'],
+            [label for _, label in filter.lookup_choices])
+
+        [(health_id, _), _] = filter.lookup_choices
+        filter = AuthorTagsListFilter(self.mk_request(), {
+            'author_tags__id__exact': str(health_id),
+        }, Post, PostAdmin)
+        self.assertEqual(
+            set(filter.queryset(None, Post.objects.all())),
+            set([self.post2, self.post4]))
+
+    def test_lookups_cached(self):
+        CategoriesListFilter(self.mk_request(), {}, Post, PostAdmin)
+        with self.assertNumQueries(0):
+            filter = CategoriesListFilter(
+                self.mk_request(), {}, Post, PostAdmin)
+        self.assertEqual(len(filter.lookup_choices), 3)
+
+        with self.active_workspace(self.workspace):
+            Category.objects.create(title='category 4')
+        filter = CategoriesListFilter(self.mk_request(), {}, Post, PostAdmin)
+        self.assertEqual(len(filter.lookup_choices), 4)
+
+    def test_autocomplete(self):
+        post_admin = PostAdmin(Post, admin.site)
+        with self.settings(ADMIN_FILTER_AUTOCOMPLETE_THRESHOLD=2):
+            filter = CategoriesListFilter(
+                self.mk_request(), {}, Post, post_admin)
+            self.assertTrue(filter.autocomplete)
+            self.assertTrue(filter.has_output())
+            self.assertEqual(filter.lookup_choices, [])
+            self.assertEqual(
+                filter.template, 'cms/admin/autocomplete_filter.html')
+
+            filter = CategoriesListFilter(self.mk_request(), {
+                'category_slug': 'category-2',
+            }, Post, post_admin)
+            self.assertEqual(
+                [('category-2', 'category 2')], filter.lookup_choices)
+
+            request = self.mk_request(term='gory 2')
+            request.user = User.objects.create_superuser(
+                'admin', 'admin@example.org', 'admin')
+            response = post_admin.filter_options_view(
+                request, 'category_slug')
+        self.assertEqual(json.loads(response.content), [
+            {'value': 'category-2', 'label': 'category 2'},
+        ])
+
+
 class TestPostSourceListFilter(BaseAdminTestCase):
 
     def test_filter_source_slug(self):
@@ -151,6 +249,219 @@ class TestPostAdmin(BaseAdminTestCase):
             self.assertEqual(saved_post.last_author, user)
 
 
+class ChangelistQueriesMixin(object):
+
+    def count_changelist_queries(self, url):
+        # NOTE: compare uncached page loads, the filters' options are
+        #       cached until the content changes.
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantChangelistQueries(self, url, create_rows):
+        User.objects.create_superuser('admin', 'admin@example.org', 'admin')
+        self.client.login(username='admin', password='admin')
+        self.client.get(url)
+
+        before = self.count_changelist_queries(url)
+        with self.active_workspace(self.workspace):
+            create_rows()
+        self.assertEqual(self.count_changelist_queries(url), before)
+
+
+class TestPostAdminChangelist(ChangelistQueriesMixin, BaseAdminTestCase):
+
+    def test_annotated_derivatives(self):
+        post_admin = PostAdmin(Post, admin.site)
+        request = RequestFactory().get('/')
+        posts = dict(
+            (post.pk, post) for post in post_admin.get_queryset(request))
+        self.assertEqual(post_admin._derivatives(posts[self.post1.pk]), 1)
+        self.assertEqual(post_admin._derivatives(posts[self.post2.pk]), 0)
+
+    def test_constant_queries(self):
+        def create_rows():
+            localisation = Localisation._for('eng_GB')
+            for i in range(5):
+                Post.objects.create(
+                    title='more %s' % (i,), localisation=localisation,
+                    primary_category=self.category2, source=self.post3)
+
+        self.assertConstantChangelistQueries(
+            reverse('admin:cms_post_changelist'), create_rows)
+
+
+class TestCategoryAdminChangelist(ChangelistQueriesMixin, BaseAdminTestCase):
+
+    def test_annotated_derivatives(self):
+        category_admin = CategoryAdmin(Category, admin.site)
+        request = RequestFactory().get('/')
+        categories = dict(
+            (category.pk, category)
+            for category in category_admin.get_queryset(request))
+        self.assertEqual(
+            category_admin._derivatives(categories[self.category1.pk]), 1)
+        self.assertEqual(
+            category_admin._derivatives(categories[self.category2.pk]), 0)
+
+    def test_constant_queries(self):
+        def create_rows():
+            localisation = Localisation._for('eng_GB')
+            for i in range(5):
+                Category.objects.create(
+                    title='more %s' % (i,), localisation=localisation,
+                    source=self.category3)
+
+        self.assertConstantChangelistQueries(
+            reverse('admin:cms_category_changelist'), create_rows)
+
+
+class TestPostAdminAutocomplete(ChangelistQueriesMixin, BaseAdminTestCase):
+
+    def setUp(self):
+        super(TestPostAdminAutocomplete, self).setUp()
+        self.post_admin = PostAdmin(Post, admin.site)
+        self.request = RequestFactory().get('/')
+        self.request.user = User.objects.create_superuser(
+            'admin', 'admin@example.org', 'admin')
+
+    def get_formfield(self, field_name):
+        return self.post_admin.formfield_for_dbfield(
+            Post._meta.get_field(field_name), request=self.request)
+
+    def autocomplete(self, field_name, **params):
+        request = RequestFactory().get('/', params)
+        request.user = self.request.user
+        response = self.post_admin.autocomplete_view(request, field_name)
+        return json.loads(response.content)
+
+    def test_constant_queries(self):
+        def create_rows():
+            for i in range(5):
+                Post.objects.create(
+                    title='more %s' % (i,), primary_category=self.category2)
+                Category.objects.create(title='more %s' % (i,))
+
+        self.assertConstantChangelistQueries(
+            reverse('admin:cms_post_change', args=(self.post3.pk,)),
+            create_rows)
+
+    def test_render_selected_only(self):
+        field = self.get_formfield('related_posts')
+        html = field.widget.render(
+            'related_posts', [self.post2.pk, self.post1.pk])
+        self.assertTrue(html.index('post 2') < html.index('post 1'))
+        self.assertFalse('post 3' in html)
+
+        field = self.get_formfield('primary_category')
+        html = field.widget.render('primary_category', self.category2.pk)
+        self.assertTrue('category 2' in html)
+        self.assertFalse('category 1' in html)
+
+    def test_ordering_preserved(self):
+        field = self.get_formfield('related_posts')
+        data = QueryDict('related_posts=%s&related_posts=%s' % (
+            self.post2.pk, self.post1.pk))
+        value = field.widget.value_from_datadict(data, {}, 'related_posts')
+        self.assertEqual(list(field.clean(value)), [self.post2, self.post1])
+
+    def test_autocomplete_localisation(self):
+        english = Localisation._for('eng_GB')
+        with self.active_workspace(self.workspace):
+            post = Post.objects.create(title='post 4', localisation=english)
+        self.assertEqual(
+            self.autocomplete('related_posts', term='post',
+                              localisation=english.pk),
+            {'results': [{'id': post.pk, 'text': 'post 4'}], 'more': False})
+
+    def test_autocomplete_invalid_localisation(self):
+        self.assertEqual(
+            len(self.autocomplete(
+                'related_posts', term='post', localisation='foo')['results']),
+            3)
+
+    def test_autocomplete_paginated(self):
+        with self.settings(ADMIN_AUTOCOMPLETE_PAGE_SIZE=2):
+            page1 = self.autocomplete('related_posts', term='post')
+            page2 = self.autocomplete('related_posts', term='post', page=2)
+        self.assertEqual(
+            [result['id'] for result in page1['results']],
+            [self.post1.pk, self.post2.pk])
+        self.assertTrue(page1['more'])
+        self.assertEqual(
+            [result['id'] for result in page2['results']], [self.post3.pk])
+        self.assertFalse(page2['more'])
+
+    def test_autocomplete_url(self):
+        self.assertEqual(
+            self.post_admin.get_autocomplete_url('related_posts'),
+            reverse('admin:cms_post_autocomplete',
+                    kwargs={'field_name': 'related_posts'}))
+
+    def test_autocomplete_unknown_field(self):
+        self.assertRaises(
+            Http404, self.autocomplete, 'localisation', term='eng')
+
+
+class TestTranslationSource(BaseAdminTestCase):
+
+    def setUp(self):
+        super(TestTranslationSource, self).setUp()
+        cache.clear()
+        User.objects.create_superuser('admin', 'admin@example.org', 'admin')
+        self.client.login(username='admin', password='admin')
+
+    def test_change_view(self):
+        response = self.client.get(
+            reverse('admin:cms_post_change', args=(self.post2.pk,)))
+        source_url = reverse('admin:cms_post_source', args=(self.post1.pk,))
+        self.assertEqual(response.context['source_url'], source_url)
+        self.assertFalse('sourceform' in response.context)
+
+        response = self.client.get(
+            reverse('admin:cms_post_change', args=(self.post1.pk,)))
+        self.assertFalse('source_url' in response.context)
+
+    def test_add_view(self):
+        response = self.client.get(
+            reverse('admin:cms_category_add'),
+            {'source': self.category1.pk})
+        self.assertEqual(
+            response.context['source_url'],
+            reverse('admin:cms_category_source', args=(self.category1.pk,)))
+
+    def test_source_view(self):
+        url = reverse('admin:cms_post_source', args=(self.post2.pk,))
+        response = self.client.get(url)
+        self.assertContains(response, 'post 2')
+        self.assertContains(response, 'category 1')
+        self.assertNotContains(response, '<input')
+
+        response = self.client.get(
+            reverse('admin:cms_category_source', args=(self.category2.pk,)))
+        self.assertContains(response, 'category 2')
+
+    def test_source_view_cached(self):
+        url = reverse('admin:cms_post_source', args=(self.post1.pk,))
+        self.client.get(url)
+
+        # NOTE: updates through the queryset leave modified_at untouched
+        Post.objects.filter(pk=self.post1.pk).update(title='updated')
+        self.assertContains(self.client.get(url), 'post 1')
+
+        with self.active_workspace(self.workspace):
+            post = Post.objects.get(pk=self.post1.pk)
+            post.save()
+        self.assertContains(self.client.get(url), 'updated')
+
+    def test_source_view_unknown(self):
+        response = self.client.get(
+            reverse('admin:cms_post_source', args=(0,)))
+        self.assertEqual(response.status_code, 404)
+
+
 class TestCategoryAdmin(BaseAdminTestCase):
 
     def test_derivatives(self):
@@ -256,11 +567,15 @@ class TestCustomAdminViews(BaseAdminTestCase):
         })
 
     def test_view_github_configuration(self):
+        cache.clear()
+        metrics.timing('index_ready_wait', 0.25)
         with self.active_workspace(self.local_workspace):
             request = RequestFactory().get('/')
             response = my_view(request)
             for commit in self.local_workspace.repo.iter_commits():
                 self.assertContains(response, commit.message)
+            self.assertContains(response, 'Last push')
+            self.assertContains(response, '0.25 seconds')
 
 
 class TestSettings(BaseAdminTestCase):
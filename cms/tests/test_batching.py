@@ -0,0 +1,289 @@
+import mock
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test.client import RequestFactory
+from django.utils import timezone
+
+from cms import batching, metrics
+from cms.admin import my_view
+from cms.middleware import ContentBatchMiddleware
+from cms.models import Post, Localisation, PendingChange
+from cms.serializers import PostSerializer, get_serializer
+from cms.tests.base import BaseCmsTestCase
+
+from unicore.content import models as eg_models
+
+
+class TestContentBatch(BaseCmsTestCase):
+
+    def setUp(self):
+        self.workspace = self.mk_workspace()
+
+    def commit_count(self):
+        return len(list(self.workspace.repo.iter_commits('master')))
+
+    def test_batch_single_commit(self):
+        with self.active_workspace(self.workspace):
+            localisation = Localisation._for('eng_GB')
+            commits = self.commit_count()
+            with batching.content_batch():
+                post1 = Post.objects.create(title='post 1')
+                post2 = Post.objects.create(
+                    title='post 2', localisation=localisation)
+                post2.related_posts.add(post1)
+                post2.author_tags.add('foo')
+                self.assertEqual(self.commit_count(), commits)
+
+            self.assertEqual(self.commit_count(), commits + 1)
+            [commit] = list(
+                self.workspace.repo.iter_commits('master', max_count=1))
+            self.assertTrue(commit.message.startswith('2 content changes'))
+
+            post1 = Post.objects.get(pk=post1.pk)
+            post2 = Post.objects.get(pk=post2.pk)
+            self.assertEqual(self.workspace.S(eg_models.Page).count(), 2)
+            [git_post2] = self.workspace.S(
+                eg_models.Page).filter(uuid=post2.uuid)
+            self.assertEqual(git_post2.linked_pages, [post1.uuid])
+            self.assertEqual(git_post2.author_tags, ['foo'])
+            self.assertEqual(git_post2.language, 'eng_GB')
+
+    def test_batch_rollback(self):
+        with self.active_workspace(self.workspace):
+            commits = self.commit_count()
+            with self.assertRaises(ValueError):
+                with batching.content_batch():
+                    Post.objects.create(title='post 1')
+                    raise ValueError('rollback')
+
+            self.assertEqual(self.commit_count(), commits)
+            self.assertEqual(Post.objects.count(), 0)
+            self.assertEqual(batching.current_scope(), None)
+
+    def test_batch_save_and_delete(self):
+        with self.active_workspace(self.workspace):
+            commits = self.commit_count()
+            with batching.content_batch():
+                post = Post.objects.create(title='post 1')
+                post.delete()
+            self.assertEqual(self.commit_count(), commits)
+            self.assertEqual(self.workspace.S(eg_models.Page).count(), 0)
+
+    def test_middleware(self):
+        middleware = ContentBatchMiddleware()
+        with self.active_workspace(self.workspace):
+            commits = self.commit_count()
+            request = RequestFactory().get('/')
+            middleware.process_request(request)
+            Post.objects.create(title='post 1')
+            Post.objects.create(title='post 2')
+            self.assertEqual(self.commit_count(), commits)
+            middleware.process_response(request, HttpResponse())
+            self.assertEqual(self.commit_count(), commits + 1)
+            self.assertEqual(self.workspace.S(eg_models.Page).count(), 2)
+
+    def test_middleware_exception(self):
+        middleware = ContentBatchMiddleware()
+        with self.active_workspace(self.workspace):
+            commits = self.commit_count()
+            request = RequestFactory().get('/')
+            middleware.process_request(request)
+            Post.objects.create(title='post 1')
+            middleware.process_exception(request, ValueError())
+            middleware.process_response(request, HttpResponse(status=500))
+            self.assertEqual(self.commit_count(), commits)
+            self.assertEqual(batching.current_scope(), None)
+            # the post was saved so its change stays in the outbox
+            self.assertEqual(PendingChange.objects.count(), 1)
+
+
+class TestUnchangedSaves(BaseCmsTestCase):
+
+    def setUp(self):
+        self.workspace = self.mk_workspace()
+        cache.clear()
+
+    def commit_count(self):
+        return len(list(self.workspace.repo.iter_commits('master')))
+
+    def test_content_hash(self):
+        serializer = get_serializer(Post)
+        page = eg_models.Page({
+            'title': 'post 1', 'modified_at': '2015-01-01T00:00:00'})
+        self.assertEqual(
+            serializer.content_hash(page),
+            serializer.content_hash(
+                page.update({'modified_at': '2015-01-02T00:00:00'})))
+        self.assertNotEqual(
+            serializer.content_hash(page),
+            serializer.content_hash(page.update({'title': 'post 2'})))
+
+        data = dict(page)
+        data['_version'] = {'package': 'elastic-git', 'version': '0.0.0'}
+        self.assertEqual(
+            serializer.content_hash(page),
+            serializer.content_hash(eg_models.Page(data)))
+
+    def test_unchanged_save_skipped(self):
+        with self.active_workspace(self.workspace):
+            post = Post.objects.create(title='post 1')
+            commits = self.commit_count()
+            with mock.patch('cms.batching.indexing.schedule') as schedule:
+                Post.objects.get(pk=post.pk).save()
+            self.assertEqual(self.commit_count(), commits)
+            self.assertFalse(schedule.called)
+            self.assertEqual(metrics.get('content_batch.unchanged'), 1)
+
+            response = my_view(RequestFactory().get('/'))
+            self.assertContains(
+                response, '<strong>Unchanged saves skipped</strong> <p>1</p>')
+
+    def test_changed_save_written(self):
+        with self.active_workspace(self.workspace):
+            post = Post.objects.create(title='post 1')
+            commits = self.commit_count()
+            with batching.content_batch():
+                Post.objects.get(pk=post.pk).save()
+                post.title = 'post 1 changed'
+                post.save()
+                Post.objects.create(title='post 2').save()
+            self.assertEqual(self.commit_count(), commits + 1)
+            [commit] = list(
+                self.workspace.repo.iter_commits('master', max_count=1))
+            self.assertTrue(commit.message.startswith('2 content changes'))
+            self.assertEqual(metrics.get('content_batch.unchanged'), None)
+
+
+class TestPendingChanges(BaseCmsTestCase):
+
+    def setUp(self):
+        self.workspace = self.mk_workspace()
+
+    def test_record(self):
+        with self.active_workspace(self.workspace):
+            with batching.content_batch():
+                post = Post.objects.create(title='post 1')
+                [change] = PendingChange.objects.all()
+                self.assertEqual(change.model_name, 'cms.post')
+                self.assertEqual(change.object_pk, post.pk)
+                self.assertEqual(change.operation, batching.SAVE)
+                self.assertEqual(change.description, 'post 1')
+                self.assertEqual(PendingChange.status()['depth'], 1)
+            self.assertEqual(PendingChange.objects.count(), 0)
+            self.assertEqual(
+                PendingChange.status(), {'depth': 0, 'lag': 0, 'failed': 0})
+
+    def test_publish_coalesces(self):
+        with self.active_workspace(self.workspace):
+            commits = len(list(self.workspace.repo.iter_commits('master')))
+            with batching.content_batch():
+                post = Post.objects.create(title='post 1')
+                post.title = 'post 1 changed'
+                post.save()
+                post.save()
+                self.assertEqual(PendingChange.objects.count(), 3)
+
+            [commit] = list(
+                self.workspace.repo.iter_commits('master', max_count=1))
+            self.assertEqual(commit.message, 'Page created: post 1 changed')
+            self.assertEqual(
+                len(list(self.workspace.repo.iter_commits('master'))),
+                commits + 1)
+            self.assertEqual(PendingChange.objects.count(), 0)
+
+    def test_publish_batch_size(self):
+        with self.active_workspace(self.workspace):
+            commits = len(list(self.workspace.repo.iter_commits('master')))
+            with mock.patch('cms.tasks.publish_pending_changes.apply_async'):
+                for i in range(3):
+                    Post.objects.create(title='post %s' % (i,))
+            self.assertEqual(PendingChange.objects.count(), 3)
+            self.assertEqual(batching.publish_pending_changes(batch_size=2), 3)
+            self.assertEqual(
+                len(list(self.workspace.repo.iter_commits('master'))),
+                commits + 2)
+            self.assertEqual(self.workspace.S(eg_models.Page).count(), 3)
+
+    def test_publish_isolates_failures(self):
+        to_data = PostSerializer.to_data
+
+        def failing_to_data(serializer, instance):
+            if instance.title == 'post 1':
+                raise ValueError('bad post')
+            return to_data(serializer, instance)
+
+        with self.active_workspace(self.workspace):
+            with mock.patch('cms.tasks.publish_pending_changes.apply_async'):
+                for i in range(3):
+                    Post.objects.create(title='post %s' % (i,))
+            with mock.patch.object(
+                    PostSerializer, 'to_data', failing_to_data):
+                with self.settings(PUBLISH_MAX_ATTEMPTS=1):
+                    self.assertEqual(batching.publish_pending_changes(), 3)
+
+            self.assertEqual(
+                sorted(page.title for page in self.workspace.S(
+                    eg_models.Page).everything()),
+                ['post 0', 'post 2'])
+            [change] = PendingChange.objects.all()
+            self.assertEqual(change.description, 'post 1')
+            self.assertEqual(change.error, 'ValueError: bad post')
+            self.assertEqual(
+                PendingChange.status(), {'depth': 0, 'lag': 0, 'failed': 1})
+            # failed changes aren't retried until they're requeued
+            self.assertEqual(batching.publish_pending_changes(), 0)
+            self.assertEqual(PendingChange.requeue_failed(), 1)
+            self.assertEqual(PendingChange.objects.count(), 0)
+
+    def test_publish_retries_with_backoff(self):
+        with self.active_workspace(self.workspace):
+            with mock.patch('cms.tasks.publish_pending_changes.apply_async'):
+                Post.objects.create(title='post 1')
+            with self.settings(PUBLISH_MAX_ATTEMPTS=2, PUBLISH_RETRY_DELAY=60):
+                with mock.patch.object(
+                        PostSerializer, 'to_data',
+                        side_effect=ValueError('index.lock exists')):
+                    self.assertEqual(batching.publish_pending_changes(), 1)
+                    [change] = PendingChange.objects.all()
+                    self.assertEqual(change.attempts, 1)
+                    self.assertTrue(change.retry_at > timezone.now())
+                    self.assertEqual(PendingChange.status()['failed'], 0)
+                    # NOTE: backing off
+                    self.assertEqual(batching.publish_pending_changes(), 0)
+
+                    PendingChange.objects.update(retry_at=timezone.now())
+                    self.assertEqual(batching.publish_pending_changes(), 1)
+                    [change] = PendingChange.objects.all()
+                    self.assertEqual(change.attempts, 2)
+                    self.assertTrue(change.failed_at)
+
+                with mock.patch(
+                        'cms.tasks.publish_pending_changes.apply_async'):
+                    self.assertEqual(PendingChange.requeue_failed(), 1)
+                self.assertEqual(batching.publish_pending_changes(), 1)
+            self.assertEqual(PendingChange.objects.count(), 0)
+            self.assertEqual(
+                [page.title for page in self.workspace.S(
+                    eg_models.Page).everything()], ['post 1'])
+
+    def test_publish_failure_rolled_back(self):
+        with self.active_workspace(self.workspace):
+            with mock.patch('cms.tasks.publish_pending_changes.apply_async'):
+                Post.objects.create(title='post 1')
+            with mock.patch.object(
+                    batching.ContentBatch, 'commit',
+                    side_effect=ValueError('commit failed')):
+                with self.settings(PUBLISH_MAX_ATTEMPTS=1):
+                    self.assertEqual(batching.publish_pending_changes(), 1)
+            self.assertFalse(
+                self.workspace.repo.is_dirty(untracked_files=True))
+            self.assertEqual(PendingChange.status()['failed'], 1)
+
+    def test_publish_deferred_in_transaction(self):
+        with mock.patch('cms.tasks.publish_pending_changes.apply_async') as (
+                apply_async):
+            with self.settings(PUBLISH_COMMIT_DELAY=7):
+                # NOTE: tests run inside of a transaction
+                batching.changed()
+        apply_async.assert_called_once_with(countdown=7)
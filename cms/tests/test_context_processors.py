@@ -1,7 +1,11 @@
+import mock
+
 from cms.tests.base import BaseCmsTestCase
+from django.core.cache import cache
 from django.test.client import RequestFactory
 
 from cms import context_processors
+from cms.models import ContentRepository, CONTENT_REPOSITORIES_CACHE_KEY
 
 
 class TestContextProcessors(BaseCmsTestCase):
@@ -30,7 +34,41 @@ class TestContextProcessors(BaseCmsTestCase):
                 'repo_changes': 2,
             })
 
+        # the count is cached for the local & remote commits
+        with self.active_workspace(local_workspace):
+            with mock.patch(
+                    'git.cmd.Git.rev_list', create=True) as rev_list:
+                context = context_processors.workspace_changes(request)
+            self.assertFalse(rev_list.called)
+            self.assertEqual(context, {'repo_changes': 2})
+
+            self.create_pages(local_workspace, count=1)
+            context = context_processors.workspace_changes(request)
+            self.assertEqual(context, {'repo_changes': 3})
+
     def test_content_repositories(self):
+        cache.clear()
         request = RequestFactory().get('/')
         context = context_processors.content_repositories(request)
         self.assertEqual(list(context['content_repositories']), [])
+
+        with self.active_workspace(self.mk_workspace()):
+            repo = ContentRepository.objects.create()
+            context = context_processors.content_repositories(request)
+            self.assertEqual(context['content_repositories'], [repo])
+
+            with self.assertNumQueries(0):
+                context_processors.content_repositories(request)
+
+            repo.delete()
+            context = context_processors.content_repositories(request)
+            self.assertEqual(context['content_repositories'], [])
+
+    def test_content_repositories_timeout(self):
+        cache.clear()
+        request = RequestFactory().get('/')
+        with self.settings(CONTENT_REPOSITORIES_CACHE_TIMEOUT=5):
+            with mock.patch('cms.models.cache.set') as cache_set:
+                context_processors.content_repositories(request)
+        cache_set.assert_called_once_with(
+            CONTENT_REPOSITORIES_CACHE_KEY, [], 5)
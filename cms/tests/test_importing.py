@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+
+import mock
+
+from django.db.models.signals import post_save
+
+from cms import batching, importing
+from cms.management.commands.import_from_git import Command
+from cms.models import Category, PendingChange, Post
+from cms.sources import iterate
+from cms.tests.base import BaseCmsTestCase
+
+from unicore.content import models as eg_models
+
+
+class TestCloneCache(BaseCmsTestCase):
+
+    def setUp(self):
+        self.remote_workspace = self.mk_workspace()
+        self.url = 'file://%s' % (
+            os.path.abspath(self.remote_workspace.working_dir),)
+        self.clone_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.clone_path)
+
+    def clone(self, name):
+        with self.settings(IMPORT_CLONE_REPO_PATH=self.clone_path):
+            return importing.clone_repo(self.url, name)
+
+    def test_clone_repo_reuses_clone(self):
+        self.create_pages(self.remote_workspace, count=1)
+        repo = self.clone('import-repo-prefix-foo')
+        marker = os.path.join(repo.git_dir, 'marker')
+        open(marker, 'w').close()
+
+        self.create_pages(self.remote_workspace, count=1)
+        repo = self.clone('import-repo-prefix-foo')
+        self.assertTrue(os.path.exists(marker))
+        with self.settings(IMPORT_CLONE_REPO_PATH=self.clone_path):
+            workspace = importing.get_clone_workspace(
+                'import-repo-prefix-foo')
+        self.assertEqual(len(list(iterate(workspace, eg_models.Page))), 2)
+
+    def test_clone_repo_other_url(self):
+        repo = self.clone('import-repo-prefix-foo')
+        repo.git.remote('set-url', 'origin', 'file:///elsewhere')
+        marker = os.path.join(repo.git_dir, 'marker')
+        open(marker, 'w').close()
+
+        repo = self.clone('import-repo-prefix-foo')
+        self.assertFalse(os.path.exists(marker))
+        self.assertEqual(repo.remote().url, self.url)
+
+    def test_evict_clones(self):
+        with self.settings(IMPORT_CLONE_CACHE_SIZE=1):
+            self.clone('import-repo-prefix-foo')
+            self.clone('import-repo-prefix-bar')
+        self.assertEqual(
+            os.listdir(self.clone_path), ['import-repo-prefix-bar'])
+
+    def test_destroy_orphaned_indices(self):
+        es = self.remote_workspace.im.es
+        self.clone('import-repo-prefix-foo')
+        for index in ('import-repo-prefix-foo-master',
+                      'import-repo-prefix-foo-bar-master'):
+            es.indices.create(index=index)
+            self.addCleanup(es.indices.delete, index=index, ignore=404)
+
+        with self.settings(IMPORT_CLONE_REPO_PATH=self.clone_path):
+            importing.destroy_orphaned_indices()
+        self.assertTrue(
+            es.indices.exists(index='import-repo-prefix-foo-master'))
+        self.assertFalse(
+            es.indices.exists(index='import-repo-prefix-foo-bar-master'))
+
+
+class TestImportLocaleContent(BaseCmsTestCase):
+
+    def setUp(self):
+        self.workspace = self.mk_workspace()
+        self.remote_workspace = self.mk_workspace(
+            name='%s_remote' % (self.workspace.index_prefix,),
+            index_prefix='%s_remote' % (self.workspace.index_prefix,))
+
+    def test_import_in_batches(self):
+        self.create_localisation(self.remote_workspace, locale='spa_ES')
+        self.create_categories(self.remote_workspace, locale='spa_ES')
+        pages = self.create_pages(
+            self.remote_workspace, count=5, locale='spa_ES')
+        self.remote_workspace.save(pages[0].update({
+            'linked_pages': [page.uuid for page in pages[1:]],
+        }), 'Added related fields.')
+
+        with self.active_workspace(self.workspace):
+            with mock.patch.object(Command, 'batch_size', 2):
+                with batching.content_batch():
+                    importing.import_locale_content(
+                        self.remote_workspace, 'spa_ES')
+
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(Post.objects.count(), 5)
+        post = Post.objects.get(uuid=pages[0].uuid)
+        self.assertEqual(post.related_posts.count(), 4)
+
+    def test_import_saves_once(self):
+        self.create_localisation(self.remote_workspace, locale='spa_ES')
+        self.create_categories(self.remote_workspace, locale='spa_ES')
+        self.create_pages(self.remote_workspace, count=2, locale='spa_ES')
+
+        saved = []
+
+        def record_save(sender, instance, **kwargs):
+            saved.append((sender, instance.uuid))
+
+        post_save.connect(record_save, sender=Category)
+        post_save.connect(record_save, sender=Post)
+        self.addCleanup(post_save.disconnect, record_save, sender=Category)
+        self.addCleanup(post_save.disconnect, record_save, sender=Post)
+        with self.active_workspace(self.workspace):
+            with batching.content_batch():
+                importing.import_locale_content(
+                    self.remote_workspace, 'spa_ES')
+        self.assertEqual(len(saved), 4)
+        self.assertEqual(len(set(saved)), 4)
+
+    def test_add_related_posts_keeps_existing(self):
+        first = Post.objects.create(title='first', uuid='a' * 32)
+        second = Post.objects.create(title='second', uuid='b' * 32)
+        third = Post.objects.create(title='third', uuid='c' * 32)
+        first.related_posts.add(second)
+        PendingChange.objects.all().delete()
+
+        importing.add_related_posts([
+            (first.uuid, [second.uuid, third.uuid, 'missing']),
+            (second.uuid, []),
+        ], batch_size=1)
+
+        self.assertEqual(
+            list(first.related_posts.all()), [second, third])
+        self.assertEqual(list(PendingChange.objects.values_list(
+            'object_pk', flat=True)), [first.pk])
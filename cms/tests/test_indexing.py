@@ -0,0 +1,128 @@
+import mock
+
+from django.core.cache import cache
+
+from elasticgit.utils import fqcn
+
+from cms import indexing, metrics, search
+from cms.models import SearchIndexStatus
+from cms.tests.base import BaseCmsTestCase
+
+from unicore.content.models import Page
+
+
+class TestIndexing(BaseCmsTestCase):
+
+    def setUp(self):
+        self.workspace = self.mk_workspace()
+
+    def store_pages(self, count=2):
+        pages = []
+        for data, i in self.create_page_data_iter(count=count):
+            page = Page(data)
+            self.workspace.sm.store(page, 'Added page %s.' % (i,))
+            pages.append(page)
+        return pages
+
+    def test_bulk_index(self):
+        pages = self.store_pages()
+        head = self.workspace.repo.head.commit.hexsha
+        self.assertEqual(self.workspace.S(Page).count(), 0)
+
+        indexing.bulk_index(
+            self.workspace,
+            stored=[(fqcn(Page), page.uuid) for page in pages],
+            commit_sha=head, refresh='wait_for')
+
+        self.assertEqual(self.workspace.S(Page).count(), 2)
+        status = SearchIndexStatus.objects.get(
+            index_name=indexing.index_name(self.workspace))
+        self.assertEqual(status.last_indexed_commit, head)
+        self.assertEqual(indexing.index_lag(self.workspace), 0)
+
+    def test_bulk_unindex(self):
+        page1, page2 = self.store_pages()
+        indexing.bulk_index(
+            self.workspace,
+            stored=[(fqcn(Page), page.uuid) for page in [page1, page2]],
+            refresh='wait_for')
+        self.workspace.sm.delete(page1, 'Removed page.')
+
+        # NOTE: page1 is unindexed even when it is passed in as stored
+        #       because it no longer exists in git.
+        indexing.bulk_index(
+            self.workspace,
+            stored=[(fqcn(Page), page1.uuid)],
+            removed=[(fqcn(Page), 'does-not-exist')],
+            refresh='wait_for')
+        self.assertEqual(
+            [page.uuid for page in self.workspace.S(Page)], [page2.uuid])
+
+    def test_index_lag(self):
+        self.assertEqual(indexing.index_lag(self.workspace), None)
+        self.store_pages(count=1)
+        indexing.record_indexed_commit(
+            self.workspace, self.workspace.repo.head.commit.hexsha)
+        self.store_pages(count=3)
+        self.assertEqual(indexing.index_lag(self.workspace), 3)
+
+    def test_index_lag_unknown_commit(self):
+        self.store_pages(count=1)
+        indexing.record_indexed_commit(self.workspace, 'f' * 40, force=True)
+        self.assertEqual(indexing.index_lag(self.workspace), None)
+        self.assertFalse(search.index_is_fresh(self.workspace))
+
+    def test_record_indexed_commit_keeps_newest(self):
+        self.store_pages(count=1)
+        old_sha = self.workspace.repo.head.commit.hexsha
+        self.store_pages(count=1)
+        new_sha = self.workspace.repo.head.commit.hexsha
+
+        indexing.record_indexed_commit(self.workspace, new_sha)
+        status = indexing.record_indexed_commit(self.workspace, old_sha)
+        self.assertEqual(status.last_indexed_commit, new_sha)
+
+    def test_refresh_policy(self):
+        self.assertEqual(indexing.get_refresh_policy('none'), 'none')
+        with self.settings(ELASTIC_GIT_REFRESH_POLICY='interval'):
+            self.assertEqual(indexing.get_refresh_policy(), 'interval')
+        self.assertRaises(ValueError, indexing.get_refresh_policy, 'foo')
+
+    def test_apply_refresh_policy(self):
+        es = self.workspace.im.es
+        index = indexing.index_name(self.workspace)
+
+        def refresh_interval():
+            [data] = es.indices.get_settings(index=index).values()
+            return data['settings']['index']['refresh_interval']
+
+        with self.settings(ELASTIC_GIT_REFRESH_POLICY='none'):
+            indexing.apply_refresh_policy(self.workspace)
+            self.assertEqual(refresh_interval(), '-1')
+        with self.settings(ELASTIC_GIT_REFRESH_POLICY='interval',
+                           ELASTIC_GIT_REFRESH_INTERVAL='30s'):
+            indexing.apply_refresh_policy(self.workspace)
+            self.assertEqual(refresh_interval(), '30s')
+
+    def test_wait_for_index(self):
+        cache.clear()
+        indexing.wait_for_index(self.workspace)
+        self.assertEqual(metrics.get('index_ready_wait.count'), 1)
+        self.assertTrue(metrics.get('index_ready_wait.last') >= 0)
+
+    @mock.patch('time.sleep')
+    def test_wait_for_index_backs_off(self, mock_sleep):
+        es = self.workspace.im.es
+        with mock.patch.object(es.cluster, 'health') as mock_health:
+            mock_health.return_value = {'timed_out': True}
+            with mock.patch('time.time') as mock_time:
+                mock_time.side_effect = lambda: (
+                    mock_sleep.call_count * 1.0)
+                self.assertRaises(
+                    indexing.IndexNotReady, indexing.wait_for_index,
+                    self.workspace, timeout=5, initial_delay=0.5,
+                    max_delay=2)
+        delays = [args[0] for args, _ in mock_sleep.call_args_list]
+        self.assertEqual(delays[:3], [0.5, 1, 2])
+        self.assertTrue(all(delay <= 2 for delay in delays))
+        self.assertEqual(len(delays), 5)
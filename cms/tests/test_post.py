@@ -4,7 +4,8 @@ import mock
 from PIL import Image
 Image.init()  # noqa
 
-from cms.models import Post, Category, Localisation
+from cms.models import (
+    Post, Category, Localisation, POST_POSITION_BASE, POST_POSITION_GAP)
 from cms.tests.base import BaseCmsTestCase
 
 from unicore.content import models as eg_models
@@ -348,7 +349,8 @@ class PostTestCase(BaseCmsTestCase):
                 localisation=Localisation._for('afr_ZA'),
             )
             self.assertEquals(Post.objects.all()[0].title, 'New page')
-            self.assertEquals(Post.objects.all()[0].position, 0)
+            self.assertEquals(
+                Post.objects.all()[0].position, POST_POSITION_BASE)
 
             Post.objects.create(
                 title=u'New page 2',
@@ -357,9 +359,51 @@ class PostTestCase(BaseCmsTestCase):
             )
 
         self.assertEquals(Post.objects.all()[0].title, 'New page 2')
-        self.assertEquals(Post.objects.all()[0].position, 0)
+        self.assertEquals(
+            Post.objects.all()[0].position,
+            POST_POSITION_BASE - POST_POSITION_GAP)
         self.assertEquals(Post.objects.all()[1].title, 'New page')
-        self.assertEquals(Post.objects.all()[1].position, 1)
+        self.assertEquals(
+            Post.objects.all()[1].position, POST_POSITION_BASE)
+
+    def test_page_ordering_is_scoped(self):
+        with self.settings(GIT_REPO_PATH=self.workspace.working_dir,
+                           ELASTIC_GIT_INDEX_PREFIX=self.mk_index_prefix()):
+            english = Post.objects.create(
+                title=u'English page',
+                localisation=Localisation._for('eng_GB'))
+            Post.objects.create(
+                title=u'Afrikaans page',
+                localisation=Localisation._for('afr_ZA'))
+
+        # NOTE: creating a post in another localisation doesn't touch
+        #       the positions of the posts in this one.
+        self.assertEquals(
+            Post.objects.get(pk=english.pk).position, POST_POSITION_BASE)
+
+    def test_page_ordering_rebalance(self):
+        with self.settings(GIT_REPO_PATH=self.workspace.working_dir,
+                           ELASTIC_GIT_INDEX_PREFIX=self.mk_index_prefix()):
+            localisation = Localisation._for('afr_ZA')
+            first = Post.objects.create(
+                title=u'First page', localisation=localisation)
+            # as the admin's sortable inline would do
+            Post.objects.filter(pk=first.pk).update(position=0)
+            Post.objects.create(
+                title=u'Second page', localisation=localisation)
+
+            # out of room in front so the scope is rebalanced
+            self.assertEquals(
+                [(post.title, post.position)
+                 for post in Post.objects.all()],
+                [(u'Second page', POST_POSITION_BASE),
+                 (u'First page', POST_POSITION_BASE + POST_POSITION_GAP)])
+
+            first = Post.objects.get(pk=first.pk)
+            [git_first] = self.workspace.S(
+                eg_models.Page).filter(uuid=first.uuid)
+            self.assertEquals(
+                git_first.position, POST_POSITION_BASE + POST_POSITION_GAP)
 
     def test_post_image(self):
         def mocked_thumbor_post_response(url, data, headers):
@@ -553,3 +597,24 @@ class PostTestCase(BaseCmsTestCase):
                 self.workspace.repo.iter_commits('master'))[:2]
             self.assertEqual(m2m_commit.message, "Page updated: sample title")
             self.assertEqual(add_commit.message, "Page created: sample title")
+
+    def test_post_update_without_search_index(self):
+        with self.settings(GIT_REPO_PATH=self.workspace.working_dir,
+                           ELASTIC_GIT_INDEX_PREFIX=self.mk_index_prefix()):
+            post = Post.objects.create(title='sample title')
+            post = Post.objects.get(pk=post.pk)
+
+            # the save path must not depend on the search index
+            self.workspace.im.raw_unindex(
+                eg_models.Page, post.uuid, refresh_index=True)
+            self.assertEquals(self.workspace.S(eg_models.Page).count(), 0)
+
+            post.title = 'changed title'
+            post.save()
+
+            [commit] = list(
+                self.workspace.repo.iter_commits('master', max_count=1))
+            self.assertEqual(commit.message, 'Page updated: changed title')
+            pages = list(self.workspace.sm.iterate(eg_models.Page))
+            self.assertEqual([page.uuid for page in pages], [post.uuid])
+            self.assertEqual(pages[0].title, 'changed title')
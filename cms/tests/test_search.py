@@ -0,0 +1,87 @@
+import mock
+
+from django.contrib import admin
+from django.test.client import RequestFactory
+from django.utils import timezone
+
+from cms import search
+from cms.admin import PostAdmin
+from cms.models import Post, Localisation, PendingChange
+from cms.tests.base import BaseCmsTestCase
+
+
+class TestSearch(BaseCmsTestCase):
+
+    def setUp(self):
+        self.workspace = self.mk_workspace()
+        with self.active_workspace(self.workspace):
+            self.english = Localisation._for('eng_GB')
+            self.french = Localisation._for('fre_FR')
+            self.post1 = Post.objects.create(
+                title='ebola', content='about a virus',
+                localisation=self.english)
+            self.post2 = Post.objects.create(
+                title='malaria', content='ebola is mentioned here',
+                localisation=self.english)
+            self.post3 = Post.objects.create(
+                title='ebola', localisation=self.french)
+            self.post4 = Post.objects.create(
+                title='unrelated', localisation=self.english)
+        self.post1, self.post2, self.post3, self.post4 = (
+            Post.objects.order_by('pk'))
+
+    def test_search_pages(self):
+        with self.active_workspace(self.workspace):
+            uuids = search.search_pages('ebola')
+            self.assertEqual(
+                set(uuids),
+                set([self.post1.uuid, self.post2.uuid, self.post3.uuid]))
+            # NOTE: title matches are boosted
+            self.assertEqual(uuids[-1], self.post2.uuid)
+
+            self.assertEqual(
+                search.search_pages('ebola', locale='fre_FR'),
+                [self.post3.uuid])
+
+    @mock.patch('cms.indexing.index_lag')
+    def test_search_pages_stale_index(self, mock_index_lag):
+        with self.active_workspace(self.workspace):
+            mock_index_lag.return_value = 5
+            self.assertEqual(search.search_pages('ebola'), None)
+            mock_index_lag.return_value = None
+            self.assertEqual(search.search_pages('ebola'), None)
+
+    def test_search_pages_pending_changes(self):
+        with self.active_workspace(self.workspace):
+            with mock.patch('cms.tasks.publish_pending_changes.apply_async'):
+                Post.objects.create(title='ebola', localisation=self.english)
+            self.assertEqual(search.search_pages('ebola'), None)
+
+            # NOTE: changes that failed for good don't hold up searching
+            PendingChange.objects.update(failed_at=timezone.now())
+            self.assertEqual(len(search.search_pages('ebola')), 3)
+
+    def test_admin_search(self):
+        post_admin = PostAdmin(Post, admin.site)
+        request = RequestFactory().get('/', {
+            'q': 'ebola',
+            'localisation__id__exact': self.english.pk,
+        })
+        with self.active_workspace(self.workspace):
+            with mock.patch('cms.search.search_pages',
+                            wraps=search.search_pages) as mock_search:
+                queryset, use_distinct = post_admin.get_search_results(
+                    request, post_admin.get_queryset(request), 'ebola')
+                results = list(queryset)
+        mock_search.assert_called_with('ebola', locale='eng_GB')
+        self.assertFalse(use_distinct)
+        self.assertEqual(results, [self.post1, self.post2])
+
+    @mock.patch('cms.search.search_pages')
+    def test_admin_search_falls_back_to_db(self, mock_search):
+        mock_search.return_value = None
+        post_admin = PostAdmin(Post, admin.site)
+        request = RequestFactory().get('/', {'q': 'virus'})
+        queryset, _ = post_admin.get_search_results(
+            request, Post.objects.all(), 'virus')
+        self.assertEqual(list(queryset), [self.post1])
@@ -0,0 +1,34 @@
+from cms.sources import iterate
+from cms.tests.base import BaseCmsTestCase
+
+from unicore.content import models as eg_models
+
+
+class TestIterate(BaseCmsTestCase):
+
+    def setUp(self):
+        self.workspace = self.mk_workspace()
+
+    def test_iterate(self):
+        pages = self.create_pages(self.workspace, count=3)
+        self.create_pages(self.workspace, count=2, locale='spa_ES')
+        self.create_categories(self.workspace)
+
+        self.assertEqual(
+            len(list(iterate(self.workspace, eg_models.Page))), 5)
+        self.assertEqual(
+            set(page.uuid for page in iterate(
+                self.workspace, eg_models.Page, language='eng_UK')),
+            set(page.uuid for page in pages))
+        self.assertEqual(
+            len(list(iterate(self.workspace, eg_models.Category))), 2)
+
+    def test_iterate_without_index(self):
+        self.create_localisation(self.workspace, locale='spa_ES')
+        self.workspace.im.destroy_index(
+            self.workspace.repo.active_branch.name)
+        [localisation] = iterate(self.workspace, eg_models.Localisation)
+        self.assertEqual(localisation.locale, 'spa_ES')
+
+    def test_iterate_nothing_stored(self):
+        self.assertEqual(list(iterate(self.workspace, eg_models.Page)), [])
@@ -1,6 +1,13 @@
+import mock
+
+from git import PushInfo
+
+from cms import utils
+from cms.models import PushStatus
 from cms.tasks import push_to_git
 from cms.tests.base import BaseCmsTestCase
 from django.conf import settings
+from django.core.cache import cache
 
 from unicore.content.models import Page
 
@@ -45,6 +52,33 @@ class TaskTest(BaseCmsTestCase):
                         settings.ELASTIC_GIT_INDEX_PREFIX,
                         settings.ELASTICSEARCH_HOST)
 
+            status = PushStatus.objects.get(repo_path=settings.GIT_REPO_PATH)
+            self.assertEqual(status.status, PushStatus.PUSHED)
+            self.assertEqual(
+                status.commit, self.local_workspace.repo.head.commit.hexsha)
+
+            # NOTE: nothing new to push the second time around
+            with mock.patch('git.remote.Remote.push') as mock_push:
+                push_to_git(settings.GIT_REPO_PATH,
+                            settings.ELASTIC_GIT_INDEX_PREFIX,
+                            settings.ELASTICSEARCH_HOST)
+            self.assertFalse(mock_push.called)
+            status = PushStatus.objects.get(repo_path=settings.GIT_REPO_PATH)
+            self.assertEqual(status.status, PushStatus.UP_TO_DATE)
+
+            # NOTE: a rejected push doesn't raise
+            self.create_pages(self.local_workspace, count=1)
+            rejected = mock.Mock(
+                flags=PushInfo.REJECTED, summary='[rejected] (non-ff)\n')
+            with mock.patch('git.remote.Remote.push') as mock_push:
+                mock_push.return_value = [rejected]
+                push_to_git(settings.GIT_REPO_PATH,
+                            settings.ELASTIC_GIT_INDEX_PREFIX,
+                            settings.ELASTICSEARCH_HOST)
+            status = PushStatus.objects.get(repo_path=settings.GIT_REPO_PATH)
+            self.assertEqual(status.status, PushStatus.FAILED)
+            self.assertEqual(status.error, '[rejected] (non-ff)')
+
         # NOTE: switching back to master on the remote because the changes
         #       should have been pushed and we are checking for their
         #       existence
@@ -54,3 +88,60 @@ class TaskTest(BaseCmsTestCase):
         self.assertEqual(self.remote_workspace.S(Page).count(), 2)
         self.remote_workspace.reindex(Page)
         self.assertEqual(self.remote_workspace.S(Page).count(), 4)
+
+
+class PushCoalescingTest(BaseCmsTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.args = (
+            settings.GIT_REPO_PATH, settings.ELASTIC_GIT_INDEX_PREFIX,
+            settings.ELASTICSEARCH_HOST)
+
+    def tearDown(self):
+        cache.clear()
+
+    @mock.patch('cms.tasks.push_to_git.apply_async')
+    def test_schedule_push_coalesces(self, mock_apply_async):
+        self.assertTrue(utils.schedule_push(*self.args))
+        self.assertFalse(utils.schedule_push(*self.args))
+        self.assertFalse(utils.schedule_push(*self.args))
+        self.assertEqual(mock_apply_async.call_count, 1)
+        _, kwargs = mock_apply_async.call_args
+        self.assertEqual(kwargs['countdown'], settings.PUSH_DEBOUNCE)
+        self.assertEqual(kwargs['kwargs'], {
+            'repo_path': settings.GIT_REPO_PATH,
+            'index_prefix': settings.ELASTIC_GIT_INDEX_PREFIX,
+            'es_host': settings.ELASTICSEARCH_HOST,
+        })
+
+    @mock.patch('cms.utils.push_to_remote')
+    def test_push_to_git_single_flight(self, mock_push_to_remote):
+        cache.add(
+            utils.push_key(utils.PUSH_LOCK_KEY, settings.GIT_REPO_PATH), True)
+        self.assertEqual(utils.push_to_git(*self.args), None)
+        self.assertFalse(mock_push_to_remote.called)
+
+    @mock.patch('cms.batching.publish_pending_changes')
+    @mock.patch('cms.utils.push_to_remote')
+    def test_push_to_git_publishes_pending_changes(
+            self, mock_push_to_remote, mock_publish):
+        mock_push_to_remote.side_effect = (
+            lambda *args: self.assertTrue(mock_publish.called))
+        utils.push_to_git(*self.args)
+        mock_push_to_remote.assert_called_once_with(*self.args)
+
+    @mock.patch('cms.tasks.push_to_git.apply_async')
+    @mock.patch('cms.utils.push_to_remote')
+    def test_push_to_git_requested_while_running(
+            self, mock_push_to_remote, mock_apply_async):
+        # NOTE: a push is requested while this one is running
+        mock_push_to_remote.side_effect = (
+            lambda *args: utils.schedule_push(*args))
+        utils.push_to_git(*self.args)
+        mock_push_to_remote.assert_called_once_with(*self.args)
+        self.assertEqual(mock_apply_async.call_count, 1)
+
+        mock_push_to_remote.side_effect = None
+        utils.push_to_git(*self.args)
+        self.assertEqual(mock_apply_async.call_count, 1)
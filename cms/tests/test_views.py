@@ -1,7 +1,13 @@
+import json
+from datetime import timedelta
+
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.test.client import Client
+from django.utils import timezone
 
+from cms import importing, tasks
+from cms.models import ImportJob
 from cms.tests.base import BaseCmsTestCase
 
 from unicore.content import models as eg_models
@@ -66,5 +72,78 @@ class TestCustomAdminViews(BaseCmsTestCase):
             self.assertEquals(
                 self.workspace.S(eg_models.Page).everything().count, 4)
 
-            # ensure the workspace is destroyed after importing
+            # ensure the clone is kept but its index is destroyed
+            # after importing
+            self.assertTrue(self.remote_workspace.sm.storage_exists())
             self.assertFalse(self.remote_workspace.exists())
+
+            [job] = ImportJob.objects.all()
+            self.assertEqual(resp.status_code, 202)
+            self.assertEqual(json.loads(resp.content)['id'], job.pk)
+            self.assertEqual(job.status, ImportJob.DONE)
+            self.assertEqual(job.progress, 1)
+
+            resp = self.client.get(
+                reverse('import_job_status', kwargs={'pk': job.pk}))
+            self.assertEqual(json.loads(resp.content), job.to_dict())
+
+    def test_import_job_cancel(self):
+        job = ImportJob(
+            operation=ImportJob.IMPORT,
+            index_prefix=self.remote_workspace.index_prefix)
+        job.set_locales(['spa_ES'])
+        job.save()
+
+        resp = self.client.post(
+            reverse('import_job_cancel', kwargs={'pk': job.pk}))
+        self.assertEqual(json.loads(resp.content)['status'], 'cancelled')
+
+        # a cancelled job never runs
+        tasks.run_import_job.delay(job.pk)
+        job = ImportJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, ImportJob.CANCELLED)
+        self.assertEqual(job.progress, 0)
+        self.assertTrue(self.remote_workspace.exists())
+
+    def test_import_job_limit(self):
+        ImportJob.objects.create(
+            operation=ImportJob.CLONE, index_prefix='foo',
+            status=ImportJob.RUNNING)
+        job = ImportJob.objects.create(
+            operation=ImportJob.CLONE, index_prefix='bar')
+        with self.settings(IMPORT_MAX_CONCURRENT_JOBS=1):
+            with self.assertRaises(importing.ImportLimitReached):
+                importing.start_job(job.pk)
+        with self.settings(IMPORT_MAX_CONCURRENT_JOBS=2):
+            self.assertEqual(importing.start_job(job.pk), job)
+        self.assertEqual(
+            ImportJob.objects.get(pk=job.pk).status, ImportJob.RUNNING)
+
+    def test_import_job_limit_ignores_stale_jobs(self):
+        stale = ImportJob.objects.create(
+            operation=ImportJob.CLONE, index_prefix='foo',
+            status=ImportJob.RUNNING)
+        ImportJob.objects.filter(pk=stale.pk).update(
+            modified_at=timezone.now() - timedelta(hours=2))
+        job = ImportJob.objects.create(
+            operation=ImportJob.CLONE, index_prefix='bar')
+        with self.settings(
+                IMPORT_MAX_CONCURRENT_JOBS=1, IMPORT_JOB_STALE_TIMEOUT=3600):
+            self.assertEqual(importing.start_job(job.pk), job)
+        stale = ImportJob.objects.get(pk=stale.pk)
+        self.assertEqual(stale.status, ImportJob.FAILED)
+        self.assertTrue(stale.error)
+
+    def test_import_job_gives_up_waiting(self):
+        ImportJob.objects.create(
+            operation=ImportJob.CLONE, index_prefix='foo',
+            status=ImportJob.RUNNING)
+        job = ImportJob.objects.create(
+            operation=ImportJob.CLONE, index_prefix='bar')
+        with self.settings(IMPORT_MAX_CONCURRENT_JOBS=1):
+            tasks.run_import_job.apply(
+                args=(job.pk,),
+                retries=tasks.run_import_job.max_retries)
+        job = ImportJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertTrue(job.error)
@@ -0,0 +1,75 @@
+import gc
+import threading
+import weakref
+
+import mock
+
+from cms.tests.base import BaseCmsTestCase
+from cms.workspaces import WorkspacePool, get_workspace, pool
+
+
+class TestWorkspacePool(BaseCmsTestCase):
+
+    def setUp(self):
+        self.workspace = self.mk_workspace()
+        self.pool = WorkspacePool()
+        self.es_urls = self.workspace.es_settings['urls']
+
+    def get(self, pool=None):
+        return (pool or self.pool).get(
+            self.workspace.working_dir, self.workspace.index_prefix,
+            self.es_urls)
+
+    def test_reuses_workspace(self):
+        workspace = self.get()
+        self.assertIs(workspace, self.get())
+        self.assertEqual(workspace.working_dir, self.workspace.working_dir)
+        self.assertEqual(workspace.index_prefix, self.workspace.index_prefix)
+
+    def test_workspace_per_thread(self):
+        workspace = self.get()
+        workspaces = []
+        thread = threading.Thread(
+            target=lambda: workspaces.append(weakref.ref(self.get())))
+        thread.start()
+        thread.join()
+
+        [thread_workspace] = workspaces
+        # NOTE: the thread's workspace is dropped when the thread exits
+        gc.collect()
+        self.assertIs(thread_workspace(), None)
+        self.assertIs(workspace, self.get())
+
+    def test_invalidate(self):
+        workspace = self.get()
+        self.pool.invalidate(self.workspace.working_dir)
+        self.assertIsNot(workspace, self.get())
+
+    def test_invalidate_other_prefix(self):
+        workspace = self.get()
+        self.pool.invalidate(self.workspace.working_dir, index_prefix='foo')
+        self.assertIs(workspace, self.get())
+
+    def test_clear(self):
+        workspace = self.get()
+        self.pool.clear()
+        self.assertIsNot(workspace, self.get())
+
+    def test_health_check(self):
+        unchecked_pool = WorkspacePool(check_interval=0)
+        workspace = self.get(unchecked_pool)
+        self.assertTrue(unchecked_pool.is_healthy(workspace))
+        self.assertIs(workspace, self.get(unchecked_pool))
+
+        with mock.patch.object(workspace.im.es, 'ping') as mock_ping:
+            mock_ping.return_value = False
+            self.assertFalse(unchecked_pool.is_healthy(workspace))
+            self.assertIsNot(workspace, self.get(unchecked_pool))
+
+    def test_get_workspace_defaults(self):
+        with self.active_workspace(self.workspace):
+            workspace = get_workspace()
+            self.assertIs(workspace, get_workspace())
+            self.assertEqual(
+                workspace.working_dir, self.workspace.working_dir)
+        pool.invalidate(self.workspace.working_dir)
@@ -1,23 +1,121 @@
+from hashlib import md5
 from urlparse import urlparse
 
-from cms import mappings
+from cms import batching, indexing, mappings
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import force_bytes
 from elasticgit import EG
+from git import PushInfo
+
+from cms.workspaces import get_workspace, pool
 
 from unicore.content.models import (
     Category, Page, Localisation as EGLocalisation)
 
 
+CUSTOM_MAPPINGS = (
+    (Category, mappings.CategoryMapping),
+    (Page, mappings.PageMapping),
+    (EGLocalisation, mappings.LocalisationMapping),
+)
+
+PUSH_LOCK_KEY = 'cms:push-lock:%s'
+PUSH_SCHEDULED_KEY = 'cms:push-scheduled:%s'
+PUSH_REQUESTED_KEY = 'cms:push-requested:%s'
+
+PUSH_FAILED_FLAGS = (
+    PushInfo.ERROR | PushInfo.REJECTED | PushInfo.REMOTE_REJECTED)
+
+
+def push_key(key, repo_path):
+    """
+    Return the shared cache key for a repository, repository paths may
+    be too long or contain characters memcached doesn't allow in keys.
+    """
+    return key % (md5(force_bytes(repo_path)).hexdigest(),)
+
+
+def schedule_push(repo_path, index_prefix, es_host):
+    """
+    Request a push of the repository to its remote. Requests are
+    coalesced, a burst of them within ``settings.PUSH_DEBOUNCE`` seconds
+    results in a single push.
+
+    :returns: ``True`` if a push was scheduled, ``False`` if the request
+        was folded into one that is already scheduled or running.
+    """
+    from cms import tasks
+
+    debounce = getattr(settings, 'PUSH_DEBOUNCE', 5)
+    cache.set(push_key(PUSH_REQUESTED_KEY, repo_path), True,
+              getattr(settings, 'PUSH_LOCK_TIMEOUT', 300))
+    if not cache.add(
+            push_key(PUSH_SCHEDULED_KEY, repo_path), True, debounce + 60):
+        return False
+    tasks.push_to_git.apply_async(kwargs={
+        'repo_path': repo_path,
+        'index_prefix': index_prefix,
+        'es_host': es_host,
+    }, countdown=debounce)
+    return True
+
+
 def push_to_git(repo_path, index_prefix, es_host):
-    workspace = EG.workspace(repo_path,
-                             index_prefix=index_prefix,
-                             es={'urls': [es_host]})
-    if workspace.repo.remotes:
-        repo = workspace.repo
+    """
+    Push the repository to its remote, only one push runs per repository
+    at a time. Requests made while a push is running are pushed straight
+    after it. Pending changes are published first so the push includes
+    every change made before it was requested.
+
+    :returns: the :py:class:`cms.models.PushStatus` recorded, or ``None``
+        if there was nothing to push to or another push was running.
+    """
+    cache.delete(push_key(PUSH_SCHEDULED_KEY, repo_path))
+    lock_key = push_key(PUSH_LOCK_KEY, repo_path)
+    if not cache.add(
+            lock_key, True, getattr(settings, 'PUSH_LOCK_TIMEOUT', 300)):
+        # NOTE: the request is left for the running push to pick up.
+        return None
+    try:
+        cache.delete(push_key(PUSH_REQUESTED_KEY, repo_path))
+        batching.publish_pending_changes()
+        return push_to_remote(repo_path, index_prefix, es_host)
+    finally:
+        cache.delete(lock_key)
+        if cache.get(push_key(PUSH_REQUESTED_KEY, repo_path)):
+            schedule_push(repo_path, index_prefix, es_host)
+
+
+def push_to_remote(repo_path, index_prefix, es_host):
+    from cms.models import PushStatus
+
+    workspace = get_workspace(repo_path, index_prefix, es_host)
+    repo = workspace.repo
+    if not repo.remotes:
+        return None
+
+    head = repo.head.commit.hexsha
+    try:
         remote = repo.remote()
         remote.fetch()
         remote_master = remote.refs.master
-        remote.push(remote_master.remote_head)
+        ahead = int(repo.git.rev_list('--count', '%s..%s' % (
+            remote_master.commit.hexsha, remote_master.remote_head)))
+        if not ahead:
+            return PushStatus.record(repo_path, PushStatus.UP_TO_DATE, head)
+        push_infos = remote.push(remote_master.remote_head)
+    except Exception as e:
+        PushStatus.record(repo_path, PushStatus.FAILED, head, str(e))
+        raise
+    # NOTE: GitPython doesn't raise when the remote rejects the push.
+    failed = [info for info in push_infos if info.flags & PUSH_FAILED_FLAGS]
+    if failed or not push_infos:
+        return PushStatus.record(
+            repo_path, PushStatus.FAILED, head,
+            '; '.join(info.summary.strip() for info in failed) or
+            'The remote reported nothing pushed.')
+    return PushStatus.record(repo_path, PushStatus.PUSHED, head)
 
 
 def parse_repo_name(repo_url):
@@ -32,6 +130,11 @@ def parse_repo_name(repo_url):
 
 
 def setup_workspace(repo_path, index_prefix, es={}):
+    """
+    Set up a workspace with a fresh, empty index. Any existing index is
+    destroyed, rebuild a live index with
+    :py:func:`cms.indexing.rebuild_index` instead.
+    """
     es_default = {'urls': [settings.ELASTICSEARCH_HOST]}
     es_default.update(es)
     workspace = EG.workspace(
@@ -40,15 +143,30 @@ def setup_workspace(repo_path, index_prefix, es={}):
     branch = workspace.sm.repo.active_branch
     if workspace.im.index_exists(branch.name):
         workspace.im.destroy_index(branch.name)
+    # NOTE: pooled workspaces for this repository point at the index
+    #       we've just destroyed, make sure they're rebuilt.
+    pool.invalidate(repo_path)
 
     workspace.setup('ubuntu', 'dev@praekeltfoundation.org')
+    indexing.apply_refresh_policy(workspace)
 
-    while not workspace.index_ready():
-        pass
+    indexing.wait_for_index(workspace)
 
-    workspace.setup_custom_mapping(Category, mappings.CategoryMapping)
-    workspace.setup_custom_mapping(Page, mappings.PageMapping)
-    workspace.setup_custom_mapping(EGLocalisation,
-                                   mappings.LocalisationMapping)
+    for model_class, mapping in CUSTOM_MAPPINGS:
+        workspace.setup_custom_mapping(model_class, mapping)
 
     return workspace
+
+
+def chunked(iterable, size):
+    """
+    Yield lists of at most ``size`` items from ``iterable``.
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,74 @@
+from django import forms
+from django.utils.html import format_html, format_html_join
+from django.utils.encoding import force_text
+
+
+class AutocompleteMixin(object):
+    """
+    Renders only the selected objects, others are looked up as they're
+    typed through ``url``, so rendering doesn't depend on the number of
+    objects to choose from.
+    """
+
+    class Media:
+        js = ('js/autocomplete.js',)
+
+    def __init__(self, url, attrs=None):
+        super(AutocompleteMixin, self).__init__(attrs=attrs)
+        self.url = url
+
+    def get_selected(self, values):
+        """
+        Return ``(pk, label)`` pairs for the selected objects, in the
+        order they were selected in.
+        """
+        values = [force_text(value) for value in values if value]
+        if not values:
+            return []
+        iterator = self.choices
+        queryset = iterator.queryset.filter(pk__in=values)
+        if hasattr(iterator.queryset.model, 'localisation'):
+            queryset = queryset.select_related('localisation')
+        objects = dict((force_text(obj.pk), obj) for obj in queryset)
+        return [
+            (pk, iterator.field.label_from_instance(objects[pk]))
+            for pk in values if pk in objects]
+
+
+class AutocompleteSelect(AutocompleteMixin, forms.Select):
+
+    def render(self, name, value, attrs=None, choices=()):
+        attrs = self.build_attrs(attrs)
+        selected = self.get_selected([value] if value else [])
+        pk, label = selected[0] if selected else ('', '')
+        return format_html(
+            '<div class="cms-autocomplete-select">'
+            '<input type="hidden" name="{0}" id="{1}" value="{2}" />'
+            '<input type="text" class="cms-autocomplete vTextField" '
+            'data-url="{3}" value="{4}" />'
+            ' <a href="#" class="cms-autocomplete-clear">&times;</a>'
+            '</div>',
+            name, attrs.get('id', ''), pk, self.url, label)
+
+
+class AutocompleteSelectMultiple(AutocompleteMixin, forms.SelectMultiple):
+    """
+    The selected objects are listed in order and can be reordered by
+    dragging them, their order is submitted along with them.
+    """
+
+    def render(self, name, value, attrs=None, choices=()):
+        attrs = self.build_attrs(attrs)
+        items = format_html_join(
+            '', '<li><input type="hidden" name="{0}" value="{1}" />{2} '
+            '<a href="#" class="cms-autocomplete-remove">&times;</a></li>',
+            ((name, pk, label)
+             for pk, label in self.get_selected(value or [])))
+        return format_html(
+            '<div class="cms-autocomplete-select-multiple" id="{0}" '
+            'data-name="{1}">'
+            '<ul class="cms-autocomplete-selected">{2}</ul>'
+            '<input type="text" class="cms-autocomplete vTextField" '
+            'data-url="{3}" />'
+            '</div>',
+            attrs.get('id', ''), name, items, self.url)
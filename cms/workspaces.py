@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from elasticgit import EG
+
+
+log = logging.getLogger(__name__)
+
+
+class WorkspacePool(object):
+    """
+    A process wide registry of warm :py:class:`elasticgit.workspace.Workspace`
+    instances, keyed by repository path, index prefix & Elasticsearch urls.
+
+    GitPython's ``Repo`` objects are not safe to share between threads so
+    every thread gets its own workspace for a given key, held in a
+    thread local so that it's dropped when the thread exits. All of them
+    are dropped when the key is invalidated.
+
+    :param int check_interval:
+        The number of seconds a workspace is trusted before it is health
+        checked again on checkout.
+    """
+
+    def __init__(self, check_interval=60):
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.workspaces = {}
+
+    def make_key(self, repo_path, index_prefix, es_urls):
+        return (repo_path, index_prefix, tuple(es_urls))
+
+    def get(self, repo_path, index_prefix, es_urls):
+        """
+        Return a warm workspace for the given repository & index,
+        creating one if needed or if the cached one is no longer healthy.
+
+        :param str repo_path:
+            The path to the Git repository.
+        :param str index_prefix:
+            The index prefix to use for the Elasticsearch indices.
+        :param list es_urls:
+            The urls of the Elasticsearch hosts.
+        :returns: :py:class:`elasticgit.workspace.Workspace`
+        """
+        key = self.make_key(repo_path, index_prefix, es_urls)
+        with self.lock:
+            local = self.workspaces.get(key)
+            if local is None:
+                local = self.workspaces[key] = threading.local()
+        entry = getattr(local, 'entry', None)
+
+        if entry is not None:
+            workspace, checked_at = entry
+            if time.time() - checked_at < self.check_interval:
+                return workspace
+            if self.is_healthy(workspace):
+                local.entry = (workspace, time.time())
+                return workspace
+            log.warning('Discarding unhealthy workspace for %s.', repo_path)
+
+        workspace = EG.workspace(
+            repo_path, index_prefix=index_prefix, es={'urls': list(es_urls)})
+        local.entry = (workspace, time.time())
+        return workspace
+
+    def is_healthy(self, workspace):
+        """
+        Check that the workspace's repository still exists on disk and
+        that its Elasticsearch client can still reach the cluster.
+
+        :param elasticgit.workspace.Workspace workspace:
+        :returns: bool
+        """
+        if not EG.is_repo(workspace.working_dir):
+            return False
+        try:
+            return workspace.im.es.ping()
+        except Exception:  # pragma: no cover
+            log.warning('Elasticsearch ping failed.', exc_info=True)
+            return False
+
+    def invalidate(self, repo_path, index_prefix=None, es_urls=None):
+        """
+        Drop the cached workspaces for a repository path. If the index
+        prefix and Elasticsearch urls are given only the matching key
+        is dropped, otherwise every workspace for the path is.
+
+        :param str repo_path:
+        :param str index_prefix:
+        :param list es_urls:
+        """
+        with self.lock:
+            for key in list(self.workspaces):
+                if key[0] != repo_path:
+                    continue
+                if index_prefix is not None and key[1] != index_prefix:
+                    continue
+                if es_urls is not None and key[2] != tuple(es_urls):
+                    continue
+                del self.workspaces[key]
+
+    def clear(self):
+        """
+        Drop every cached workspace.
+        """
+        with self.lock:
+            self.workspaces.clear()
+
+    def warm(self):
+        """
+        Pre-warm the workspace for the configured content repository.
+        Failures are logged and swallowed so a worker can still boot
+        while Git or Elasticsearch are unavailable.
+        """
+        try:
+            return get_workspace()
+        except Exception:  # pragma: no cover
+            log.warning('Unable to pre-warm workspace.', exc_info=True)
+
+
+pool = WorkspacePool(
+    check_interval=getattr(settings, 'WORKSPACE_POOL_CHECK_INTERVAL', 60))
+
+
+def get_workspace(repo_path=None, index_prefix=None, es_host=None):
+    """
+    Return a pooled workspace, defaulting to the content repository
+    configured in settings.
+    """
+    if repo_path is None:
+        repo_path = settings.GIT_REPO_PATH
+    if index_prefix is None:
+        index_prefix = settings.ELASTIC_GIT_INDEX_PREFIX
+    if es_host is None:
+        es_host = settings.ELASTICSEARCH_HOST
+    return pool.get(repo_path, index_prefix, [es_host])
@@ -2,6 +2,7 @@
 
 import os
 import pwd
+from datetime import timedelta
 
 # NOTE: crazy monkey patching because of bugs in GitPython
 os.getlogin = lambda: pwd.getpwuid(os.getuid())[0]
@@ -38,6 +39,17 @@ DATABASES = {
     }
 }
 
+# NOTE: the cache must be shared by the web & Celery worker processes, it
+#       holds the push locks, metrics & cached content repositories that
+#       are invalidated across processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+        'KEY_PREFIX': 'unicore-cms',
+    }
+}
+
 # Hosts/domain names that are valid for this site; required if DEBUG is False
 # See https://docs.djangoproject.com/en/1.5/ref/settings/#allowed-hosts
 ALLOWED_HOSTS = ['*']
@@ -117,6 +129,7 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'cms.middleware.ContentBatchMiddleware',
 )
 
 AUTHENTICATION_BACKENDS = (
@@ -221,6 +234,15 @@ CELERY_ALWAYS_EAGER = DEBUG
 # Tell Celery where to find the tasks
 CELERY_IMPORTS = ('cms.tasks',)
 
+# Drain any content changes that were recorded without scheduling a
+# publish, for example when a worker was unavailable.
+CELERYBEAT_SCHEDULE = {
+    'publish-pending-changes': {
+        'task': 'cms.tasks.publish_pending_changes',
+        'schedule': timedelta(seconds=30),
+    },
+}
+
 # Defer email sending to Celery, except if we're in debug mode,
 # then just print the emails to stdout for debugging.
 EMAIL_BACKEND = 'djcelery_email.backends.CeleryEmailBackend'
@@ -271,11 +293,64 @@ GRAPPELLI_ADMIN_TITLE = 'Universal Core'
 GIT_REPO_URL = None
 GIT_REPO_PATH = abspath('cmsrepo')
 IMPORT_CLONE_REPO_PATH = abspath('import_repos')
+# clones are kept between imports & updated with shallow fetches, the
+# least recently used ones are evicted once there are more than
+# IMPORT_CLONE_CACHE_SIZE of them or they take up more than
+# IMPORT_CLONE_CACHE_BYTES (no limit if None)
+IMPORT_CLONE_SHALLOW = True
+IMPORT_CLONE_CACHE_SIZE = 10
+IMPORT_CLONE_CACHE_BYTES = None
 DEFAULT_TARGET_NAME = 'Default Target'
 ELASTIC_GIT_INDEX_PREFIX = None
 ELASTICSEARCH_HOST = 'http://localhost:9200'
+# seconds to wait for a new index to become ready before giving up
+ELASTICSEARCH_READY_TIMEOUT = 30
+# seconds a pooled workspace is trusted before it is health checked again
+WORKSPACE_POOL_CHECK_INTERVAL = 60
+# seconds the unpublished changes count is cached for, it's invalidated as
+# soon as it changes
+REPO_STATUS_CACHE_TIMEOUT = 3600
+# seconds the content repositories & their publishing targets are cached
+# for, they're invalidated in the shared cache as soon as they change
+CONTENT_REPOSITORIES_CACHE_TIMEOUT = 60
+# maximum number of pending content changes written in a single commit
+PUBLISH_BATCH_SIZE = 500
+# seconds to wait before draining changes recorded inside of a transaction,
+# giving it time to commit
+PUBLISH_COMMIT_DELAY = 5
+# a change that fails to publish is retried after PUBLISH_RETRY_DELAY
+# seconds, doubling every time, until it has failed PUBLISH_MAX_ATTEMPTS
+# times & is left for an administrator
+PUBLISH_RETRY_DELAY = 30
+PUBLISH_MAX_ATTEMPTS = 5
+# how the search index is refreshed after background indexing, one of
+# 'none', 'interval' (every ELASTIC_GIT_REFRESH_INTERVAL) or 'wait_for'
+ELASTIC_GIT_REFRESH_POLICY = 'interval'
+ELASTIC_GIT_REFRESH_INTERVAL = '1s'
+# the post admin searches the pages index as long as it lags no more than
+# ADMIN_SEARCH_MAX_INDEX_LAG commits behind Git, the database is searched
+# otherwise
+ADMIN_SEARCH_MAX_INDEX_LAG = 0
+ADMIN_SEARCH_MAX_RESULTS = 500
+# changelist filter options are cached for ADMIN_FILTER_CACHE_TIMEOUT
+# seconds or until the content changes, filters with more options than
+# ADMIN_FILTER_AUTOCOMPLETE_THRESHOLD are searched instead of listed
+ADMIN_FILTER_CACHE_TIMEOUT = 300
+ADMIN_FILTER_AUTOCOMPLETE_THRESHOLD = 100
+
+# the number of posts & categories served per page to the autocomplete
+# widgets of the post form
+ADMIN_AUTOCOMPLETE_PAGE_SIZE = 20
+# a translation's source is rendered once per modification and cached for
+# ADMIN_SOURCE_CACHE_TIMEOUT seconds
+ADMIN_SOURCE_CACHE_TIMEOUT = 3600
 
 # used when pushing to Github
+# push requests within PUSH_DEBOUNCE seconds of each other are coalesced
+# into a single push, PUSH_LOCK_TIMEOUT bounds how long a push may hold
+# the repository's push lock
+PUSH_DEBOUNCE = 5
+PUSH_LOCK_TIMEOUT = 300
 SSH_PUBKEY_PATH = None
 SSH_PRIVKEY_PATH = None
 SSH_PASSPHRASE = ''
@@ -285,6 +360,23 @@ THUMBOR_SERVER = 'http://localhost:8888'
 THUMBOR_SECURITY_KEY = 'MY_SECURE_KEY'
 THUMBOR_RW_SERVER = 'http://localhost:8888'
 
+# concurrent image downloads when importing content
+IMAGE_FETCH_WORKERS = 8
+IMAGE_FETCH_PER_HOST = 4
+# seconds, and the number of retries with backoff for failed downloads
+IMAGE_FETCH_TIMEOUT = 30
+IMAGE_FETCH_RETRIES = 3
+
+# the maximum number of GitHub imports running at the same time, others
+# wait & are retried every IMPORT_JOB_RETRY_DELAY seconds, up to
+# IMPORT_JOB_MAX_RETRIES times before they fail
+IMPORT_MAX_CONCURRENT_JOBS = 2
+IMPORT_JOB_RETRY_DELAY = 10
+IMPORT_JOB_MAX_RETRIES = 360
+# seconds a running import can go without progress before it's
+# considered dead & no longer counts towards the limit
+IMPORT_JOB_STALE_TIMEOUT = 3600
+
 try:
     from local_settings import *
 except ImportError:
@@ -15,6 +15,12 @@ urlpatterns = patterns(
     url(
         r'^github/import/do/$',
         'cms.views.import_repo', name='import_repo'),
+    url(
+        r'^github/import/jobs/(?P<pk>\d+)/$',
+        'cms.views.import_job_status', name='import_job_status'),
+    url(
+        r'^github/import/jobs/(?P<pk>\d+)/cancel/$',
+        'cms.views.import_job_cancel', name='import_job_cancel'),
     url(r'^admin/', RedirectView.as_view(url='/')),
     url(r'^login/$', 'django_cas_ng.views.login'),
     url(r'^logout/$', 'django_cas_ng.views.logout'),
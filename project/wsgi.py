@@ -27,6 +27,11 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+# Pre-warm the pooled workspace so the first request doesn't pay for
+# opening the Git repository & the Elasticsearch connection.
+from cms.workspaces import pool
+pool.warm()
+
 # Apply WSGI middleware here.
 # from helloworld.wsgi import HelloWorldApplication
 # application = HelloWorldApplication(application)
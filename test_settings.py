@@ -11,6 +11,13 @@ DATABASES = {
     }
 }
 
+# NOTE: tests run in a single process with Celery tasks run eagerly.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 DEBUG = True
 
 GIT_REPO_URL = None
@@ -18,6 +25,7 @@ GIT_REPO_PATH = abspath('cmsrepo_test')
 CELERY_ALWAYS_EAGER = DEBUG
 
 ELASTIC_GIT_INDEX_PREFIX = ''
+ELASTIC_GIT_REFRESH_POLICY = 'wait_for'
 
 THUMBOR_SERVER = 'http://localhost:8888'
 THUMBOR_SECURITY_KEY = 'MY_SECURE_KEY'